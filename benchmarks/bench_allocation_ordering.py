@@ -0,0 +1,96 @@
+import random
+import timeit
+from datetime import date, timedelta
+
+from src.allocation.domain import model
+
+"""
+10k 개의 batch 를 가진 SKU 에 대해 라인을 반복 할당할 때의 비용을 비교한다.
+- legacy : 기존 구현처럼 sorted(batches) 로 Batch.__gt__ 를 호출해 매번 정렬
+- allocate : model.allocate (eta_order 키로 매번 정렬)
+- product : model.Product.allocate (정렬 결과를 캐싱). 같은 Product 를 계속 쓰는 경우(메모리 저장소)에만 해당한다.
+- unsorted / loaded : 요청마다 Product 를 새로 만드는 경우(SQL 저장소). unsorted 는 매번 정렬하고,
+  loaded 는 ORM 처럼 할당 순서로 로딩된 batches 를 받아 정렬하지 않는다.
+
+    python -m benchmarks.bench_allocation_ordering
+"""
+
+BATCHES = 10_000
+LINES = 200
+SKU = "BENCH-SKU"
+
+
+def make_batches() -> list[model.Batch]:
+    rng = random.Random(42)
+    today = date.today()
+    return [
+        model.Batch(
+            f"batch-{i}",
+            SKU,
+            100,
+            eta=None
+            if rng.random() < 0.1
+            else today + timedelta(days=rng.randrange(365)),
+        )
+        for i in range(BATCHES)
+    ]
+
+
+def make_lines() -> list[model.OrderLine]:
+    rng = random.Random(7)
+    return [
+        model.OrderLine(f"order-{i}", SKU, rng.randint(1, 10)) for i in range(LINES)
+    ]
+
+
+def legacy_allocate(line: model.OrderLine, batches: list[model.Batch]) -> str:
+    batch = next(b for b in sorted(batches) if b.can_allocate(line))
+    batch.allocate(line)
+    return batch.reference
+
+
+def run_legacy():
+    batches = make_batches()
+    for line in make_lines():
+        legacy_allocate(line, batches)
+
+
+def run_allocate():
+    batches = make_batches()
+    for line in make_lines():
+        model.allocate(line, batches)
+
+
+def run_product():
+    product = model.Product(SKU, make_batches())
+    for line in make_lines():
+        product.allocate(line)
+
+
+def run_per_request(batches: list[model.Batch], ordered: bool) -> None:
+    for line in make_lines():
+        product = model.Product(SKU, batches)
+        product._batches_ordered = ordered
+        product.allocate(line)
+
+
+def main():
+    setup = timeit.timeit(lambda: (make_batches(), make_lines()), number=1)
+    print(f"{BATCHES} batches, {LINES} lines (setup {setup * 1000:.1f} ms excluded)")
+    batches = make_batches()
+    loaded = sorted(batches, key=model.eta_order)
+    for name, fn in (
+        ("legacy", run_legacy),
+        ("allocate", run_allocate),
+        ("product", run_product),
+        ("unsorted", lambda: (make_batches(), run_per_request(batches, False))),
+        ("loaded", lambda: (make_batches(), run_per_request(loaded, True))),
+    ):
+        elapsed = min(timeit.repeat(fn, number=1, repeat=3)) - setup
+        print(
+            f"{name:>10}: {elapsed * 1000:10.1f} ms total, {elapsed / LINES * 1e6:8.1f} us/line"
+        )
+
+
+if __name__ == "__main__":
+    main()
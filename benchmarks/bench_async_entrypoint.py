@@ -0,0 +1,135 @@
+import asyncio
+import json
+import multiprocessing
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+"""
+같은 부하(동시 요청 CONCURRENCY 개로 POST /allocate 를 REQUESTS 번)를
+Flask(WSGI, 요청마다 스레드) 와 ASGI(이벤트 루프 하나) 엔트리포인트에 보내 처리량과 지연 시간을 비교한다.
+HTTP 서버 없이 각 앱을 프로세스 안에서 직접 호출하며, DB 는 SQLite 파일이다.
+두 앱 모두 import 시점에 매퍼를 등록하므로 각각 별도의 프로세스에서 실행한다.
+
+    python -m benchmarks.bench_async_entrypoint
+"""
+
+SKUS = 100
+REQUESTS = 2_000
+CONCURRENCY = 32
+
+
+def seed(path: str) -> None:
+    from src.allocation.adapters import orm
+
+    engine = create_engine(f"sqlite:///{path}")
+    orm.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(orm.products.insert(), [dict(sku=f"sku-{i}") for i in range(SKUS)])
+        conn.execute(
+            orm.batches.insert(),
+            [
+                dict(
+                    reference=f"batch-{i}", sku=f"sku-{i}", _purchased_quantity=10**6
+                )
+                for i in range(SKUS)
+            ],
+        )
+
+
+def requests_body() -> list[dict]:
+    return [
+        {"orderid": f"order-{i}", "sku": f"sku-{i % SKUS}", "qty": 1}
+        for i in range(REQUESTS)
+    ]
+
+
+def run_flask(path: str, results) -> None:
+    from src.allocation.entrypoints.flask_app import app
+    from src.allocation.service_layer import unit_of_work
+
+    unit_of_work._session_factory = sessionmaker(
+        bind=create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+    )
+
+    def call(body: dict) -> float:
+        start = time.perf_counter()
+        r = app.test_client().post("/allocate", json=body)
+        assert r.status_code == 201, r.json
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        latencies = list(pool.map(call, requests_body()))
+    results.put(("flask", time.perf_counter() - start, latencies))
+
+
+def run_asgi(path: str, results) -> None:
+    from src.allocation.entrypoints.asgi_app import app
+    from src.allocation.service_layer import unit_of_work
+
+    unit_of_work._async_session_factory = sessionmaker(
+        bind=create_async_engine(
+            f"sqlite+aiosqlite:///{path}", connect_args={"timeout": 30}
+        ),
+        class_=AsyncSession,
+        expire_on_commit=False,
+    )
+
+    async def call(body: dict, limit: asyncio.Semaphore) -> float:
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": json.dumps(body).encode()}
+
+        async def send(message):
+            sent.append(message)
+
+        async with limit:
+            start = time.perf_counter()
+            scope = {
+                "type": "http",
+                "method": "POST",
+                "path": "/allocate",
+                "headers": [],
+            }
+            await app(scope, receive, send)
+            assert sent[0]["status"] == 201, sent
+            return time.perf_counter() - start
+
+    async def main():
+        limit = asyncio.Semaphore(CONCURRENCY)
+        return await asyncio.gather(*(call(b, limit) for b in requests_body()))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(main())
+    results.put(("asgi", time.perf_counter() - start, latencies))
+
+
+def main():
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    print(f"{REQUESTS} allocations, {SKUS} skus, concurrency {CONCURRENCY}")
+    for target in (run_flask, run_asgi):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/bench.db"
+            seed(path)
+            process = ctx.Process(target=target, args=(path, results))
+            process.start()
+            name, elapsed, latencies = results.get()
+            process.join()
+        latencies.sort()
+        print(
+            f"{name:>6}: {REQUESTS / elapsed:8.0f} req/s"
+            f"  p50 {statistics.median(latencies) * 1000:7.2f} ms"
+            f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.allocation.adapters import orm
+from src.allocation.service_layer import services, unit_of_work
+
+"""
+batch 입력 처리량(rows/s) 을 SQLite 파일 데이터베이스에서 비교한다.
+- add_batch : batch 하나마다 작업 단위(트랜잭션) 하나 (기존 POST /batch 방식)
+- add_batches : Core executemany 로 chunk 단위 INSERT, 커밋은 한 번
+
+    python -m benchmarks.bench_batch_ingestion
+"""
+
+SINGLE_ROWS = 2_000
+BULK_ROWS = 50_000
+
+
+def rows(count: int, prefix: str):
+    today = date.today()
+    for i in range(count):
+        yield f"{prefix}-{i}", f"sku-{i % 500}", 100, today + timedelta(days=i % 30)
+
+
+def bench(fn, count: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        orm.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        start = time.perf_counter()
+        fn(session_factory, count)
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+    return count / elapsed
+
+
+def one_by_one(session_factory, count: int) -> None:
+    for ref, sku, qty, eta in rows(count, "single"):
+        services.add_batch(
+            ref, sku, qty, eta, unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+        )
+
+
+def bulk(session_factory, count: int) -> None:
+    services.add_batches(
+        rows(count, "bulk"), unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    )
+
+
+def main():
+    orm.start_mappers()
+    print(
+        f"add_batch   ({SINGLE_ROWS} rows): {bench(one_by_one, SINGLE_ROWS):>10,.0f} rows/s"
+    )
+    print(f"add_batches ({BULK_ROWS} rows): {bench(bulk, BULK_ROWS):>10,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
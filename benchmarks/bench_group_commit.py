@@ -0,0 +1,94 @@
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.allocation.adapters import metrics, orm
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+from src.allocation.service_layer.group_commit import GroupCommitter
+
+"""
+동시 요청 CONCURRENCY 개로 할당을 REQUESTS 번 할 때, 요청마다 커밋하는 경우(per request)와
+group commit(window, max_batch 조합별)의 처리량과 지연 시간을 비교한다.
+DB 는 SQLite 파일이며 synchronous=FULL 이므로 커밋마다 fsync 한다.
+
+    python -m benchmarks.bench_group_commit
+"""
+
+SKUS = 50
+REQUESTS = 2_000
+CONCURRENCY = 32
+SETTINGS = ((0.001, 16), (0.002, 64), (0.005, 256))
+
+
+def build_db(path: str) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+    orm.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(orm.products.insert(), [dict(sku=f"sku-{i}") for i in range(SKUS)])
+        conn.execute(
+            orm.batches.insert(),
+            [
+                dict(
+                    reference=f"batch-{i}", sku=f"sku-{i}", _purchased_quantity=10**6
+                )
+                for i in range(SKUS)
+            ],
+        )
+    return sessionmaker(bind=engine)
+
+
+def run(name: str, allocate) -> None:
+    def call(i: int) -> float | None:
+        start = time.perf_counter()
+        try:
+            allocate(f"order-{i}", f"sku-{i % SKUS}", 1)
+        except (model.OutOfStock, unit_of_work.ConcurrencyError):
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        results = list(pool.map(call, range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(r for r in results if r is not None)
+    sizes = metrics.REGISTRY.size_histogram("group_commit")
+    mean_size = f"{sizes.sum / sizes.count:6.1f}" if sizes else "     1"
+    print(
+        f"{name:>18}: {REQUESTS / elapsed:7.0f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.2f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f} ms"
+        f"  batch {mean_size}  failed {results.count(None)}"
+    )
+
+
+def main():
+    orm.start_mappers()
+    metrics.REGISTRY.enabled = True
+    print(f"{REQUESTS} allocations, {SKUS} skus, concurrency {CONCURRENCY}")
+    with tempfile.TemporaryDirectory() as tmp:
+        session_factory = build_db(f"{tmp}/per-request.db")
+        run(
+            "per request",
+            lambda *line: services.allocate(
+                *line, unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+            ),
+        )
+        for window, max_batch in SETTINGS:
+            metrics.REGISTRY.reset()
+            session_factory = build_db(f"{tmp}/group-{max_batch}.db")
+            committer = GroupCommitter(
+                lambda: unit_of_work.SqlAlchemyUnitOfWork(session_factory),
+                window,
+                max_batch,
+            )
+            run(f"group {window * 1000:g}ms/{max_batch}", committer.allocate)
+            committer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.allocation.adapters import orm, repository
+from src.allocation.service_layer import services, unit_of_work
+
+"""
+batches 행 수가 늘어날 때 get(reference) 와 services.allocate 의 지연 시간이 어떻게 변하는지
+인덱스가 있는 스키마와 없는 스키마(SQLite)에서 비교한다.
+
+    python -m benchmarks.bench_indexes
+"""
+
+ROW_COUNTS = (1_000, 10_000, 100_000)
+BATCHES_PER_SKU = 10
+SAMPLES = 200
+
+
+def build_db(rows: int, indexed: bool):
+    engine = create_engine("sqlite:///:memory:")
+    orm.metadata.create_all(engine)
+    if not indexed:
+        for table in orm.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(engine)
+
+    with engine.begin() as conn:
+        conn.execute(
+            orm.batches.insert(),
+            [
+                dict(
+                    reference=f"batch-{i}",
+                    sku=f"sku-{i // BATCHES_PER_SKU}",
+                    _purchased_quantity=1_000_000,
+                    eta=None,
+                )
+                for i in range(rows)
+            ],
+        )
+        conn.execute(
+            orm.products.insert(),
+            [dict(sku=f"sku-{i}") for i in range(rows // BATCHES_PER_SKU)],
+        )
+        # 배치마다 할당을 하나씩 넣어 allocations 조인에도 데이터가 있도록 한다.
+        conn.execute(
+            orm.order_lines.insert(),
+            [
+                dict(orderid=f"seed-{i}", sku=f"sku-{i // BATCHES_PER_SKU}", qty=1)
+                for i in range(rows)
+            ],
+        )
+        conn.execute(
+            orm.allocations.insert(),
+            [dict(orderline_id=i + 1, batch_id=i + 1) for i in range(rows)],
+        )
+    return sessionmaker(bind=engine)
+
+
+def time_per_call(fn, args: list) -> float:
+    start = time.perf_counter()
+    for a in args:
+        fn(a)
+    return (time.perf_counter() - start) / len(args) * 1000
+
+
+def bench(rows: int, indexed: bool) -> tuple[float, float]:
+    session_factory = build_db(rows, indexed)
+    rng = random.Random(42)
+
+    session = session_factory()
+    repo = repository.SqlAlchemyRepository(session)
+    refs = [f"batch-{rng.randrange(rows)}" for _ in range(SAMPLES)]
+    get_ms = time_per_call(repo.get, refs)
+    session.close()
+
+    skus = [f"sku-{rng.randrange(rows // BATCHES_PER_SKU)}" for _ in range(SAMPLES)]
+    allocate_ms = time_per_call(
+        lambda sku: services.allocate(
+            f"order-{rng.random()}",
+            sku,
+            1,
+            unit_of_work.SqlAlchemyUnitOfWork(session_factory),
+        ),
+        skus,
+    )
+    return get_ms, allocate_ms
+
+
+def main():
+    orm.start_mappers()
+    print(f"{'rows':>8} {'indexes':>8} {'get (ms)':>10} {'allocate (ms)':>14}")
+    for rows in ROW_COUNTS:
+        for indexed in (False, True):
+            get_ms, allocate_ms = bench(rows, indexed)
+            print(f"{rows:>8} {str(indexed):>8} {get_ms:>10.3f} {allocate_ms:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import gc
+import tracemalloc
+from datetime import date, timedelta
+
+from src.allocation.domain import compact, model
+
+"""
+라인/batch 한 개당 메모리 사용량(bytes)을 비교한다.
+- model : model.OrderLine / model.Batch (매퍼 등록 전)
+- model (mapped) : orm.start_mappers() 이후의 model 객체 (인스턴스마다 매핑 상태가 추가된다)
+- compact : __slots__ 기반의 compact.OrderLine / compact.Batch
+
+라인은 문자열을 미리 만들어 두고 공유하므로 객체 자체의 크기만 측정한다.
+batch 는 할당 라인 ALLOCATED 개를 가진 상태로 측정하며, 라인 객체의 크기는 제외한다.
+
+    python -m benchmarks.bench_memory
+"""
+
+N = 200_000
+BATCHES = 20_000
+ALLOCATED = 3
+
+
+def measure(make, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = make()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / n
+
+
+def bench(name: str, module) -> None:
+    orderids = [f"order-{i}" for i in range(N)]
+    skus = [f"sku-{i % 1000}" for i in range(N)]
+    refs = [f"batch-{i}" for i in range(BATCHES)]
+    eta = date.today() + timedelta(days=1)
+    lines = [module.OrderLine(orderids[i], skus[i], 1) for i in range(ALLOCATED)]
+
+    def make_lines():
+        return [module.OrderLine(orderids[i], skus[i], 1) for i in range(N)]
+
+    def make_batches():
+        batches = [module.Batch(refs[i], skus[0], 100, eta) for i in range(BATCHES)]
+        for batch in batches:
+            for line in lines:
+                batch.allocate(line)
+        return batches
+
+    per_line = measure(make_lines, N) - 8  # 리스트의 포인터 크기 제외
+    per_batch = measure(make_batches, BATCHES) - 8
+    print(f"{name:>15}: {per_line:7.1f} bytes/line  {per_batch:7.1f} bytes/batch")
+
+
+def main():
+    print(f"{N} lines, {BATCHES} batches with {ALLOCATED} allocated lines each")
+    bench("model", model)
+    bench("compact", compact)
+
+    from src.allocation.adapters import orm
+
+    orm.start_mappers()
+    bench("model (mapped)", model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.datagen import Workload, batch_rows, order_lines
+from src.allocation.adapters import memory
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+
+"""
+메모리 작업 단위(InMemoryUnitOfWork)로 services.allocate 한 번에 걸리는 시간(µs)을 측정한다.
+- no wal : 로그 없이 메모리에만 커밋
+- wal : 커밋마다 write-ahead log 에 기록 (fsync 없음)
+- wal+fsync : 커밋마다 fsync
+
+    python -m benchmarks.bench_memory_uow
+"""
+
+WORKLOAD = Workload(batches=10_000, skus=1_000, lines=20_000, skew=1.0)
+FSYNC_LINES = 1_000
+
+
+def bench(name: str, store: memory.InMemoryStore, lines) -> None:
+    services.add_batches(batch_rows(WORKLOAD), unit_of_work.InMemoryUnitOfWork(store))
+    latencies = []
+    for line in lines:
+        uow = unit_of_work.InMemoryUnitOfWork(store)
+        start = time.perf_counter()
+        try:
+            services.allocate(*line, uow)
+        except model.OutOfStock:
+            pass
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(
+        f"{name:>10}: p50 {statistics.median(latencies) * 1e6:7.1f} µs"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} µs"
+    )
+
+
+def main():
+    lines = order_lines(WORKLOAD)
+    print(f"{WORKLOAD.batches} batches, {WORKLOAD.skus} skus, {len(lines)} allocations")
+    bench("no wal", memory.InMemoryStore(), lines)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = memory.InMemoryStore(os.path.join(tmp, "wal"))
+        bench("wal", store, lines)
+        store.close()
+        store = memory.InMemoryStore(os.path.join(tmp, "wal-sync"), sync=True)
+        bench("wal+fsync", store, lines[:FSYNC_LINES])
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from src.allocation.domain import model
+from src.allocation.service_layer import parallel
+
+"""
+SKU 별 shard 로 나눈 병렬 할당을 worker 수 1, 2, 4, 8 로 실행해 확장성을 비교한다.
+결과는 모든 worker 수에서 같아야 한다.
+
+    python -m benchmarks.bench_parallel_allocation
+"""
+
+LINES = 500_000
+SKUS = 1_000
+BATCHES_PER_SKU = 20
+WORKERS = (1, 2, 4, 8)
+
+
+def make_data() -> tuple[list[model.OrderLine], list[model.Batch]]:
+    rng = random.Random(42)
+    today = date.today()
+    batches = [
+        model.Batch(
+            f"batch-{s}-{i}",
+            f"sku-{s}",
+            rng.randint(0, 300),
+            eta=None
+            if rng.random() < 0.1
+            else today + timedelta(days=rng.randrange(90)),
+        )
+        for s in range(SKUS)
+        for i in range(BATCHES_PER_SKU)
+    ]
+    lines = [
+        model.OrderLine(f"order-{i}", f"sku-{rng.randrange(SKUS)}", rng.randint(1, 10))
+        for i in range(LINES)
+    ]
+    return lines, batches
+
+
+def main():
+    lines, batches = make_data()
+    print(
+        f"{LINES} lines, {SKUS} skus x {BATCHES_PER_SKU} batches, {os.cpu_count()} cpus"
+    )
+    baseline, expected = None, None
+    for workers in WORKERS:
+        start = time.perf_counter()
+        refs = parallel.allocate(lines, batches, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            baseline, expected = elapsed, refs
+        assert refs == expected
+        print(f"{workers} workers: {elapsed:6.2f} s  ({baseline / elapsed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
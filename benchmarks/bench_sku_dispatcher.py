@@ -0,0 +1,92 @@
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from src.allocation.adapters import orm
+from src.allocation.service_layer import services, unit_of_work
+from src.allocation.service_layer.dispatcher import SkuDispatcher
+
+"""
+소수의 SKU 에 요청이 몰릴 때(동시 요청 CONCURRENCY 개), 요청 스레드에서 바로 할당하는 경우(direct)와
+SKU 별 작업 스레드(SkuDispatcher)로 보내는 경우의 처리량, 지연 시간, 버전 충돌로 인한 재시도 횟수와
+재시도 후에도 실패한 요청 수를 비교한다.
+DB 는 SQLite 파일이다.
+
+    python -m benchmarks.bench_sku_dispatcher
+"""
+
+SKUS = 4
+REQUESTS = 1_000
+CONCURRENCY = 32
+WORKERS = 4
+
+
+def build_db(path: str) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+    orm.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(orm.products.insert(), [dict(sku=f"sku-{i}") for i in range(SKUS)])
+        conn.execute(
+            orm.batches.insert(),
+            [
+                dict(
+                    reference=f"batch-{i}", sku=f"sku-{i}", _purchased_quantity=10**6
+                )
+                for i in range(SKUS)
+            ],
+        )
+    return sessionmaker(bind=engine)
+
+
+def run(name: str, session_factory: sessionmaker, allocate) -> None:
+    attempts = []
+    # 재시도까지 포함한 작업 단위 수를 세기 위해 세션이 시작될 때마다 기록한다.
+    event.listen(session_factory, "after_begin", lambda *args: attempts.append(1))
+
+    def call(i: int) -> float | None:
+        start = time.perf_counter()
+        try:
+            allocate(f"order-{i}", f"sku-{i % SKUS}", 1)
+        except unit_of_work.ConcurrencyError:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        results = list(pool.map(call, range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(r for r in results if r is not None)
+    print(
+        f"{name:>10}: {REQUESTS / elapsed:7.0f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.2f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f} ms"
+        f"  retries {len(attempts) - REQUESTS}  failed {results.count(None)}"
+    )
+
+
+def main():
+    orm.start_mappers()
+    print(f"{REQUESTS} allocations, {SKUS} skus, concurrency {CONCURRENCY}")
+    with tempfile.TemporaryDirectory() as tmp:
+        session_factory = build_db(f"{tmp}/direct.db")
+        run(
+            "direct",
+            session_factory,
+            lambda *line: services.allocate(
+                *line, unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+            ),
+        )
+        session_factory = build_db(f"{tmp}/dispatcher.db")
+        dispatcher = SkuDispatcher(
+            lambda: unit_of_work.SqlAlchemyUnitOfWork(session_factory), WORKERS
+        )
+        run("dispatcher", session_factory, dispatcher.allocate)
+        dispatcher.close()
+
+
+if __name__ == "__main__":
+    main()
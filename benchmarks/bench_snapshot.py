@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+
+from benchmarks.datagen import Workload, batch_rows, order_lines
+from src.allocation.adapters import memory
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+
+"""
+메모리 저장소가 다시 시작해 첫 할당을 처리할 수 있을 때까지 걸리는 시간을 비교한다.
+- wal replay : write-ahead log 전체를 재생
+- snapshot : 스냅샷을 mmap 으로 열고, 스냅샷 이후의 로그(TAIL 개의 커밋)만 재생
+snapshot 은 SKU 를 처음 조회할 때 읽으므로, 모든 SKU 를 한 번씩 조회하는 시간(warm all)도 함께 잰다.
+
+    python -m benchmarks.bench_snapshot
+"""
+
+WORKLOAD = Workload(batches=50_000, skus=5_000, lines=100_000, skew=1.0)
+TAIL = 1_000
+
+
+def allocate_all(store: memory.InMemoryStore, lines) -> None:
+    for line in lines:
+        try:
+            services.allocate(*line, unit_of_work.InMemoryUnitOfWork(store))
+        except model.OutOfStock:
+            pass
+
+
+def startup(name: str, make_store, first_line) -> memory.InMemoryStore:
+    start = time.perf_counter()
+    store = make_store()
+    opened = time.perf_counter()
+    try:
+        services.allocate(*first_line, unit_of_work.InMemoryUnitOfWork(store))
+    except model.OutOfStock:
+        pass
+    allocated = time.perf_counter()
+    print(
+        f"{name:>10}: open {(opened - start) * 1000:9.1f} ms"
+        f"  first allocate {(allocated - opened) * 1000:7.2f} ms"
+    )
+    return store
+
+
+def main():
+    lines = order_lines(WORKLOAD)
+    print(f"{WORKLOAD.batches} batches, {WORKLOAD.skus} skus, {len(lines)} allocations")
+    with tempfile.TemporaryDirectory() as tmp:
+        wal, snap = os.path.join(tmp, "wal"), os.path.join(tmp, "snapshot")
+        store = memory.InMemoryStore(wal)
+        services.add_batches(
+            batch_rows(WORKLOAD), unit_of_work.InMemoryUnitOfWork(store)
+        )
+        allocate_all(store, lines[:-TAIL])
+        start = time.perf_counter()
+        store.checkpoint(snap)
+        print(
+            f"checkpoint: {(time.perf_counter() - start) * 1000:.1f} ms,"
+            f" snapshot {os.path.getsize(snap) / 2**20:.1f} MiB,"
+            f" wal {os.path.getsize(wal) / 2**20:.1f} MiB"
+        )
+        allocate_all(store, lines[-TAIL:])
+        store.close()
+
+        probe = ("probe-order", WORKLOAD.sku(0), 1)
+        startup("wal replay", lambda: memory.InMemoryStore(wal), probe).close()
+        # 위의 probe 할당도 로그에 남으므로 다른 주문으로 잰다.
+        probe = ("probe-order-2", WORKLOAD.sku(0), 1)
+        restored = startup(
+            "snapshot",
+            lambda: memory.InMemoryStore(wal, snapshot_path=snap),
+            probe,
+        )
+        start = time.perf_counter()
+        for sku in restored.skus():
+            restored.product(sku)
+        print(f"  warm all: {(time.perf_counter() - start) * 1000:9.1f} ms")
+        restored.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import statistics
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.allocation.adapters import orm
+from src.allocation.service_layer import services, unit_of_work
+
+"""
+services.allocate 한 번의 지연 시간을 도메인 객체로 할당할 때(domain)와 DB 안에서 SQL 로 할당할 때(sql) 비교한다.
+SKU 에 이미 할당된 라인 수를 늘려 가며, batch 와 할당 라인을 로딩하는 비용이 어떻게 커지는지 본다. DB 는 SQLite 다.
+
+    python -m benchmarks.bench_sql_allocation
+"""
+
+SKUS = 20
+BATCHES_PER_SKU = 10
+EXISTING_LINES_PER_SKU = (0, 100, 1_000)
+SAMPLES = 500
+
+
+def build_db(existing_lines: int) -> sessionmaker:
+    engine = create_engine("sqlite:///:memory:")
+    orm.metadata.create_all(engine)
+    batches = SKUS * BATCHES_PER_SKU
+    lines = SKUS * existing_lines
+    with engine.begin() as conn:
+        conn.execute(orm.products.insert(), [dict(sku=f"sku-{i}") for i in range(SKUS)])
+        conn.execute(
+            orm.batches.insert(),
+            [
+                dict(
+                    reference=f"batch-{i}",
+                    sku=f"sku-{i % SKUS}",
+                    _purchased_quantity=10**6,
+                    _allocated_quantity=existing_lines // BATCHES_PER_SKU,
+                    eta=None,
+                )
+                for i in range(batches)
+            ],
+        )
+        if lines:
+            conn.execute(
+                orm.order_lines.insert(),
+                [
+                    dict(orderid=f"seed-{i}", sku=f"sku-{i % SKUS}", qty=1)
+                    for i in range(lines)
+                ],
+            )
+            conn.execute(
+                orm.allocations.insert(),
+                [
+                    dict(orderline_id=i + 1, batch_id=i % batches + 1)
+                    for i in range(lines)
+                ],
+            )
+    return sessionmaker(bind=engine)
+
+
+def bench(existing_lines: int, sql: bool) -> list[float]:
+    os.environ["SQL_ALLOCATION"] = "true" if sql else "false"
+    session_factory = build_db(existing_lines)
+    latencies = []
+    for i in range(SAMPLES):
+        uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+        start = time.perf_counter()
+        services.allocate(f"order-{i}", f"sku-{i % SKUS}", 1, uow)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def main():
+    orm.start_mappers()
+    print(f"{SKUS} skus, {BATCHES_PER_SKU} batches per sku, {SAMPLES} allocations")
+    print(f"{'lines/sku':>10} {'path':>7} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for existing_lines in EXISTING_LINES_PER_SKU:
+        for sql in (False, True):
+            latencies = bench(existing_lines, sql)
+            print(
+                f"{existing_lines:>10} {'sql' if sql else 'domain':>7}"
+                f" {statistics.median(latencies) * 1000:>9.3f}"
+                f" {latencies[int(len(latencies) * 0.99)] * 1000:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+from src.allocation.domain import model, vectorized
+
+"""
+주문 라인 LINES 개를 SKUS 개 SKU 의 batch 들에 다시 할당하는 계획용 실행을 비교한다.
+- python : SKU 별 model.Product 로 라인마다 allocate (정렬은 캐싱)
+- numpy : vectorized.allocate_arrays (배열 준비 시간 제외, SKU 는 정수 코드)
+
+    python -m benchmarks.bench_vectorized_allocation
+"""
+
+LINES = 1_000_000
+SKUS = 1_000
+BATCHES_PER_SKU = 20
+
+
+def make_data() -> tuple[list[model.OrderLine], list[model.Batch]]:
+    rng = random.Random(42)
+    today = date.today()
+    batches = [
+        model.Batch(
+            f"batch-{s}-{i}",
+            f"sku-{s}",
+            rng.randint(0, 600),
+            eta=None
+            if rng.random() < 0.1
+            else today + timedelta(days=rng.randrange(90)),
+        )
+        for s in range(SKUS)
+        for i in range(BATCHES_PER_SKU)
+    ]
+    lines = [
+        model.OrderLine(f"order-{i}", f"sku-{rng.randrange(SKUS)}", rng.randint(1, 10))
+        for i in range(LINES)
+    ]
+    return lines, batches
+
+
+def run_python(lines, batches) -> list[str | None]:
+    by_sku = defaultdict(list)
+    for batch in batches:
+        by_sku[batch.sku].append(batch)
+    products = {sku: model.Product(sku, bs) for sku, bs in by_sku.items()}
+    refs = []
+    for line in lines:
+        try:
+            refs.append(products[line.sku].allocate(line))
+        except model.OutOfStock:
+            refs.append(None)
+    return refs
+
+
+def main():
+    lines, batches = make_data()
+    print(f"{LINES} lines, {SKUS} skus x {BATCHES_PER_SKU} batches")
+
+    # SKU 는 정수 코드로 바꿔 전달한다 (문자열 배열도 되지만 정렬이 느리다).
+    codes = {f"sku-{s}": s for s in range(SKUS)}
+    line_skus = np.array([codes[line.sku] for line in lines])
+    line_qtys = np.array([line.qty for line in lines])
+    batch_skus = np.array([codes[b.sku] for b in batches])
+    batch_available = np.array([b.available_quantity for b in batches])
+    batch_etas = np.array(
+        [b.eta if b.eta is not None else "NaT" for b in batches],
+        dtype="datetime64[D]",
+    )
+    start = time.perf_counter()
+    indexes = vectorized.allocate_arrays(
+        line_skus, line_qtys, batch_skus, batch_available, batch_etas
+    )
+    numpy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = run_python(lines, batches)
+    python_elapsed = time.perf_counter() - start
+
+    refs = [batches[i].reference if i >= 0 else None for i in indexes]
+    assert refs == expected
+    allocated = sum(ref is not None for ref in refs)
+    print(f"allocated {allocated}, out of stock {LINES - allocated}")
+    print(f"python: {python_elapsed:6.2f} s")
+    print(f" numpy: {numpy_elapsed:6.2f} s  ({python_elapsed / numpy_elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import json
+import sys
+
+"""
+benchmarks.suite 가 저장한 두 결과 파일을 비교해, 같은 (backend, batches) 실행의 p50/p95 변화를 출력한다.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+
+OPS = ("allocate", "deallocate", "add_batch")
+
+
+def load(path: str) -> dict[tuple[str, int], dict]:
+    with open(path) as f:
+        report = json.load(f)
+    return {
+        (run["backend"], run["workload"]["batches"]): run["results"]
+        for run in report["runs"]
+    }
+
+
+def main(old_path: str, new_path: str) -> None:
+    old, new = load(old_path), load(new_path)
+    for key in sorted(old.keys() & new.keys()):
+        backend, batches = key
+        for op in OPS:
+            before, after = old[key][op], new[key][op]
+            changes = []
+            for stat in ("p50_ms", "p95_ms"):
+                ratio = after[stat] / before[stat] if before[stat] else float("nan")
+                changes.append(
+                    f"{stat} {before[stat]:8.3f} -> {after[stat]:8.3f} ({ratio:5.2f}x)"
+                )
+            print(f"{backend:>8} {batches:>8} {op:>10}  " + "  ".join(changes))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
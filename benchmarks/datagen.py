@@ -0,0 +1,66 @@
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+"""
+벤치마크용 데이터 생성기. 같은 Workload(seed 포함)는 항상 같은 데이터를 만든다.
+
+- batch 는 SKU 마다 고르게 나뉜다 (모든 SKU 에 batch 가 있다).
+- 주문 라인의 SKU 는 Zipf 분포를 따른다. skew=0 이면 고르게, 클수록 일부 SKU 에 주문이 몰린다.
+"""
+
+
+@dataclass(frozen=True)
+class Workload:
+    batches: int = 1_000
+    skus: int = 100
+    lines: int = 1_000
+    skew: float = 1.0
+    seed: int = 42
+    # ETA 의 기준일. 실행한 날짜와 관계없이 같은 데이터가 나오도록 오늘 대신 고정한다.
+    start: date = date(2026, 1, 1)
+    # 모든 참조/SKU/주문 번호 앞에 붙여, 같은 DB 에 여러 번 실행해도 겹치지 않게 한다.
+    prefix: str = "bench"
+
+    def sku(self, i: int) -> str:
+        return f"{self.prefix}-sku-{i}"
+
+
+def batch_rows(workload: Workload) -> Iterator[tuple[str, str, int, date | None]]:
+    """
+    (reference, sku, qty, eta). 10% 는 창고 재고(eta=None), 나머지는 start 부터 90일 안에 도착하는 선적이다.
+    """
+    rng = random.Random(workload.seed)
+    for i in range(workload.batches):
+        eta = (
+            None
+            if rng.random() < 0.1
+            else workload.start + timedelta(days=rng.randrange(90))
+        )
+        yield (
+            f"{workload.prefix}-batch-{i}",
+            workload.sku(i % workload.skus),
+            rng.randint(500, 1_000),
+            eta,
+        )
+
+
+def sku_weights(skus: int, skew: float) -> list[float]:
+    return [1 / (rank + 1) ** skew for rank in range(skus)]
+
+
+def order_lines(workload: Workload) -> list[tuple[str, str, int]]:
+    """
+    (orderid, sku, qty)
+    """
+    rng = random.Random(workload.seed + 1)
+    skus = rng.choices(
+        range(workload.skus),
+        sku_weights(workload.skus, workload.skew),
+        k=workload.lines,
+    )
+    return [
+        (f"{workload.prefix}-order-{i}", workload.sku(sku), rng.randint(1, 10))
+        for i, sku in enumerate(skus)
+    ]
@@ -0,0 +1,210 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.datagen import Workload, batch_rows, order_lines
+from src.allocation.adapters import memory, orm
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+
+"""
+서비스 계층(add_batches, add_batch, allocate, deallocate)의 지연 시간/처리량 벤치마크.
+같은 Workload 를 fake(테스트용), memory(InMemoryUnitOfWork), sqlite(파일), postgres(config 의 로컬 DB) 작업 단위에 실행하고,
+커밋 간 비교를 위해 결과를 JSON 으로 저장한다.
+
+    python -m benchmarks.suite --backend fake sqlite --batches 1000 100000 --skew 1.2
+    python -m benchmarks.suite --backend postgres --output results.json
+
+postgres 는 기존 데이터를 지우지 않고, 실행마다 다른 prefix 로 데이터를 추가한다.
+"""
+
+BACKENDS = ("fake", "memory", "sqlite", "postgres")
+
+
+def summarize(latencies: list[float], errors: int = 0) -> dict:
+    latencies = sorted(latencies)
+    n = len(latencies)
+    total = sum(latencies)
+
+    def pct(p: float) -> float:
+        return latencies[min(n - 1, int(n * p))] * 1000 if n else 0.0
+
+    return {
+        "n": n,
+        "errors": errors,
+        "mean_ms": statistics.fmean(latencies) * 1000 if n else 0.0,
+        "p50_ms": pct(0.5),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "ops_per_sec": n / total if total else 0.0,
+    }
+
+
+def timed_calls(calls: list[Callable[[], object]]) -> dict:
+    latencies, errors = [], 0
+    for call in calls:
+        start = time.perf_counter()
+        try:
+            call()
+        except (model.OutOfStock, services.InvalidSku):
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, errors)
+
+
+def run(workload: Workload, new_uow: Callable[[], object], ops: int) -> dict:
+    results = {}
+
+    start = time.perf_counter()
+    services.add_batches(batch_rows(workload), new_uow())
+    elapsed = time.perf_counter() - start
+    results["add_batches"] = {
+        "n": workload.batches,
+        "seconds": elapsed,
+        "rows_per_sec": workload.batches / elapsed,
+    }
+
+    lines = order_lines(workload)
+    results["allocate"] = timed_calls(
+        [lambda line=line: services.allocate(*line, new_uow()) for line in lines]
+    )
+    results["deallocate"] = timed_calls(
+        [lambda line=line: services.deallocate(*line, new_uow()) for line in lines]
+    )
+    results["add_batch"] = timed_calls(
+        [
+            lambda i=i: services.add_batch(
+                f"{workload.prefix}-extra-{i}",
+                workload.sku(i % workload.skus),
+                100,
+                None,
+                new_uow(),
+            )
+            for i in range(ops)
+        ]
+    )
+    return results
+
+
+def fake_backend(workload: Workload, ops: int) -> dict:
+    from tests.unit.test_services import FakeUnitOfWork
+
+    uow = FakeUnitOfWork()
+    return run(workload, lambda: uow, ops)
+
+
+def memory_backend(workload: Workload, ops: int) -> dict:
+    store = memory.InMemoryStore()
+    return run(workload, lambda: unit_of_work.InMemoryUnitOfWork(store), ops)
+
+
+def sqlite_backend(workload: Workload, ops: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        orm.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        try:
+            return run(
+                workload,
+                lambda: unit_of_work.SqlAlchemyUnitOfWork(session_factory),
+                ops,
+            )
+        finally:
+            engine.dispose()
+
+
+def postgres_backend(workload: Workload, ops: int) -> dict:
+    engine = unit_of_work.create_engine_from_config()
+    orm.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    try:
+        return run(
+            workload, lambda: unit_of_work.SqlAlchemyUnitOfWork(session_factory), ops
+        )
+    finally:
+        engine.dispose()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backend", nargs="+", choices=BACKENDS, default=["fake", "sqlite"]
+    )
+    parser.add_argument("--batches", nargs="+", type=int, default=[1_000])
+    parser.add_argument("--skus", type=int, default=100)
+    parser.add_argument("--lines", type=int, default=1_000)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--ops", type=int, default=200, help="add_batch 호출 수")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    report = {
+        "commit": git_commit(),
+        "started_at": started.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": [],
+    }
+    # 매퍼를 등록하면 model 클래스 자체가 바뀌므로, fake/memory 를 먼저 실행하고 나서 등록한다.
+    mapped = False
+    for backend in sorted(args.backend, key=BACKENDS.index):
+        if backend in ("sqlite", "postgres") and not mapped:
+            orm.start_mappers()
+            mapped = True
+        for batches in args.batches:
+            workload = Workload(
+                batches=batches,
+                skus=args.skus,
+                lines=args.lines,
+                skew=args.skew,
+                seed=args.seed,
+                prefix=f"bench{started:%Y%m%d%H%M%S}-{batches}",
+            )
+            backend_fn = globals()[f"{backend}_backend"]
+            results = backend_fn(workload, args.ops)
+            report["runs"].append(
+                {"backend": backend, "workload": asdict(workload), "results": results}
+            )
+            print(f"{backend:>8} batches={batches:<8}", end="")
+            for op in ("allocate", "deallocate", "add_batch"):
+                r = results[op]
+                print(
+                    f"  {op} p50 {r['p50_ms']:.2f} ms p95 {r['p95_ms']:.2f} ms", end=""
+                )
+            print(f"  add_batches {results['add_batches']['rows_per_sec']:,.0f} rows/s")
+
+    output = args.output or Path(
+        f"benchmarks/results/{started:%Y%m%dT%H%M%S}-{report['commit'] or 'nogit'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from src.allocation.adapters.repository import (
+    AbstractRepository,
+    SqlAlchemyIdempotencyKeyRepository,
+)
+from src.allocation.domain import model
+
+"""
+읽기가 변경보다 훨씬 많은 SKU 를 위한 프로세스 안의 read-through 캐시.
+
+batch 캐시(BatchCache)에는 batch 의 값(스냅샷)만 저장하고, 캐시에서 꺼낼 때마다 새 Batch 객체를 만들어 돌려준다.
+따라서 캐시에서 나온 객체는 세션에 속하지 않는 읽기 전용 객체이며, 수정하더라도 캐시나 DB 에 반영되지 않는다.
+캐시에 없어 DB 에서 읽은 경우(miss)에는 세션에 속한 원래 객체를 돌려주므로 평소처럼 수정하고 커밋할 수 있다.
+할당은 products 로 aggregate 를 읽어 버전을 확인해야 하므로 이 캐시를 거치지 않고, SKU 의 batch 목록 조회
+(views.batches, GET /batches/<sku>)가 캐시를 거친다.
+
+DB 에서 읽은 값은 바로 캐시에 넣지 않고, 작업 단위가 끝날 때(commit/rollback) 그 작업 단위에서 변경하지 않은
+SKU 의 것만 캐시에 넣는다. commit 하면 변경한 SKU 를 캐시에서 지운다.
+
+멱등 키 캐시(IdempotencyCache)도 같은 방식이다. 다시 온 요청을 DB 를 거치지 않고 응답하며,
+이 프로세스에서 할당을 해제하면 그 라인의 키를 지운다.
+캐시는 프로세스 안에서만 공유되므로, 다른 프로세스가 쓰는 변경(해제한 라인의 키 등)은 알 수 없다.
+"""
+
+BatchSnapshot = tuple[str, str, int, date | None, int, tuple[tuple[str, str, int], ...]]
+
+
+def snapshot(batch: model.Batch) -> BatchSnapshot:
+    return (
+        batch.reference,
+        batch.sku,
+        batch._purchased_quantity,
+        batch.eta,
+        batch._allocated_quantity,
+        tuple((line.orderid, line.sku, line.qty) for line in batch._allocated_orders),
+    )
+
+
+def restore(snap: BatchSnapshot) -> model.Batch:
+    reference, sku, purchased, eta, allocated_quantity, lines = snap
+    batch = model.Batch(reference, sku, purchased, eta)
+    batch._allocated_orders = {model.OrderLine(*line) for line in lines}
+    batch._allocated_quantity = allocated_quantity
+    return batch
+
+
+class BatchCache:
+    """
+    reference 와 SKU 를 키로 하는 크기 제한 LRU 캐시. 여러 스레드(요청)가 공유한다.
+
+    무효화할 때마다 세대(generation) 번호를 올리고, DB 에서 읽기 시작한 뒤에 무효화가 있었다면
+    읽어 온 (이미 오래되었을 수 있는) 값은 캐시에 넣지 않는다.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._by_reference: OrderedDict[str, BatchSnapshot] = OrderedDict()
+        self._by_sku: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, reference: str) -> model.Batch | None:
+        with self._lock:
+            snap = self._by_reference.get(reference)
+            if snap is None:
+                self.misses += 1
+                return None
+            self._by_reference.move_to_end(reference)
+            self.hits += 1
+        return restore(snap)
+
+    def get_sku(self, sku: str) -> list[model.Batch] | None:
+        with self._lock:
+            references = self._by_sku.get(sku)
+            snaps = [self._by_reference.get(ref) for ref in references or ()]
+            if references is None or None in snaps:
+                self.misses += 1
+                return None
+            self._by_sku.move_to_end(sku)
+            for ref in references:
+                self._by_reference.move_to_end(ref)
+            self.hits += 1
+        return [restore(snap) for snap in snaps]
+
+    def put(
+        self, snaps: list[BatchSnapshot], generation: int, sku: str | None = None
+    ) -> None:
+        """
+        sku 를 주면 snaps 가 그 SKU 의 batch 전체라는 의미로 SKU 키에도 저장한다.
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            if sku is not None:
+                self._by_sku[sku] = tuple(snap[0] for snap in snaps)
+                self._by_sku.move_to_end(sku)
+            for snap in snaps:
+                self._by_reference[snap[0]] = snap
+                self._by_reference.move_to_end(snap[0])
+            self._evict()
+
+    def invalidate(self, skus: set[str]) -> None:
+        if not skus:
+            return
+        with self._lock:
+            self._generation += 1
+            for sku in skus:
+                self._by_sku.pop(sku, None)
+            stale = [ref for ref, snap in self._by_reference.items() if snap[1] in skus]
+            for ref in stale:
+                del self._by_reference[ref]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._by_reference),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self) -> None:
+        while len(self._by_reference) > self.maxsize:
+            self._by_reference.popitem(last=False)
+            self.evictions += 1
+        while len(self._by_sku) > self.maxsize:
+            self._by_sku.popitem(last=False)
+            self.evictions += 1
+
+
+class CachingRepository:
+    """
+    AbstractRepository 를 감싸는 decorator. get/for_sku 는 캐시를 먼저 확인하고, 없으면 감싼 저장소에서 읽는다.
+    작업 단위가 끝날 때 publish() 로 읽어 둔 값을 캐시에 넣는다.
+    """
+
+    def __init__(self, repo: AbstractRepository, cache: BatchCache):
+        self._repo = repo
+        self._cache = cache
+        self._staged: list[tuple[int, list[BatchSnapshot], str | None]] = []
+        # ORM flush 를 거치지 않는 add_many 도 변경으로 기록한다.
+        self.written_skus: set[str] = set()
+
+    def add(self, batch: model.Batch) -> None:
+        self.written_skus.add(batch.sku)
+        self._repo.add(batch)
+
+    def add_many(self, batches: list[model.Batch]) -> None:
+        self.written_skus.update(b.sku for b in batches)
+        self._repo.add_many(batches)
+
+    def get(self, reference: str) -> model.Batch:
+        cached = self._cache.get(reference)
+        if cached is not None:
+            return cached
+        generation = self._cache.generation
+        batch = self._repo.get(reference)
+        self._staged.append((generation, [snapshot(batch)], None))
+        return batch
+
+    def list(self) -> list[model.Batch]:
+        return self._repo.list()
+
+    def for_sku(self, sku: str) -> list[model.Batch]:
+        cached = self._cache.get_sku(sku)
+        if cached is not None:
+            return cached
+        generation = self._cache.generation
+        batches = self._repo.for_sku(sku)
+        self._staged.append((generation, [snapshot(b) for b in batches], sku))
+        return batches
+
+    def for_order(self, orderid: str, sku: str | None = None) -> list[model.Batch]:
+        # 할당 해제처럼 읽은 batch 를 바로 수정하는 용도이므로 캐시를 거치지 않는다.
+        return self._repo.for_order(orderid, sku)
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        return self._repo.skus_for_order(orderid)
+
+    def existing_references(self, references: set[str]) -> set[str]:
+        return self._repo.existing_references(references)
+
+    def allocate(self, line: model.OrderLine) -> str | None:
+        # ORM flush 를 거치지 않는 변경이므로 add_many 처럼 직접 기록한다.
+        self.written_skus.add(line.sku)
+        return self._repo.allocate(line)
+
+    def publish(self, changed_skus: set[str]) -> None:
+        """
+        이 작업 단위에서 변경한 SKU 의 값은 커밋되지 않았을 수 있으므로 버리고, 나머지만 캐시에 넣는다.
+        """
+        changed = changed_skus | self.written_skus
+        for generation, snaps, sku in self._staged:
+            if sku in changed or any(snap[1] in changed for snap in snaps):
+                continue
+            self._cache.put(snaps, generation, sku)
+        self._staged = []
+        self.written_skus = set()
+
+
+KeyEntry = tuple[str, str, str, int, str]
+
+
+class IdempotencyCache:
+    """
+    멱등 키 -> (orderid, sku, qty, batchref) 의 크기 제한 LRU 캐시. 여러 스레드(요청)가 공유한다.
+    BatchCache 처럼 무효화할 때마다 세대 번호를 올려, 그 전에 DB 에서 읽은 값은 넣지 않는다.
+    """
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[str, str, int, str]] = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        orderid, sku, qty, batchref = entry
+        return model.OrderLine(orderid, sku, qty), batchref
+
+    def put(self, entries: list[KeyEntry], generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            for key, *entry in entries:
+                self._entries[key] = tuple(entry)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, lines: set[tuple[str, str | None]]) -> None:
+        """
+        lines : (orderid, sku) 들. sku 가 None 이면 주문의 모든 키를 지운다.
+        """
+        if not lines:
+            return
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key
+                for key, (orderid, sku, _, _) in self._entries.items()
+                if (orderid, sku) in lines or (orderid, None) in lines
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class CachingIdempotencyKeyRepository:
+    """
+    SqlAlchemyIdempotencyKeyRepository 를 감싸는 decorator. 캐시에 있는 키는 DB 를 읽지 않는다.
+    작업 단위가 끝날 때 publish() 로 DB 에서 읽은 키와 (커밋했다면) 새로 기록한 키를 캐시에 넣는다.
+    """
+
+    def __init__(
+        self, repo: SqlAlchemyIdempotencyKeyRepository, cache: IdempotencyCache
+    ):
+        self._repo = repo
+        self._cache = cache
+        self._generation = cache.generation
+        self._read: list[KeyEntry] = []
+        self._added: list[KeyEntry] = []
+        self.removed: set[tuple[str, str | None]] = set()
+
+    def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        return self.get_many({key}).get(key)
+
+    def get_many(self, keys: set[str]) -> dict[str, tuple[model.OrderLine, str]]:
+        found = {}
+        for key in keys:
+            entry = self._cache.get(key)
+            if entry is not None:
+                found[key] = entry
+        rows = self._repo.rows(keys - set(found))
+        self._read.extend((key, *row) for key, row in rows.items())
+        return found | {
+            key: (model.OrderLine(orderid, sku, qty), batchref)
+            for key, (orderid, sku, qty, batchref) in rows.items()
+        }
+
+    def add(self, key: str, line: model.OrderLine, batchref: str) -> None:
+        self._added.append((key, line.orderid, line.sku, line.qty, batchref))
+        self._repo.add(key, line, batchref)
+
+    def remove(self, orderid: str, sku: str | None = None) -> None:
+        self.removed.add((orderid, sku))
+        self._repo.remove(orderid, sku)
+
+    def apply(self) -> None:
+        self._repo.apply()
+
+    def publish(self, committed: bool) -> None:
+        """
+        롤백했으면 기록하려던 키는 버리고, 커밋했으면 해제한 라인의 키를 캐시에서도 지운다.
+        """
+        entries = self._read
+        if committed:
+            entries = [
+                entry
+                for entry in self._read + self._added
+                if not {(entry[1], entry[2]), (entry[1], None)} & self.removed
+            ]
+        self._cache.put(entries, self._generation)
+        if committed:
+            self._cache.invalidate(self.removed)
+        self._generation = self._cache.generation
+        self._read, self._added = [], []
+        self.removed = set()
@@ -0,0 +1,562 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from collections.abc import Iterator
+from datetime import date
+
+from src.allocation.adapters import snapshot
+from src.allocation.domain import model
+
+"""
+DB 없이 프로세스 안에서 할당을 처리하는 메모리 저장소 (단일 노드 배포용).
+
+- 커밋된 상태는 InMemoryStore 가 SKU 별 Product 로 가지고 있으며, reference/orderid 로 SKU 를 찾는 인덱스를 함께 유지한다.
+- 작업 단위(Transaction)는 SKU 를 처음 읽을 때 커밋된 Product 의 복사본을 만들고(copy-on-write), 복사본만 수정한다.
+  커밋하면 복사본이 그대로 새 커밋 상태가 되고(SKU 단위 교체), 롤백하면 복사본을 버린다.
+  커밋된 Product 는 교체될 뿐 수정되지 않으므로, 읽는 쪽은 lock 없이 복사할 수 있다.
+- 다른 작업 단위가 같은 SKU 를 먼저 커밋했다면 StaleSnapshot 으로 실패한다 (낙관적 동시성 제어).
+- 커밋마다 변경 내용을 write-ahead log(JSON 한 줄)에 먼저 기록하고, 시작할 때 로그를 재생해 상태를 복구한다.
+- checkpoint() 로 상태를 바이너리 스냅샷(snapshot 모듈)에 저장해 두면, 시작할 때 스냅샷을 mmap 으로 열고
+  그 뒤의 로그만 재생한다. 스냅샷에 있는 SKU 는 처음 조회할 때 Product 로 만든다.
+- 할당 요청의 멱등 키도 로그와 스냅샷에 기록한다. 클라이언트의 재시도는 보통 곧바로 오므로 최근 max_keys 개만
+  보관하고, 넘치면 가장 오래된 키부터 잊는다. 로그를 재생할 때도 같은 순서로 잊으므로 복구한 상태가 같다.
+"""
+
+
+class StaleSnapshot(Exception):
+    """
+    작업 단위가 읽은 뒤에 다른 작업 단위가 같은 SKU 를 커밋한 경우
+    """
+
+
+def copy_batch(batch: model.Batch) -> model.Batch:
+    copied = model.Batch(
+        batch.reference, batch.sku, batch._purchased_quantity, batch.eta
+    )
+    copied._allocated_orders = set(batch._allocated_orders)
+    copied._allocated_quantity = batch._allocated_quantity
+    return copied
+
+
+def copy_product(product: model.Product) -> model.Product:
+    copies = {id(b): copy_batch(b) for b in product.batches}
+    copied = model.Product(
+        product.sku, [copies[id(b)] for b in product.batches], product.version_number
+    )
+    # 정렬 결과도 복사해 작업 단위마다 다시 정렬하지 않게 한다.
+    if product._ordered is not None:
+        copied._ordered = [copies[id(b)] for b in product._ordered]
+    return copied
+
+
+def diff(original: model.Product | None, product: model.Product) -> list[dict]:
+    """
+    original 을 product 로 바꾸는 로그 레코드. 같은 batch 안에서는 해제를 할당보다 먼저 기록한다.
+    """
+    ops: list[dict] = []
+    if original is None:
+        ops.append({"op": "product", "sku": product.sku})
+    if original is None or original.version_number != product.version_number:
+        ops.append(
+            {"op": "version", "sku": product.sku, "version": product.version_number}
+        )
+    before = {b.reference: b for b in original.batches} if original else {}
+    for batch in product.batches:
+        old = before.get(batch.reference)
+        if old is None:
+            ops.append(
+                {
+                    "op": "batch",
+                    "ref": batch.reference,
+                    "sku": batch.sku,
+                    "qty": batch._purchased_quantity,
+                    "eta": batch.eta.isoformat() if batch.eta else None,
+                }
+            )
+            removed, added = set(), batch._allocated_orders
+        else:
+            if old.eta != batch.eta:
+                ops.append(
+                    {
+                        "op": "eta",
+                        "ref": batch.reference,
+                        "eta": batch.eta.isoformat() if batch.eta else None,
+                    }
+                )
+            if old._allocated_orders == batch._allocated_orders:
+                continue
+            removed = old._allocated_orders - batch._allocated_orders
+            added = batch._allocated_orders - old._allocated_orders
+        for op, lines in (("deallocate", removed), ("allocate", added)):
+            for line in lines:
+                ops.append(
+                    {
+                        "op": op,
+                        "ref": batch.reference,
+                        "orderid": line.orderid,
+                        "qty": line.qty,
+                    }
+                )
+    return ops
+
+
+class WriteAheadLog:
+    """
+    커밋 하나를 JSON 한 줄로 추가하는 로그.
+    sync=True 이면 커밋마다 fsync 해서 전원이 꺼져도 커밋을 잃지 않지만, 커밋 지연 시간이 디스크에 묶인다.
+    """
+
+    def __init__(self, path: str, sync: bool = False):
+        self.path = path
+        self.sync = sync
+        self._file = None
+
+    @property
+    def offset(self) -> int:
+        """
+        지금까지 기록된 바이트 수
+        """
+        if self._file is not None:
+            return self._file.tell()
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def replay(self, start: int = 0) -> Iterator[list[dict]]:
+        """
+        start 바이트 이후에 기록된 커밋을 순서대로 돌려준다.
+        기록 도중 중단되어 끝이 잘린 마지막 줄은 버리고 파일에서도 잘라 낸다.
+        """
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < start:
+            raise ValueError(f"{self.path} is shorter than the snapshot expects")
+        if size == 0:
+            return
+        valid = start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    ops = json.loads(raw)
+                except ValueError:
+                    break
+                valid += len(raw)
+                yield ops
+        if valid != size:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def append(self, ops: list[dict]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        self._file.write(json.dumps(ops, separators=(",", ":")).encode() + b"\n")
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# 보관할 멱등 키의 기본 개수
+MAX_IDEMPOTENCY_KEYS = 100_000
+
+
+class InMemoryStore:
+    """
+    커밋된 할당 상태. 여러 스레드의 작업 단위가 공유한다.
+    dict 조회와 항목 교체는 GIL 아래에서 원자적이므로 읽기에는 lock 을 쓰지 않고, 커밋만 lock 으로 직렬화한다.
+
+    스냅샷에서 시작한 경우 dict 의 인덱스는 스냅샷 이후의 변경만 담고, dict 에 없는 키는 스냅샷에서 찾는다.
+    그래서 주문의 할당이 모두 해제되어도 dict 에서 지우지 않고 빈 값으로 남겨 스냅샷의 값을 가린다.
+    """
+
+    def __init__(
+        self,
+        wal_path: str | None = None,
+        sync: bool = False,
+        snapshot_path: str | None = None,
+        max_keys: int = MAX_IDEMPOTENCY_KEYS,
+    ):
+        self._lock = threading.Lock()
+        self._products: dict[str, model.Product] = {}
+        self._sku_by_reference: dict[str, str] = {}
+        self._skus_by_orderid: dict[str, set[str]] = {}
+        self._view: dict[str, list[tuple[str, int, str]]] = {}
+        # 기록된 순서(오래된 것 먼저)를 유지하며, 넘치면 앞에서부터 지운다.
+        self._keys: dict[str, tuple[str, str, int, str]] = {}
+        self._keys_by_orderid: dict[str, set[str]] = {}
+        self.max_keys = max_keys
+        self._snapshot = None
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            self._snapshot = snapshot.SnapshotReader(snapshot_path)
+            # 멱등 키는 max_keys 개로 제한되므로 시작할 때 모두 읽어 둔다.
+            for key, *entry in self._snapshot.idempotency_keys():
+                self._add_key(key, *entry)
+        self.wal = WriteAheadLog(wal_path, sync) if wal_path else None
+        if self.wal is not None:
+            start = self._snapshot.wal_offset if self._snapshot else 0
+            for ops in self.wal.replay(start):
+                self._replay(ops)
+
+    def product(self, sku: str) -> model.Product | None:
+        """
+        커밋된 Product. 수정하면 안 되며, 수정하려면 Transaction 으로 복사본을 얻는다.
+        """
+        product = self._products.get(sku)
+        if product is None and self._snapshot is not None:
+            product = self._snapshot.product(sku)
+            if product is not None:
+                # 다른 스레드가 먼저 만들었거나 커밋했다면 그 객체를 쓴다.
+                product = self._products.setdefault(sku, product)
+        return product
+
+    def skus(self) -> list[str]:
+        if self._snapshot is None:
+            return list(self._products)
+        return list(dict.fromkeys([*self._snapshot.skus(), *self._products]))
+
+    def sku_of(self, reference: str) -> str | None:
+        sku = self._sku_by_reference.get(reference)
+        if sku is None and self._snapshot is not None:
+            sku = self._snapshot.sku_of(reference)
+        return sku
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        if orderid in self._skus_by_orderid or self._snapshot is None:
+            return set(self._skus_by_orderid.get(orderid, ()))
+        return self._snapshot.skus_for_order(orderid)
+
+    def allocations(self, orderid: str) -> list[dict]:
+        return [
+            dict(sku=sku, qty=qty, batchref=batchref)
+            for sku, qty, batchref in self._view_rows(orderid)
+        ]
+
+    def idempotency_key(self, key: str) -> tuple[model.OrderLine, str] | None:
+        """
+        멱등 키로 기록된 (라인, batchref)
+        """
+        entry = self._keys.get(key)
+        if entry is None:
+            return None
+        orderid, sku, qty, batchref = entry
+        return model.OrderLine(orderid, sku, qty), batchref
+
+    def stock(self, sku: str) -> tuple[int, int, date | None] | None:
+        """
+        (입고 수량, 할당 수량, 가장 빠른 ETA). 커밋된 Product 에서 바로 계산하므로 따로 유지하는 합계가 없다.
+        """
+        product = self.product(sku)
+        if product is None:
+            return None
+        etas = [b.eta for b in product.batches if b.eta is not None]
+        return (
+            sum(b._purchased_quantity for b in product.batches),
+            sum(b._allocated_quantity for b in product.batches),
+            min(etas, default=None),
+        )
+
+    def commit(
+        self,
+        originals: dict[str, model.Product | None],
+        working: dict[str, model.Product],
+        view_ops: list[dict],
+    ) -> None:
+        changes = {sku: diff(originals[sku], p) for sku, p in working.items()}
+        changes = {sku: ops for sku, ops in changes.items() if ops}
+        if not changes and not view_ops:
+            return
+        with self._lock:
+            for sku in changes:
+                if self._products.get(sku) is not originals[sku]:
+                    raise StaleSnapshot(f"sku {sku} was changed by another transaction")
+            ops = [op for sku_ops in changes.values() for op in sku_ops] + view_ops
+            if self.wal is not None:
+                self.wal.append(ops)
+            for sku in changes:
+                self._products[sku] = working[sku]
+            self._index(ops)
+
+    def checkpoint(self, path: str) -> None:
+        """
+        커밋된 상태 전체를 스냅샷 파일로 저장한다. 커밋은 잠시(인덱스를 복사하는 동안)만 막는다.
+        이 스냅샷으로 시작하려면 같은 write-ahead log 를 함께 지정해야 한다.
+        """
+        # 스냅샷에만 있는 SKU 를 lock 밖에서 미리 만들어 둔다. 커밋된 Product 는 교체될 뿐 수정되지 않는다.
+        for sku in self.skus():
+            self.product(sku)
+        with self._lock:
+            products = dict(self._products)
+            view = dict(self._view)
+            keys = [(key, *entry) for key, entry in self._keys.items()]
+            wal_offset = self.wal.offset if self.wal is not None else 0
+        if self._snapshot is not None:
+            for orderid in self._snapshot.orderids():
+                if orderid not in view:
+                    view[orderid] = self._snapshot.view(orderid)
+        snapshot.write(path, products, view, wal_offset, keys)
+
+    def close(self) -> None:
+        if self.wal is not None:
+            self.wal.close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+
+    def _replay(self, ops: list[dict]) -> None:
+        for op in ops:
+            kind = op["op"]
+            if kind == "product":
+                self._products[op["sku"]] = model.Product(op["sku"], batches=[])
+            elif kind == "version":
+                self.product(op["sku"]).version_number = op["version"]
+            elif kind == "batch":
+                eta = date.fromisoformat(op["eta"]) if op["eta"] else None
+                batch = model.Batch(op["ref"], op["sku"], op["qty"], eta)
+                self.product(op["sku"]).add_batch(batch)
+                self._sku_by_reference[batch.reference] = batch.sku
+            elif kind in ("eta", "allocate", "deallocate"):
+                product = self.product(self.sku_of(op["ref"]))
+                batch = next(b for b in product.batches if b.reference == op["ref"])
+                if kind == "eta":
+                    batch.eta = date.fromisoformat(op["eta"]) if op["eta"] else None
+                    product._ordered = None
+                    continue
+                # 도메인 규칙(can_allocate)을 다시 검사하지 않고 기록된 결과를 그대로 반영한다.
+                line = model.OrderLine(op["orderid"], batch.sku, op["qty"])
+                if kind == "allocate":
+                    batch._allocated_orders.add(line)
+                    batch._allocated_quantity += line.qty
+                else:
+                    batch._allocated_orders.discard(line)
+                    batch._allocated_quantity -= line.qty
+        self._index(ops)
+
+    def _index(self, ops: list[dict]) -> None:
+        for op in ops:
+            kind = op["op"]
+            if kind == "batch":
+                self._sku_by_reference[op["ref"]] = op["sku"]
+            elif kind == "allocate":
+                sku = self.sku_of(op["ref"])
+                self._order_skus(op["orderid"]).add(sku)
+            elif kind == "deallocate":
+                sku = self.sku_of(op["ref"])
+                product = self._products[sku]
+                if not any(b.lines_for_order(op["orderid"]) for b in product.batches):
+                    skus = self._order_skus(op["orderid"])
+                    skus.discard(sku)
+                    if not skus and self._snapshot is None:
+                        self._skus_by_orderid.pop(op["orderid"], None)
+            elif kind == "view_add":
+                row = (op["sku"], op["qty"], op["batchref"])
+                self._view[op["orderid"]] = [*self._view_rows(op["orderid"]), row]
+            elif kind == "view_remove":
+                rows = [
+                    row
+                    for row in self._view_rows(op["orderid"])
+                    if (row[0], row[1]) != (op["sku"], op["qty"])
+                ]
+                if rows or self._snapshot is not None:
+                    self._view[op["orderid"]] = rows
+                else:
+                    self._view.pop(op["orderid"], None)
+            elif kind == "key_add":
+                self._add_key(
+                    op["key"], op["orderid"], op["sku"], op["qty"], op["batchref"]
+                )
+            elif kind == "key_remove":
+                keys = self._keys_by_orderid.get(op["orderid"], set())
+                for key in [k for k in keys if op["sku"] in (None, self._keys[k][1])]:
+                    self._remove_key(key)
+
+    def _add_key(
+        self, key: str, orderid: str, sku: str, qty: int, batchref: str
+    ) -> None:
+        self._keys[key] = (orderid, sku, qty, batchref)
+        self._keys_by_orderid.setdefault(orderid, set()).add(key)
+        while len(self._keys) > self.max_keys:
+            self._remove_key(next(iter(self._keys)))
+
+    def _remove_key(self, key: str) -> None:
+        orderid = self._keys.pop(key)[0]
+        keys = self._keys_by_orderid[orderid]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_orderid[orderid]
+
+    def _order_skus(self, orderid: str) -> set[str]:
+        if orderid not in self._skus_by_orderid:
+            self._skus_by_orderid[orderid] = self.skus_for_order(orderid)
+        return self._skus_by_orderid[orderid]
+
+    def _view_rows(self, orderid: str) -> list[tuple[str, int, str]]:
+        if orderid in self._view or self._snapshot is None:
+            return self._view.get(orderid, [])
+        return self._snapshot.view(orderid)
+
+
+class Transaction:
+    """
+    작업 단위 하나의 변경 내용. SKU 를 처음 읽을 때 커밋된 Product 를 복사해 두고 복사본을 돌려준다.
+    """
+
+    def __init__(self, store: InMemoryStore):
+        self.store = store
+        self.originals: dict[str, model.Product | None] = {}
+        self.working: dict[str, model.Product] = {}
+        # allocations_view 와 멱등 키처럼 Product 밖의 변경. 커밋할 때 Product 의 변경과 함께 로그에 기록한다.
+        self.view_ops: list[dict] = []
+
+    def product(self, sku: str) -> model.Product | None:
+        if sku in self.working:
+            return self.working[sku]
+        committed = self.store.product(sku)
+        self.originals[sku] = committed
+        if committed is None:
+            return None
+        copied = self.working[sku] = copy_product(committed)
+        return copied
+
+    def add_product(self, product: model.Product) -> None:
+        if product.sku not in self.originals:
+            self.originals[product.sku] = self.store.product(product.sku)
+        self.working[product.sku] = product
+
+    def commit(self) -> None:
+        self.store.commit(self.originals, self.working, self.view_ops)
+
+
+class InMemoryRepository:
+    """
+    AbstractRepository 의 메모리 구현. batch 는 SKU 별 Product 에 속한다.
+    """
+
+    def __init__(self, transaction: Transaction):
+        self._txn = transaction
+
+    def add(self, batch: model.Batch) -> None:
+        product = self._txn.product(batch.sku)
+        if product is None:
+            product = model.Product(batch.sku, batches=[])
+            self._txn.add_product(product)
+        product.add_batch(batch)
+
+    def add_many(self, batches: list[model.Batch]) -> None:
+        for batch in batches:
+            self.add(batch)
+
+    def get(self, reference: str) -> model.Batch:
+        # 이 작업 단위에서 추가해 아직 인덱스에 없는 batch 도 찾는다.
+        skus = [*self._txn.working, self._txn.store.sku_of(reference)]
+        for sku in skus:
+            for batch in self.for_sku(sku) if sku is not None else ():
+                if batch.reference == reference:
+                    return batch
+        raise KeyError(reference)
+
+    def list(self) -> list[model.Batch]:
+        return [b for sku in self._txn.store.skus() for b in self.for_sku(sku)]
+
+    def for_sku(self, sku: str) -> list[model.Batch]:
+        product = self._txn.product(sku)
+        return list(product.batches) if product else []
+
+    def for_order(self, orderid: str, sku: str | None = None) -> list[model.Batch]:
+        skus = self._txn.store.skus_for_order(orderid)
+        if sku is not None:
+            skus &= {sku}
+        return [b for s in skus for b in self.for_sku(s) if b.lines_for_order(orderid)]
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        return self._txn.store.skus_for_order(orderid)
+
+    def existing_references(self, references: set[str]) -> set[str]:
+        # 이 작업 단위에서 추가해 아직 인덱스에 없는 batch 도 확인한다.
+        added = {b.reference for p in self._txn.working.values() for b in p.batches}
+        return {
+            ref
+            for ref in references
+            if ref in added or self._txn.store.sku_of(ref) is not None
+        }
+
+
+class InMemoryProductRepository:
+    def __init__(self, transaction: Transaction):
+        self._txn = transaction
+
+    def add(self, product: model.Product) -> None:
+        self._txn.add_product(product)
+
+    def get(self, sku: str, with_batches: bool = True) -> model.Product | None:
+        return self._txn.product(sku)
+
+    def get_many(self, skus: set[str]) -> dict[str, model.Product]:
+        found = {sku: self._txn.product(sku) for sku in skus}
+        return {sku: product for sku, product in found.items() if product}
+
+
+class InMemoryAllocationsViewRepository:
+    def __init__(self, transaction: Transaction):
+        self._txn = transaction
+
+    def add(self, line: model.OrderLine, batchref: str) -> None:
+        self._txn.view_ops.append(
+            {
+                "op": "view_add",
+                "orderid": line.orderid,
+                "sku": line.sku,
+                "qty": line.qty,
+                "batchref": batchref,
+            }
+        )
+
+    def add_many(self, allocations: list[tuple[model.OrderLine, str]]) -> None:
+        for line, batchref in allocations:
+            self.add(line, batchref)
+
+    def remove(self, line: model.OrderLine) -> None:
+        self._txn.view_ops.append(
+            {
+                "op": "view_remove",
+                "orderid": line.orderid,
+                "sku": line.sku,
+                "qty": line.qty,
+            }
+        )
+
+
+class InMemoryIdempotencyKeyRepository:
+    def __init__(self, transaction: Transaction):
+        self._txn = transaction
+
+    def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        return self._txn.store.idempotency_key(key)
+
+    def get_many(self, keys: set[str]) -> dict[str, tuple[model.OrderLine, str]]:
+        found = {key: self.get(key) for key in keys}
+        return {key: entry for key, entry in found.items() if entry}
+
+    def add(self, key: str, line: model.OrderLine, batchref: str) -> None:
+        self._txn.view_ops.append(
+            {
+                "op": "key_add",
+                "key": key,
+                "orderid": line.orderid,
+                "sku": line.sku,
+                "qty": line.qty,
+                "batchref": batchref,
+            }
+        )
+
+    def remove(self, orderid: str, sku: str | None = None) -> None:
+        self._txn.view_ops.append({"op": "key_remove", "orderid": orderid, "sku": sku})
+
+
+class InMemoryStockRepository:
+    def refresh(self, skus: set[str]) -> None:
+        # 재고는 조회할 때 커밋된 Product 에서 계산한다 (InMemoryStore.stock).
+        pass
@@ -0,0 +1,200 @@
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from src.allocation import config
+
+"""
+요청 처리 구간별 지연 시간 히스토그램과 Prometheus text 형식(/metrics) 출력.
+
+구간(span) 이름은 "route.<endpoint>", "uow.commit", "repository.products.get", "domain.allocate" 처럼
+어느 계층의 어떤 호출인지를 나타낸다. 측정이 꺼져 있으면 timer() 는 아무것도 하지 않는 공용 객체를 돌려주고,
+저장소는 감싸지 않으므로 추가 비용이 거의 없다.
+시간이 아닌 값(group commit 한 번에 묶인 요청 수 등)은 observe_size() 로 별도의 히스토그램에 기록한다.
+"""
+
+# Prometheus 기본 버킷(초). 각 버킷은 그 값 이하인 관측 수를 센다.
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+# 크기(개수) 히스토그램의 버킷
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        # 마지막 칸은 가장 큰 버킷보다 큰 값(+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        버킷 안에서는 값이 고르게 분포한다고 보고 선형 보간한 추정치 (Prometheus histogram_quantile 과 같은 방식)
+        """
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Timer:
+    __slots__ = ("registry", "span", "start")
+
+    def __init__(self, registry: Registry, span: str):
+        self.registry = registry
+        self.span = span
+
+    def __enter__(self) -> Timer:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.registry.observe(self.span, time.perf_counter() - self.start)
+
+
+_NOOP = nullcontext()
+
+
+class Registry:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms: dict[str, Histogram] = {}
+        self._sizes: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def timer(self, span: str) -> Timer | nullcontext:
+        if not self.enabled:
+            return _NOOP
+        return Timer(self, span)
+
+    def observe(self, span: str, seconds: float) -> None:
+        histogram = self._histograms.get(span)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(span, Histogram())
+        histogram.observe(seconds)
+
+    def observe_size(self, span: str, size: int) -> None:
+        histogram = self._sizes.get(span)
+        if histogram is None:
+            with self._lock:
+                histogram = self._sizes.setdefault(span, Histogram(SIZE_BUCKETS))
+        histogram.observe(size)
+
+    def histogram(self, span: str) -> Histogram | None:
+        return self._histograms.get(span)
+
+    def size_histogram(self, span: str) -> Histogram | None:
+        return self._sizes.get(span)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+            self._sizes = {}
+
+    def render(self) -> str:
+        """
+        Prometheus text 형식 (version 0.0.4)
+        """
+        text = _render(
+            "allocation_latency_seconds",
+            "Latency of each instrumented span.",
+            self._histograms,
+        )
+        if self._sizes:
+            text += _render(
+                "allocation_batch_size",
+                "Number of items handled together.",
+                self._sizes,
+            )
+        return text
+
+
+def _render(name: str, help_text: str, histograms: dict[str, Histogram]) -> str:
+    lines = [
+        f"# HELP {name} {help_text}",
+        f"# TYPE {name} histogram",
+    ]
+    quantile_lines = [
+        f"# HELP {name}_quantile Estimated quantiles of each span.",
+        f"# TYPE {name}_quantile gauge",
+    ]
+    for span, histogram in sorted(histograms.items()):
+        label = f'span="{span}"'
+        cumulative = 0
+        for bound, n in zip((*histogram.buckets, "+Inf"), histogram.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{label}}} {histogram.count}")
+        for q in QUANTILES:
+            quantile_lines.append(
+                f'{name}_quantile{{{label},quantile="{q}"}} {histogram.quantile(q)}'
+            )
+    return "\n".join(lines + quantile_lines) + "\n"
+
+
+REGISTRY = Registry(enabled=config.get_metrics_enabled())
+
+
+def timer(span: str) -> Timer | nullcontext:
+    return REGISTRY.timer(span)
+
+
+class InstrumentedRepository:
+    """
+    저장소를 감싸 메서드 호출마다 "repository.<name>.<method>" 구간의 시간을 기록하는 decorator.
+    """
+
+    def __init__(self, repo, name: str, registry: Registry = REGISTRY):
+        self._repo = repo
+        self._name = name
+        self._registry = registry
+
+    def __getattr__(self, attr: str):
+        value = getattr(self._repo, attr)
+        if not callable(value):
+            return value
+        span = f"repository.{self._name}.{attr}"
+
+        def timed(*args, **kwargs):
+            with self._registry.timer(span):
+                return value(*args, **kwargs)
+
+        return timed
@@ -0,0 +1,105 @@
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Engine
+
+from src.allocation import config
+from src.allocation.adapters import orm
+
+"""
+이미 운영 중인 데이터베이스를 orm.metadata 의 스키마로 맞춰주는 마이그레이션.
+metadata.create_all() 은 존재하지 않는 테이블만 만들기 때문에, 기존 테이블에 추가된 컬럼과 인덱스는 생성되지 않는다.
+upgrade() 는 여러 번 실행해도 안전하며(idempotent), 이미 적용된 단계는 건너뛴다.
+
+주의 : ix_batches_reference 는 unique 인덱스이므로 reference 가 중복된 batch 가 있으면 실패한다.
+"""
+
+
+def upgrade(engine: Engine) -> None:
+    existing_tables = set(inspect(engine).get_table_names())
+    orm.metadata.create_all(engine)
+    _add_batches_allocated_quantity(engine)
+    _add_idempotency_keys_qty(engine)
+    _backfill_products(engine)
+    _create_missing_indexes(engine)
+    if "allocations_view" not in existing_tables:
+        _backfill_allocations_view(engine)
+    if "stock" not in existing_tables:
+        _backfill_stock(engine)
+
+
+def _add_batches_allocated_quantity(engine: Engine) -> None:
+    columns = {c["name"] for c in inspect(engine).get_columns("batches")}
+    if "_allocated_quantity" in columns:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            "ALTER TABLE batches"
+            " ADD COLUMN _allocated_quantity INTEGER NOT NULL DEFAULT 0"
+        )
+        # 기존 할당 내역으로부터 합계를 채워 넣는다.
+        conn.execute(
+            "UPDATE batches SET _allocated_quantity = ("
+            " SELECT COALESCE(SUM(ol.qty), 0) FROM allocations AS a"
+            " JOIN order_lines AS ol ON ol.id = a.orderline_id"
+            " WHERE a.batch_id = batches.id)"
+        )
+
+
+def _add_idempotency_keys_qty(engine: Engine) -> None:
+    columns = {c["name"] for c in inspect(engine).get_columns("idempotency_keys")}
+    if "qty" in columns:
+        return
+    with engine.begin() as conn:
+        conn.execute(
+            "ALTER TABLE idempotency_keys ADD COLUMN qty INTEGER NOT NULL DEFAULT 0"
+        )
+        # 할당 내역에서 수량을 채운다. 찾지 못한 키는 0 으로 남아, 다시 온 요청을 할당하지 않고 거절한다.
+        conn.execute(
+            "UPDATE idempotency_keys SET qty = COALESCE(("
+            " SELECT MAX(v.qty) FROM allocations_view AS v"
+            " WHERE v.orderid = idempotency_keys.orderid"
+            " AND v.sku = idempotency_keys.sku), 0)"
+        )
+
+
+def _backfill_products(engine: Engine) -> None:
+    # products 테이블이 생기기 전에 추가된 batch 의 SKU 에도 버전 행을 만들어 준다.
+    with engine.begin() as conn:
+        conn.execute(
+            "INSERT INTO products (sku, version_number)"
+            " SELECT DISTINCT b.sku, 0 FROM batches AS b"
+            " WHERE NOT EXISTS (SELECT 1 FROM products AS p WHERE p.sku = b.sku)"
+        )
+
+
+def _backfill_allocations_view(engine: Engine) -> None:
+    # 새로 만든 조회 전용 테이블을 기존 할당 내역으로 채운다.
+    with engine.begin() as conn:
+        conn.execute(
+            "INSERT INTO allocations_view (orderid, sku, qty, batchref)"
+            " SELECT ol.orderid, ol.sku, ol.qty, b.reference FROM allocations AS a"
+            " JOIN order_lines AS ol ON ol.id = a.orderline_id"
+            " JOIN batches AS b ON b.id = a.batch_id"
+        )
+
+
+def _backfill_stock(engine: Engine) -> None:
+    # 새로 만든 재고 요약 테이블을 기존 batch 의 합계로 채운다.
+    with engine.begin() as conn:
+        conn.execute(
+            "INSERT INTO stock (sku, purchased, allocated, earliest_eta)"
+            " SELECT sku, SUM(_purchased_quantity), SUM(_allocated_quantity), MIN(eta)"
+            " FROM batches GROUP BY sku"
+        )
+
+
+def _create_missing_indexes(engine: Engine) -> None:
+    inspector = inspect(engine)
+    for table in orm.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+
+
+if __name__ == "__main__":
+    upgrade(create_engine(config.get_postgres_uri()))
@@ -1,5 +1,15 @@
-from sqlalchemy import Table, MetaData, Column, Integer, String, Date, ForeignKey
-from sqlalchemy.orm import mapper, relationship
+from sqlalchemy import (
+    Table,
+    MetaData,
+    Column,
+    Integer,
+    String,
+    Date,
+    ForeignKey,
+    Index,
+)
+from sqlalchemy import event
+from sqlalchemy.orm import mapper, relationship, foreign
 
 from src.allocation.domain import model
 
@@ -12,6 +22,7 @@ order_lines = Table(
     Column("sku", String(255)),
     Column("qty", Integer, nullable=False),
     Column("orderid", String(255)),
+    Index("ix_order_lines_orderid_sku", "orderid", "sku"),
 )
 
 batches = Table(
@@ -22,6 +33,11 @@ batches = Table(
     Column("sku", String(255)),
     Column("_purchased_quantity", Integer, nullable=False),
     Column("eta", Date, nullable=True),
+    Column("_allocated_quantity", Integer, nullable=False, server_default="0"),
+    # get(reference) 는 reference 로, for_sku(sku) 는 sku 로 조회하므로 각각 인덱스를 둔다.
+    # reference 는 batch 의 식별자(엔티티의 정체성)이므로 유일해야 한다.
+    Index("ix_batches_reference", "reference", unique=True),
+    Index("ix_batches_sku", "sku"),
 )
 
 allocations = Table(
@@ -30,19 +46,100 @@ allocations = Table(
     Column("id", Integer, primary_key=True, autoincrement=True),
     Column("orderline_id", ForeignKey("order_lines.id")),
     Column("batch_id", ForeignKey("batches.id")),
+    # _allocated_orders 로딩은 batch_id 로 조인하고, 같은 라인이 같은 batch 에 두 번 할당될 수 없다.
+    Index(
+        "ix_allocations_batch_id_orderline_id", "batch_id", "orderline_id", unique=True
+    ),
+    Index("ix_allocations_orderline_id", "orderline_id"),
+)
+
+# SKU 별 버전 번호. 같은 SKU 에 대한 동시 할당을 낙관적 동시성 제어로 검출한다.
+products = Table(
+    "products",
+    metadata,
+    Column("sku", String(255), primary_key=True),
+    Column("version_number", Integer, nullable=False, server_default="0"),
+)
+
+# 조회 전용 모델(read model). 주문별 할당 결과를 도메인 객체를 로딩하지 않고 바로 조회하기 위한 비정규화 테이블로,
+# 할당/해제와 같은 트랜잭션에서 함께 갱신된다. 매퍼 없이 SQL 로만 읽고 쓴다.
+allocations_view = Table(
+    "allocations_view",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("orderid", String(255), nullable=False),
+    Column("sku", String(255), nullable=False),
+    Column("qty", Integer, nullable=False),
+    Column("batchref", String(255), nullable=False),
+    Index("ix_allocations_view_orderid", "orderid"),
+)
+
+# 조회 전용 모델. SKU 별 재고 합계(입고/할당 수량, 가장 빠른 ETA)로, batch 를 추가하거나 할당/해제하는
+# 트랜잭션에서 함께 다시 계산된다. 재고 조회는 기본 키로 행 하나를 읽는다.
+stock = Table(
+    "stock",
+    metadata,
+    Column("sku", String(255), primary_key=True),
+    Column("purchased", Integer, nullable=False),
+    Column("allocated", Integer, nullable=False),
+    Column("earliest_eta", Date, nullable=True),
+)
+
+# 할당 요청의 멱등 키(기본은 orderid 와 SKU, 또는 클라이언트가 보낸 Idempotency-Key). 같은 키로 다시 온 요청은
+# batch 를 읽지 않고 여기 기록된 batchref 를 돌려주며, 라인(orderid, sku, qty)이 다르면 거절한다.
+# 할당 해제하면 그 라인의 키를 지운다.
+idempotency_keys = Table(
+    "idempotency_keys",
+    metadata,
+    Column("key", String(255), primary_key=True),
+    Column("orderid", String(255), nullable=False),
+    Column("sku", String(255), nullable=False),
+    Column("qty", Integer, nullable=False),
+    Column("batchref", String(255), nullable=False),
+    Index("ix_idempotency_keys_orderid", "orderid"),
 )
 
 
 def start_mappers():
     lines_mapper = mapper(model.OrderLine, order_lines)
-    mapper(
+    batches_mapper = mapper(
         model.Batch,
         batches,
         properties={
+            # 도메인 로직은 batch 의 할당 라인을 항상 사용하므로, batch 마다 SELECT 하는 지연 로딩(N+1) 대신
+            # 함께 조회된 batch 들의 라인을 IN 쿼리 한 번으로 로딩한다.
             "_allocated_orders": relationship(
                 lines_mapper,
                 secondary=allocations,
                 collection_class=set,
+                lazy="selectin",
+            )
+        },
+    )
+    # version_id_col : UPDATE ... WHERE version_number = <읽은 버전> 으로 갱신하며,
+    # 갱신된 행이 없으면(다른 트랜잭션이 먼저 커밋) StaleDataError 가 발생한다.
+    # version_id_generator=False : 버전은 도메인(Product)이 직접 증가시킨다.
+    mapper(
+        model.Product,
+        products,
+        properties={
+            # 할당 순서(eta 가 없는 batch 먼저, 그 다음 eta 순, 같으면 id 순)로 로딩한다.
+            # DB 마다 다른 행 순서에 기대지 않으므로, 도메인의 안정 정렬과 SQL 할당(ORDER BY eta IS NOT NULL, eta, id)이
+            # 같은 ETA 의 batch 중 항상 같은 것을 고른다.
+            "batches": relationship(
+                batches_mapper,
+                primaryjoin=products.c.sku == foreign(batches.c.sku),
+                order_by=[batches.c.eta.isnot(None), batches.c.eta, batches.c.id],
             )
         },
+        version_id_col=products.c.version_number,
+        version_id_generator=False,
     )
+    event.listen(model.Product, "load", _batches_loaded_in_order)
+    event.listen(model.Product, "refresh", _batches_loaded_in_order)
+
+
+def _batches_loaded_in_order(product: model.Product, *args) -> None:
+    # batches 관계는 할당 순서로 로딩되므로 Product.allocate 가 다시 정렬하지 않아도 된다.
+    product._batches_ordered = True
+    product._ordered = None
@@ -0,0 +1,74 @@
+import logging
+import re
+import time
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+
+"""
+작업 단위(UoW) 하나에서 실행된 SQL 문의 수와 DB 시간을 세는 프로파일러.
+같은 모양의 SELECT 가 여러 번 실행되면 지연 로딩 등으로 인한 N+1 패턴으로 보고 알려 준다.
+
+    uow = SqlAlchemyUnitOfWork(profile=True)
+    services.allocate("o1", "LAMP", 10, uow)
+    assert uow.profile.count <= 8
+    assert uow.profile.n_plus_one() == {}
+"""
+
+logger = logging.getLogger(__name__)
+
+# 같은 SELECT 가 이 횟수 이상 실행되면 N+1 로 본다.
+N_PLUS_ONE_THRESHOLD = 3
+
+# selectinload 의 IN (?, ?, ...) 처럼 파라미터 개수만 다른 문장은 같은 문장으로 센다.
+_PARAMETER_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)\s*,?)+\)")
+
+
+def normalize(statement: str) -> str:
+    return _PARAMETER_LIST.sub("(...)", " ".join(statement.split()))
+
+
+class QueryProfile:
+    def __init__(self):
+        self.statements: list[tuple[str, float]] = []
+        self._started: list[float] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def n_plus_one(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        """
+        threshold 번 이상 반복된 SELECT 와 그 횟수
+        """
+        counts = Counter(
+            normalize(statement)
+            for statement, _ in self.statements
+            if statement.lstrip().upper().startswith("SELECT")
+        )
+        return {s: n for s, n in counts.items() if n >= threshold}
+
+    def watch(self, session: Session) -> None:
+        """
+        세션이 트랜잭션을 시작할 때마다 그 커넥션에서 실행되는 SQL 문을 기록한다.
+        """
+        event.listen(session, "after_begin", self._listen_connection)
+
+    def report(self) -> None:
+        for statement, n in self.n_plus_one().items():
+            logger.warning("possible N+1: %d x %s", n, statement)
+
+    def _listen_connection(self, session, transaction, connection) -> None:
+        event.listen(connection, "before_cursor_execute", self._before_execute)
+        event.listen(connection, "after_cursor_execute", self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, *args) -> None:
+        self._started.append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, *args) -> None:
+        self.statements.append((statement, time.perf_counter() - self._started.pop()))
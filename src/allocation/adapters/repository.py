@@ -1,7 +1,13 @@
+from __future__ import annotations
 from typing import Protocol, runtime_checkable
 
+from sqlalchemy import and_, bindparam, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.session import Session
 
+from src.allocation.adapters import orm
 from src.allocation.domain import model
 
 
@@ -18,12 +24,69 @@ class AbstractRepository(Protocol):
     def add(self, batch: model.Batch) -> None:
         ...
 
+    def add_many(self, batches: list[model.Batch]) -> None:
+        ...
+
     def get(self, reference: str) -> model.Batch:
         ...
 
     def list(self) -> list[model.Batch]:
         ...
 
+    def for_sku(self, sku: str) -> list[model.Batch]:
+        ...
+
+    def for_order(self, orderid: str, sku: str | None = None) -> list[model.Batch]:
+        ...
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        ...
+
+    def existing_references(self, references: set[str]) -> set[str]:
+        """
+        references 중 이미 batch 가 있는 reference
+        """
+        ...
+
+
+@runtime_checkable
+class AbstractAllocatingRepository(Protocol):
+    """
+    batch 를 도메인 객체로 읽지 않고 저장소(DB) 안에서 바로 할당할 수 있는 저장소.
+    의미는 model.allocate 와 같다. 할당한 batch 의 reference 를 돌려주고, 가능한 batch 가 없으면 OutOfStock,
+    SKU 가 없으면 None 이다.
+    """
+
+    def allocate(self, line: model.OrderLine) -> str | None:
+        ...
+
+
+# 라인이 batches.id 의 batch 에 이미 할당되어 있는지 (Batch.allocate 는 이미 할당된 라인이면 아무것도 하지 않는다)
+_ALLOCATED_BEFORE = """
+    EXISTS (
+        SELECT 1 FROM allocations JOIN order_lines ON order_lines.id = allocations.orderline_id
+        WHERE allocations.batch_id = batches.id
+          AND order_lines.orderid = :orderid AND order_lines.sku = :sku AND order_lines.qty = :qty
+    )
+"""
+
+# batch 선택(model.allocate 의 순서와 Batch.can_allocate)과 수량 예약을 한 문장으로 처리한다.
+# 정렬은 eta=None 우선, eta 가 빠른 순, 같으면 먼저 추가된(id 가 작은) batch 순이다.
+_ALLOCATE = text(
+    f"""
+    UPDATE batches
+    SET _allocated_quantity = _allocated_quantity
+        + CASE WHEN {_ALLOCATED_BEFORE} THEN 0 ELSE :qty END
+    WHERE id = (
+        SELECT id FROM batches
+        WHERE sku = :sku AND _purchased_quantity - _allocated_quantity >= :qty
+        ORDER BY eta IS NOT NULL, eta, id
+        LIMIT 1
+    )
+    RETURNING id, reference, {_ALLOCATED_BEFORE} AS allocated_before
+    """
+)
+
 
 class SqlAlchemyRepository:
     """
@@ -43,6 +106,36 @@ class SqlAlchemyRepository:
         #     """
         # )
 
+    def add_many(self, batches: list[model.Batch]) -> None:
+        # 대량 입력은 세션에 객체를 하나씩 add 해서 flush 하는 대신,
+        # Core 의 batches 테이블로 한 번의 executemany INSERT 를 실행한다.
+        if not batches:
+            return
+        self.session.execute(
+            orm.batches.insert(),
+            [
+                dict(
+                    reference=b.reference,
+                    sku=b.sku,
+                    _purchased_quantity=b._purchased_quantity,
+                    eta=b.eta,
+                )
+                for b in batches
+            ],
+        )
+        # ORM 을 거치지 않으므로, 처음 보는 SKU 의 products 행도 직접 만든다.
+        skus = {b.sku for b in batches}
+        existing = set(
+            self.session.execute(
+                select(orm.products.c.sku).where(orm.products.c.sku.in_(skus))
+            ).scalars()
+        )
+        if skus - existing:
+            self.session.execute(
+                orm.products.insert(),
+                [dict(sku=sku, version_number=0) for sku in skus - existing],
+            )
+
     def get(self, reference: str) -> model.Batch:
         return self.session.query(model.Batch).filter_by(reference=reference).one()
         # sql version
@@ -60,3 +153,517 @@ class SqlAlchemyRepository:
         # SELECT * FROM batches
         # """
         # )
+
+    def for_sku(self, sku: str) -> list[model.Batch]:
+        # 할당에 필요한 것은 같은 SKU 의 batch 뿐이므로 전체 테이블 대신 SKU 로 필터링한다.
+        # _allocated_orders 는 지연 로딩 시 batch 마다 SELECT 가 발생하므로(N+1),
+        # 조회된 batch 들에 대해서만 IN 쿼리 한 번으로 미리 로딩한다.
+        return (
+            self.session.query(model.Batch)
+            .filter_by(sku=sku)
+            .options(selectinload(model.Batch._allocated_orders))
+            .all()
+        )
+
+    def for_order(self, orderid: str, sku: str | None = None) -> list[model.Batch]:
+        # 주문의 라인이 할당된 batch 만 allocations 테이블을 거쳐 바로 찾는다.
+        query = (
+            self.session.query(model.Batch)
+            .join(model.Batch._allocated_orders)
+            .filter(model.OrderLine.orderid == orderid)
+        )
+        if sku is not None:
+            query = query.filter(model.OrderLine.sku == sku)
+        return (
+            query.distinct().options(selectinload(model.Batch._allocated_orders)).all()
+        )
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        # batch 를 로딩하지 않고, 주문의 라인이 할당된 SKU 만 allocations 테이블에서 찾는다.
+        lines = orm.order_lines.c
+        rows = self.session.execute(
+            select(lines.sku)
+            .join(orm.allocations, orm.allocations.c.orderline_id == lines.id)
+            .where(lines.orderid == orderid)
+            .distinct()
+        )
+        return {sku for (sku,) in rows}
+
+    def existing_references(self, references: set[str]) -> set[str]:
+        rows = self.session.execute(
+            select(orm.batches.c.reference).where(
+                orm.batches.c.reference.in_(sorted(references))
+            )
+        )
+        return {reference for (reference,) in rows}
+
+    def allocate(self, line: model.OrderLine) -> str | None:
+        """
+        AbstractAllocatingRepository 구현. batch 와 할당 라인을 로딩하지 않고 SQL 로 할당한다.
+
+        먼저 products 행의 버전 번호를 올려 그 행에 쓰기 lock 을 건다. 같은 SKU 를 할당하는 다른 트랜잭션은
+        커밋할 때까지 기다리고(SQLite 는 DB 전체의 쓰기 lock), 도메인 객체로 할당하는 트랜잭션은 버전 충돌로 재시도한다.
+        그래서 다음 문장의 batch 선택은 항상 최신 상태를 본다.
+        UPDATE ... RETURNING 이 필요하다 (PostgreSQL, SQLite 3.35 이상).
+        세션에 이미 로딩된 Batch 객체에는 반영되지 않는다.
+        """
+        bumped = self.session.execute(
+            orm.products.update()
+            .where(orm.products.c.sku == line.sku)
+            .values(version_number=orm.products.c.version_number + 1)
+        )
+        if bumped.rowcount == 0:
+            return None
+        row = self.session.execute(
+            _ALLOCATE, dict(orderid=line.orderid, sku=line.sku, qty=line.qty)
+        ).one_or_none()
+        if row is None:
+            raise model.OutOfStock(f"Out of stock for sku {line.sku}")
+        if not row.allocated_before:
+            inserted = self.session.execute(
+                orm.order_lines.insert().values(
+                    orderid=line.orderid, sku=line.sku, qty=line.qty
+                )
+            )
+            self.session.execute(
+                orm.allocations.insert().values(
+                    orderline_id=inserted.inserted_primary_key[0], batch_id=row.id
+                )
+            )
+        return row.reference
+
+
+@runtime_checkable
+class AbstractProductRepository(Protocol):
+    def add(self, product: model.Product) -> None:
+        ...
+
+    def get(self, sku: str, with_batches: bool = True) -> model.Product | None:
+        ...
+
+    def get_many(self, skus: set[str]) -> dict[str, model.Product]:
+        """
+        SKU -> Product. 없는 SKU 는 결과에서 빠진다.
+        """
+        ...
+
+
+class SqlAlchemyProductRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def add(self, product: model.Product) -> None:
+        self.session.add(product)
+
+    def get(self, sku: str, with_batches: bool = True) -> model.Product | None:
+        """
+        with_batches=False 이면 products 행(버전 번호)만 읽는다. batches 는 접근할 때 지연 로딩된다.
+        """
+        if not with_batches:
+            return self.session.get(model.Product, sku)
+        return (
+            self.session.query(model.Product)
+            .filter_by(sku=sku)
+            .options(
+                selectinload(model.Product.batches).selectinload(
+                    model.Batch._allocated_orders
+                )
+            )
+            .first()
+        )
+
+    def get_many(self, skus: set[str]) -> dict[str, model.Product]:
+        # SKU 수와 관계없이 products, batches, allocations 를 IN 쿼리 한 번씩으로 읽는다.
+        if not skus:
+            return {}
+        products = (
+            self.session.query(model.Product)
+            .filter(model.Product.sku.in_(sorted(skus)))
+            .options(
+                selectinload(model.Product.batches).selectinload(
+                    model.Batch._allocated_orders
+                )
+            )
+            .all()
+        )
+        return {p.sku: p for p in products}
+
+
+@runtime_checkable
+class AbstractAllocationsViewRepository(Protocol):
+    """
+    조회 전용 테이블(allocations_view)의 갱신. 할당/해제 결과를 같은 작업 단위에서 기록한다.
+    """
+
+    def add(self, line: model.OrderLine, batchref: str) -> None:
+        ...
+
+    def add_many(self, allocations: list[tuple[model.OrderLine, str]]) -> None:
+        ...
+
+    def remove(self, line: model.OrderLine) -> None:
+        ...
+
+
+class SqlAlchemyAllocationsViewRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def add(self, line: model.OrderLine, batchref: str) -> None:
+        self.add_many([(line, batchref)])
+
+    def add_many(self, allocations: list[tuple[model.OrderLine, str]]) -> None:
+        if not allocations:
+            return
+        self.session.execute(orm.allocations_view.insert(), _view_rows(allocations))
+
+    def remove(self, line: model.OrderLine) -> None:
+        self.session.execute(orm.allocations_view.delete().where(_view_row_of(line)))
+
+
+def _view_rows(allocations: list[tuple[model.OrderLine, str]]) -> list[dict]:
+    return [
+        dict(orderid=line.orderid, sku=line.sku, qty=line.qty, batchref=batchref)
+        for line, batchref in allocations
+    ]
+
+
+def _view_row_of(line: model.OrderLine):
+    view = orm.allocations_view.c
+    return and_(
+        view.orderid == line.orderid, view.sku == line.sku, view.qty == line.qty
+    )
+
+
+@runtime_checkable
+class AbstractStockRepository(Protocol):
+    """
+    조회 전용 테이블(stock)의 갱신. batch 나 할당을 바꾼 작업 단위에서 바뀐 SKU 를 알려 주면,
+    작업 단위가 커밋할 때(apply) 그 SKU 들의 합계를 다시 계산한다.
+    """
+
+    def refresh(self, skus: set[str]) -> None:
+        ...
+
+
+# 합계를 더하고 빼는 대신 SKU 의 batches 행(ix_batches_sku)에서 다시 계산하므로, 할당 경로(도메인/SQL)나
+# 이미 할당된 라인의 재할당처럼 실제로 바뀐 수량을 알기 어려운 경우에도 항상 batches 와 일치한다.
+_REFRESH_STOCK = text(
+    """
+    INSERT INTO stock (sku, purchased, allocated, earliest_eta)
+    SELECT sku, SUM(_purchased_quantity), SUM(_allocated_quantity), MIN(eta)
+    FROM batches WHERE sku IN :skus GROUP BY sku
+    ON CONFLICT (sku) DO UPDATE SET
+        purchased = excluded.purchased,
+        allocated = excluded.allocated,
+        earliest_eta = excluded.earliest_eta
+    """
+).bindparams(bindparam("skus", expanding=True))
+
+
+def _lock_products(skus: set[str]):
+    """
+    batch 를 추가하는 경로(Product.add_batch, add_many)는 products 행을 갱신하지 않으므로, 다시 계산하기 전에
+    행을 잠가 같은 SKU 에 할당 중인 트랜잭션의 commit 을 기다린다. 그래야 READ COMMITTED 에서도 이어지는
+    _REFRESH_STOCK 이 그 변경을 본다. 교착을 피하려고 SKU 순서로 잠근다. SQLite 는 FOR UPDATE 를 무시하지만
+    쓰기가 데이터베이스 단위로 직렬화되므로 문제가 없다.
+    """
+    return (
+        select(orm.products.c.sku)
+        .where(orm.products.c.sku.in_(sorted(skus)))
+        .order_by(orm.products.c.sku)
+        .with_for_update()
+    )
+
+
+class SqlAlchemyStockRepository:
+    def __init__(self, session: Session):
+        self.session = session
+        self.pending: set[str] = set()
+
+    def refresh(self, skus: set[str]) -> None:
+        self.pending |= skus
+
+    def apply(self) -> None:
+        """
+        작업 단위의 commit 에서 호출한다. 세션에만 있는 batch 의 변경을 먼저 flush 해야 합계에 포함된다.
+        """
+        if not self.pending:
+            return
+        self.session.flush()
+        self.session.execute(_lock_products(self.pending))
+        self.session.execute(_REFRESH_STOCK, dict(skus=sorted(self.pending)))
+        self.pending = set()
+
+
+class DuplicateIdempotencyKey(Exception):
+    """
+    같은 키의 요청을 다른 작업 단위가 먼저 기록한 경우. 다시 실행하면 기록된 결과를 돌려받는다.
+    """
+
+
+@runtime_checkable
+class AbstractIdempotencyKeyRepository(Protocol):
+    """
+    할당 요청의 멱등 키와 그 결과. add 한 키는 작업 단위가 커밋할 때(apply) 기록한다.
+    get/get_many 는 키로 기록된 (라인, batchref) 를 돌려준다.
+    """
+
+    def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        ...
+
+    def get_many(self, keys: set[str]) -> dict[str, tuple[model.OrderLine, str]]:
+        ...
+
+    def add(self, key: str, line: model.OrderLine, batchref: str) -> None:
+        ...
+
+    def remove(self, orderid: str, sku: str | None = None) -> None:
+        ...
+
+
+class SqlAlchemyIdempotencyKeyRepository:
+    def __init__(self, session: Session):
+        self.session = session
+        self.pending: list[dict] = []
+
+    def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        return self.get_many({key}).get(key)
+
+    def get_many(self, keys: set[str]) -> dict[str, tuple[model.OrderLine, str]]:
+        return {
+            key: (model.OrderLine(orderid, sku, qty), batchref)
+            for key, (orderid, sku, qty, batchref) in self.rows(keys).items()
+        }
+
+    def rows(self, keys: set[str]) -> dict[str, tuple[str, str, int, str]]:
+        """
+        키별 (orderid, sku, qty, batchref)
+        """
+        if not keys:
+            return {}
+        table = orm.idempotency_keys.c
+        rows = self.session.execute(
+            select(
+                table.key, table.orderid, table.sku, table.qty, table.batchref
+            ).where(table.key.in_(keys))
+        )
+        return {
+            key: (orderid, sku, qty, batchref)
+            for key, orderid, sku, qty, batchref in rows
+        }
+
+    def add(self, key: str, line: model.OrderLine, batchref: str) -> None:
+        self.pending.append(_key_row(key, line, batchref))
+
+    def remove(self, orderid: str, sku: str | None = None) -> None:
+        self.session.execute(
+            orm.idempotency_keys.delete().where(_keys_of(orderid, sku))
+        )
+
+    def apply(self) -> None:
+        """
+        작업 단위의 commit 에서 호출한다. 동시에 실행된 같은 키의 요청이 먼저 커밋했다면 DuplicateIdempotencyKey.
+        """
+        if not self.pending:
+            return
+        try:
+            self.session.execute(orm.idempotency_keys.insert(), self.pending)
+        except IntegrityError as e:
+            raise DuplicateIdempotencyKey(str(e)) from e
+        self.pending = []
+
+
+def _key_row(key: str, line: model.OrderLine, batchref: str) -> dict:
+    return dict(
+        key=key, orderid=line.orderid, sku=line.sku, qty=line.qty, batchref=batchref
+    )
+
+
+def _keys_of(orderid: str, sku: str | None):
+    table = orm.idempotency_keys.c
+    if sku is None:
+        return table.orderid == orderid
+    return and_(table.orderid == orderid, table.sku == sku)
+
+
+# asyncio 용 port 와 adapter. 메서드 이름과 의미는 위의 동기 버전과 같고, DB 를 거치는 메서드는 코루틴이다.
+# AsyncSession 에서는 지연 로딩을 할 수 없으므로 도메인 로직이 접근하는 관계는 모두 미리 로딩한다.
+@runtime_checkable
+class AbstractAsyncRepository(Protocol):
+    def add(self, batch: model.Batch) -> None:
+        ...
+
+    async def get(self, reference: str) -> model.Batch:
+        ...
+
+    async def list(self) -> list[model.Batch]:
+        ...
+
+    async def for_sku(self, sku: str) -> list[model.Batch]:
+        ...
+
+    async def existing_references(self, references: set[str]) -> set[str]:
+        ...
+
+
+@runtime_checkable
+class AbstractAsyncProductRepository(Protocol):
+    def add(self, product: model.Product) -> None:
+        ...
+
+    async def get(self, sku: str) -> model.Product | None:
+        ...
+
+
+@runtime_checkable
+class AbstractAsyncAllocationsViewRepository(Protocol):
+    async def add(self, line: model.OrderLine, batchref: str) -> None:
+        ...
+
+    async def remove(self, line: model.OrderLine) -> None:
+        ...
+
+
+@runtime_checkable
+class AbstractAsyncStockRepository(Protocol):
+    def refresh(self, skus: set[str]) -> None:
+        ...
+
+
+@runtime_checkable
+class AbstractAsyncIdempotencyKeyRepository(Protocol):
+    async def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        ...
+
+    def add(self, key: str, line: model.OrderLine, batchref: str) -> None:
+        ...
+
+    async def remove(self, orderid: str, sku: str | None = None) -> None:
+        ...
+
+
+class AsyncSqlAlchemyRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def add(self, batch: model.Batch) -> None:
+        self.session.add(batch)
+
+    async def get(self, reference: str) -> model.Batch:
+        result = await self.session.execute(
+            select(model.Batch)
+            .filter_by(reference=reference)
+            .options(selectinload(model.Batch._allocated_orders))
+        )
+        return result.scalars().one()
+
+    async def list(self) -> list[model.Batch]:
+        result = await self.session.execute(
+            select(model.Batch).options(selectinload(model.Batch._allocated_orders))
+        )
+        return result.scalars().all()
+
+    async def for_sku(self, sku: str) -> list[model.Batch]:
+        result = await self.session.execute(
+            select(model.Batch)
+            .filter_by(sku=sku)
+            .options(selectinload(model.Batch._allocated_orders))
+        )
+        return result.scalars().all()
+
+    async def existing_references(self, references: set[str]) -> set[str]:
+        rows = await self.session.execute(
+            select(orm.batches.c.reference).where(
+                orm.batches.c.reference.in_(sorted(references))
+            )
+        )
+        return {reference for (reference,) in rows}
+
+
+class AsyncSqlAlchemyProductRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    def add(self, product: model.Product) -> None:
+        self.session.add(product)
+
+    async def get(self, sku: str) -> model.Product | None:
+        result = await self.session.execute(
+            select(model.Product)
+            .filter_by(sku=sku)
+            .options(
+                selectinload(model.Product.batches).selectinload(
+                    model.Batch._allocated_orders
+                )
+            )
+        )
+        return result.scalars().first()
+
+
+class AsyncSqlAlchemyAllocationsViewRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add(self, line: model.OrderLine, batchref: str) -> None:
+        await self.session.execute(
+            orm.allocations_view.insert(), _view_rows([(line, batchref)])
+        )
+
+    async def remove(self, line: model.OrderLine) -> None:
+        await self.session.execute(
+            orm.allocations_view.delete().where(_view_row_of(line))
+        )
+
+
+class AsyncSqlAlchemyStockRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.pending: set[str] = set()
+
+    def refresh(self, skus: set[str]) -> None:
+        self.pending |= skus
+
+    async def apply(self) -> None:
+        if not self.pending:
+            return
+        await self.session.flush()
+        await self.session.execute(_lock_products(self.pending))
+        await self.session.execute(_REFRESH_STOCK, dict(skus=sorted(self.pending)))
+        self.pending = set()
+
+
+class AsyncSqlAlchemyIdempotencyKeyRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.pending: list[dict] = []
+
+    async def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        table = orm.idempotency_keys.c
+        result = await self.session.execute(
+            select(table.orderid, table.sku, table.qty, table.batchref).where(
+                table.key == key
+            )
+        )
+        row = result.first()
+        if row is None:
+            return None
+        orderid, sku, qty, batchref = row
+        return model.OrderLine(orderid, sku, qty), batchref
+
+    def add(self, key: str, line: model.OrderLine, batchref: str) -> None:
+        self.pending.append(_key_row(key, line, batchref))
+
+    async def remove(self, orderid: str, sku: str | None = None) -> None:
+        await self.session.execute(
+            orm.idempotency_keys.delete().where(_keys_of(orderid, sku))
+        )
+
+    async def apply(self) -> None:
+        if not self.pending:
+            return
+        try:
+            await self.session.execute(orm.idempotency_keys.insert(), self.pending)
+        except IntegrityError as e:
+            raise DuplicateIdempotencyKey(str(e)) from e
+        self.pending = []
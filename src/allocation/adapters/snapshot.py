@@ -0,0 +1,298 @@
+from __future__ import annotations
+import mmap
+import os
+import struct
+from datetime import date
+
+from src.allocation.domain import model
+
+"""
+메모리 저장소(memory.InMemoryStore)의 커밋된 상태를 담는 바이너리 스냅샷 파일.
+
+새 프로세스가 write-ahead log 전체를 재생하지 않고, 스냅샷을 mmap 으로 연 뒤 그 이후의 로그만 재생해서 시작한다.
+파일을 열 때는 머리말만 읽고, SKU 별 Product 는 처음 조회할 때 파일에서 읽어 만든다.
+따라서 시작 시간은 상태의 크기와 거의 무관하다.
+
+파일 구성 (정수는 모두 little-endian):
+
+    머리말 | 데이터 영역 | SKU 표 | reference 표 | orderid 표 | 멱등 키 표
+
+- 표의 항목은 (키 시작, 키 끝, 값 시작, 값 끝) 위치로 된 고정 크기이고 키(UTF-8 바이트) 순으로 정렬되어 있어 이진 탐색한다.
+- SKU 표의 값은 Product 하나(버전, batch, batch 별 할당), reference 표의 값은 batch 의 SKU,
+  orderid 표의 값은 주문이 할당된 SKU 목록과 allocations 읽기 모델의 행,
+  멱등 키 표의 값은 기록된 순번과 (orderid, sku, qty, batchref) 이다.
+"""
+
+MAGIC = b"ALLOCSNP"
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct("<8sIQIIIIQQQQ")
+ENTRY = struct.Struct("<QQQQ")
+COUNT = struct.Struct("<I")
+PRODUCT = struct.Struct("<qI")
+BATCH = struct.Struct("<qiqI")
+QTY = struct.Struct("<q")
+
+ViewRow = tuple[str, int, str]
+KeyRow = tuple[str, str, str, int, str]
+
+
+def write(
+    path: str,
+    products: dict[str, model.Product],
+    view: dict[str, list[ViewRow]],
+    wal_offset: int = 0,
+    keys: list[KeyRow] | None = None,
+) -> None:
+    """
+    임시 파일에 쓴 뒤 이름을 바꾸므로, 쓰는 도중 중단되어도 기존 스냅샷은 그대로 남는다.
+    wal_offset 은 스냅샷에 이미 반영된 write-ahead log 의 바이트 수다.
+    keys 는 (key, orderid, sku, qty, batchref) 들이며, 기록된 순서(오래된 것 먼저)로 준다.
+    """
+    references: dict[str, str] = {}
+    orders: dict[str, set[str]] = {}
+    for sku, product in products.items():
+        for batch in product.batches:
+            references[batch.reference] = sku
+            for line in batch._allocated_orders:
+                orders.setdefault(line.orderid, set()).add(sku)
+
+    data = bytearray()
+    tables = [
+        _table(data, {sku: _encode_product(p) for sku, p in products.items()}),
+        _table(data, {ref: sku.encode() for ref, sku in references.items()}),
+        _table(
+            data,
+            {
+                orderid: _encode_order(
+                    orders.get(orderid, set()), view.get(orderid, [])
+                )
+                for orderid in orders.keys() | {o for o, rows in view.items() if rows}
+            },
+        ),
+        _table(
+            data,
+            {row[0]: _encode_key(seq, *row[1:]) for seq, row in enumerate(keys or [])},
+        ),
+    ]
+    offset = HEADER.size + len(data)
+    positions = []
+    for entries in tables:
+        positions.append(offset)
+        offset += len(entries)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                wal_offset,
+                *(len(entries) // ENTRY.size for entries in tables),
+                *positions,
+            )
+        )
+        f.write(data)
+        for entries in tables:
+            f.write(entries)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SnapshotReader:
+    """
+    mmap 으로 연 스냅샷. 조회할 때마다 필요한 부분만 읽어 새 객체를 만든다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.wal_offset, *counts_and_positions = HEADER.unpack_from(
+            self._mmap, 0
+        )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an allocation snapshot")
+        counts, positions = counts_and_positions[:4], counts_and_positions[4:]
+        self._skus, self._references, self._orders, self._keys_table = zip(
+            positions, counts
+        )
+
+    def product(self, sku: str) -> model.Product | None:
+        value = self._lookup(self._skus, sku)
+        return _decode_product(sku, value) if value is not None else None
+
+    def skus(self) -> list[str]:
+        return self._keys(self._skus)
+
+    def sku_of(self, reference: str) -> str | None:
+        value = self._lookup(self._references, reference)
+        return value.decode() if value is not None else None
+
+    def orderids(self) -> list[str]:
+        return self._keys(self._orders)
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        value = self._lookup(self._orders, orderid)
+        return _decode_order(value)[0] if value is not None else set()
+
+    def view(self, orderid: str) -> list[ViewRow]:
+        value = self._lookup(self._orders, orderid)
+        return _decode_order(value)[1] if value is not None else []
+
+    def idempotency_keys(self) -> list[KeyRow]:
+        """
+        멱등 키 전체를 기록된 순서(오래된 것 먼저)로 돌려준다.
+        """
+        rows = []
+        for i in range(self._keys_table[1]):
+            key_at, key_end, value_at, value_end = self._entry(self._keys_table, i)
+            seq, *entry = _decode_key(self._mmap[value_at:value_end])
+            rows.append((seq, self._mmap[key_at:key_end].decode(), *entry))
+        return [row[1:] for row in sorted(rows)]
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _entry(self, table: tuple[int, int], i: int) -> tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self._mmap, table[0] + i * ENTRY.size)
+
+    def _lookup(self, table: tuple[int, int], key: str) -> bytes | None:
+        target = key.encode()
+        lo, hi = 0, table[1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_at, key_end, value_at, value_end = self._entry(table, mid)
+            found = self._mmap[key_at:key_end]
+            if found == target:
+                return self._mmap[value_at:value_end]
+            if found < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _keys(self, table: tuple[int, int]) -> list[str]:
+        keys = []
+        for i in range(table[1]):
+            key_at, key_end, _, _ = self._entry(table, i)
+            keys.append(self._mmap[key_at:key_end].decode())
+        return keys
+
+
+def _table(data: bytearray, values: dict[str, bytes]) -> bytes:
+    """
+    키와 값을 data 에 이어 쓰고, 키 순으로 정렬한 표를 돌려준다. 위치는 파일 처음부터의 바이트 수다.
+    """
+    entries = []
+    for key in sorted(k.encode() for k in values):
+        key_at = HEADER.size + len(data)
+        data += key
+        value = values[key.decode()]
+        value_at = HEADER.size + len(data)
+        data += value
+        entries.append(
+            ENTRY.pack(key_at, key_at + len(key), value_at, value_at + len(value))
+        )
+    return b"".join(entries)
+
+
+def _put_str(buf: bytearray, value: str) -> None:
+    raw = value.encode()
+    buf += COUNT.pack(len(raw))
+    buf += raw
+
+
+def _get_str(buf: bytes, pos: int) -> tuple[str, int]:
+    (length,) = COUNT.unpack_from(buf, pos)
+    pos += COUNT.size
+    end = pos + length
+    return buf[pos:end].decode(), end
+
+
+def _encode_product(product: model.Product) -> bytes:
+    buf = bytearray(PRODUCT.pack(product.version_number, len(product.batches)))
+    for batch in product.batches:
+        _put_str(buf, batch.reference)
+        buf += BATCH.pack(
+            batch._purchased_quantity,
+            batch.eta.toordinal() if batch.eta else 0,
+            batch._allocated_quantity,
+            len(batch._allocated_orders),
+        )
+        for line in batch._allocated_orders:
+            _put_str(buf, line.orderid)
+            buf += QTY.pack(line.qty)
+    return bytes(buf)
+
+
+def _decode_product(sku: str, buf: bytes) -> model.Product:
+    version, n_batches = PRODUCT.unpack_from(buf, 0)
+    pos = PRODUCT.size
+    batches = []
+    for _ in range(n_batches):
+        reference, pos = _get_str(buf, pos)
+        purchased, eta, allocated_quantity, n_lines = BATCH.unpack_from(buf, pos)
+        pos += BATCH.size
+        batch = model.Batch(
+            reference, sku, purchased, date.fromordinal(eta) if eta else None
+        )
+        for _ in range(n_lines):
+            orderid, pos = _get_str(buf, pos)
+            (qty,) = QTY.unpack_from(buf, pos)
+            pos += QTY.size
+            batch._allocated_orders.add(model.OrderLine(orderid, sku, qty))
+        batch._allocated_quantity = allocated_quantity
+        batches.append(batch)
+    return model.Product(sku, batches, version)
+
+
+def _encode_order(skus: set[str], rows: list[ViewRow]) -> bytes:
+    buf = bytearray(COUNT.pack(len(skus)))
+    for sku in sorted(skus):
+        _put_str(buf, sku)
+    buf += COUNT.pack(len(rows))
+    for sku, qty, batchref in rows:
+        _put_str(buf, sku)
+        buf += QTY.pack(qty)
+        _put_str(buf, batchref)
+    return bytes(buf)
+
+
+def _decode_order(buf: bytes) -> tuple[set[str], list[ViewRow]]:
+    (n_skus,) = COUNT.unpack_from(buf, 0)
+    pos = COUNT.size
+    skus = set()
+    for _ in range(n_skus):
+        sku, pos = _get_str(buf, pos)
+        skus.add(sku)
+    (n_rows,) = COUNT.unpack_from(buf, pos)
+    pos += COUNT.size
+    rows = []
+    for _ in range(n_rows):
+        sku, pos = _get_str(buf, pos)
+        (qty,) = QTY.unpack_from(buf, pos)
+        pos += QTY.size
+        batchref, pos = _get_str(buf, pos)
+        rows.append((sku, qty, batchref))
+    return skus, rows
+
+
+def _encode_key(seq: int, orderid: str, sku: str, qty: int, batchref: str) -> bytes:
+    buf = bytearray(QTY.pack(seq))
+    _put_str(buf, orderid)
+    _put_str(buf, sku)
+    buf += QTY.pack(qty)
+    _put_str(buf, batchref)
+    return bytes(buf)
+
+
+def _decode_key(buf: bytes) -> tuple[int, str, str, int, str]:
+    (seq,) = QTY.unpack_from(buf, 0)
+    orderid, pos = _get_str(buf, QTY.size)
+    sku, pos = _get_str(buf, pos)
+    (qty,) = QTY.unpack_from(buf, pos)
+    batchref, _ = _get_str(buf, pos + QTY.size)
+    return seq, orderid, sku, qty, batchref
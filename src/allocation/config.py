@@ -9,6 +9,109 @@ def get_postgres_uri() -> str:
     return f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
 
 
+def get_async_postgres_uri() -> str:
+    return get_postgres_uri().replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+def get_engine_options() -> dict:
+    """
+    커넥션 풀 설정. pool_pre_ping 은 커넥션을 꺼낼 때 살아 있는지 확인해 끊어진 커넥션 오류를 막고,
+    pool_recycle 은 지정한 시간(초)보다 오래된 커넥션을 다시 연결한다.
+    """
+    return dict(
+        pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        pool_pre_ping=os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+    )
+
+
+def get_statement_timeout_ms() -> int:
+    """
+    0 이면 statement timeout 을 사용하지 않는다.
+    """
+    return int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+
+
+def get_batch_cache_size() -> int:
+    """
+    프로세스 안의 batch 캐시에 담을 최대 batch 수. 0 이면 캐시를 사용하지 않는다.
+    """
+    return int(os.environ.get("BATCH_CACHE_SIZE", 0))
+
+
+def get_idempotency_cache_size() -> int:
+    """
+    프로세스 안의 멱등 키 캐시에 담을 최대 키 수. 0 이면 캐시 없이 매번 DB 의 idempotency_keys 를 확인한다.
+    """
+    return int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 0))
+
+
+def get_metrics_enabled() -> bool:
+    """
+    지연 시간 측정(/metrics) 사용 여부. 꺼져 있으면 측정 지점에서 아무것도 기록하지 않는다.
+    """
+    return os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+
+
+def get_query_profile_enabled() -> bool:
+    """
+    작업 단위마다 SQL 문 수와 DB 시간을 세고, N+1 패턴을 로그로 경고할지 여부
+    """
+    return os.environ.get("DB_QUERY_PROFILE", "false").lower() == "true"
+
+
+def get_sql_allocation_enabled() -> bool:
+    """
+    할당을 도메인 객체 대신 DB 에서 SQL 로 처리할지 여부 (repository.AbstractAllocatingRepository)
+    group commit 으로 묶어서 처리하는 요청에는 적용되지 않는다.
+    """
+    return os.environ.get("SQL_ALLOCATION", "false").lower() == "true"
+
+
+def get_group_commit_window_ms() -> float:
+    """
+    group commit 에서 첫 요청 뒤에 다른 요청을 더 기다리는 시간(ms). 0 이면 group commit 을 사용하지 않는다.
+    """
+    return float(os.environ.get("GROUP_COMMIT_WINDOW_MS", 0))
+
+
+def get_group_commit_max_batch() -> int:
+    """
+    group commit 한 번에 묶는 최대 요청 수. 이만큼 모이면 기다리지 않고 바로 커밋한다.
+    """
+    return int(os.environ.get("GROUP_COMMIT_MAX_BATCH", 64))
+
+
+def get_sku_workers() -> int:
+    """
+    SKU 별 단일 writer 작업 스레드 수. 0 이면 요청 스레드에서 바로 처리한다.
+    """
+    return int(os.environ.get("SKU_WORKERS", 0))
+
+
+def get_sku_queue_size() -> int:
+    """
+    작업 스레드마다 대기할 수 있는 최대 요청 수
+    """
+    return int(os.environ.get("SKU_QUEUE_SIZE", 256))
+
+
+def get_sku_queue_timeout_ms() -> float:
+    """
+    큐가 가득 찼을 때 자리가 나기를 기다리는 시간(ms). 지나면 요청을 거절한다(503).
+    """
+    return float(os.environ.get("SKU_QUEUE_TIMEOUT_MS", 100))
+
+
+def get_stock_max_age() -> int:
+    """
+    재고 요약(/stock) 응답을 클라이언트와 프록시가 캐시할 수 있는 시간(초). 0 이면 매번 다시 확인한다.
+    """
+    return int(os.environ.get("STOCK_MAX_AGE", 5))
+
+
 def get_api_url() -> str:
     host = os.environ.get("API_HOST", "localhost")
     port = 5000 if host == "localhost" else 80
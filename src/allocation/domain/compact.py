@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from datetime import date
+
+from . import model
+
+"""
+메모리를 적게 쓰는 도메인 객체 표현.
+model.OrderLine/Batch 는 SQLAlchemy 매핑(orm.start_mappers)의 대상이라 인스턴스마다 __dict__ 와 매핑 상태를 갖는데,
+매핑은 __slots__ 를 사용하는 클래스를 지원하지 않는다.
+DB 를 거치지 않고 메모리에서 대량으로 할당하는 경우(계획용 재할당 등)에는 __slots__ 기반의 아래 클래스를 사용한다.
+
+Batch 는 model.Batch 와 같은 model.BatchMixin 의 동작을 상속하고 저장 방식(__slots__)만 다르다.
+속성과 메서드 이름이 model 의 클래스와 같으므로 model.allocate, model.deallocate, model.Product 에 그대로 사용할 수 있다.
+"""
+
+
+@dataclass(unsafe_hash=True, slots=True)
+class OrderLine:
+    orderid: str
+    sku: str
+    qty: int
+
+
+class Batch(model.BatchMixin):
+    __slots__ = (
+        "reference",
+        "sku",
+        "eta",
+        "_purchased_quantity",
+        "_allocated_quantity",
+        "_allocated_orders",
+    )
+
+    def __init__(self, reference: str, sku: str, qty: int, eta: date | None = None):
+        self.reference = reference
+        self.sku = sku
+        self.eta = eta
+        self._purchased_quantity = qty
+        self._allocated_quantity = 0
+        self._allocated_orders: set[OrderLine] = set()
+
+
+def from_order_line(line: model.OrderLine) -> OrderLine:
+    return OrderLine(line.orderid, line.sku, line.qty)
+
+
+def from_batch(batch: model.Batch) -> Batch:
+    compact = Batch(batch.reference, batch.sku, batch._purchased_quantity, batch.eta)
+    compact._allocated_orders = {
+        from_order_line(line) for line in batch._allocated_orders
+    }
+    compact._allocated_quantity = batch._allocated_quantity
+    return compact
@@ -1,3 +1,4 @@
+import bisect
 from dataclasses import dataclass
 from datetime import date
 
@@ -14,20 +15,20 @@ class OrderLine:
     qty: int
 
 
-# 엔티티 (entity) : 일부 값이 바뀌어도 특정 식별 값에 의해 동일하다고 판단할 수 있는 영속적인 정체성을 갖는 도메인 객체
-class Batch:
-    def __init__(self, reference: str, sku: str, qty: int, eta: date | None = None):
-        self.reference = reference
-        self.sku = sku
-        self._purchased_quantity = qty
-        self.eta = eta
-        self._allocated_orders: set[OrderLine] = set()
+class BatchMixin:
+    """
+    Batch 의 동작(할당/해제, 동일성, 정렬). 상태의 저장 방식은 상속하는 클래스가 정한다.
+    Batch 는 ORM 매핑을 위해 인스턴스의 __dict__ 에, compact.Batch 는 __slots__ 에 같은 이름의 속성을 둔다.
+    __slots__ = () 이므로 __slots__ 만 쓰는 클래스에 __dict__ 를 더하지 않는다.
+    """
+
+    __slots__ = ()
 
     def __repr__(self):
         return f"Batch {self.reference}"
 
     def __eq__(self, other):
-        if not isinstance(other, Batch):
+        if not isinstance(other, type(self)):
             return False
         return self.reference == other.reference
 
@@ -44,15 +45,27 @@ class Batch:
         return self.eta > other.eta
 
     def allocate(self, order_line: OrderLine) -> None:
+        if order_line in self._allocated_orders:
+            return
         if self.can_allocate(order_line):
             self._allocated_orders.add(order_line)
+            self._allocated_quantity += order_line.qty
 
     def can_allocate(self, order_line: OrderLine) -> bool:
         return self.sku == order_line.sku and self.available_quantity >= order_line.qty
 
-    def deallocate(self, order_line: OrderLine) -> None:
-        if order_line in self._allocated_orders:
-            self._allocated_orders.remove(order_line)
+    def deallocate(self, order_line: OrderLine) -> bool:
+        """
+        라인이 이 batch 에 할당되어 있지 않으면(수량이 다른 경우 포함) 아무것도 하지 않고 False 를 돌려준다.
+        """
+        if order_line not in self._allocated_orders:
+            return False
+        self._allocated_orders.remove(order_line)
+        self._allocated_quantity -= order_line.qty
+        return True
+
+    def lines_for_order(self, orderid: str) -> list[OrderLine]:
+        return [line for line in self._allocated_orders if line.orderid == orderid]
 
     @property
     def available_quantity(self) -> int:
@@ -60,22 +73,105 @@ class Batch:
 
     @property
     def allocated_quantity(self) -> int:
-        return sum(line.qty for line in self._allocated_orders)
+        return self._allocated_quantity
+
+
+# 엔티티 (entity) : 일부 값이 바뀌어도 특정 식별 값에 의해 동일하다고 판단할 수 있는 영속적인 정체성을 갖는 도메인 객체
+class Batch(BatchMixin):
+    def __init__(self, reference: str, sku: str, qty: int, eta: date | None = None):
+        self.reference = reference
+        self.sku = sku
+        self._purchased_quantity = qty
+        self.eta = eta
+        self._allocated_orders: set[OrderLine] = set()
+        # 할당된 수량의 합계를 읽을 때마다 계산하지 않도록 allocate/deallocate 에서 함께 갱신한다.
+        # batches 테이블의 컬럼으로도 저장되므로 할당 라인을 로딩하지 않고도 조회할 수 있다.
+        self._allocated_quantity = 0
+
+
+def eta_order(batch: Batch) -> tuple[bool, date]:
+    """
+    Batch.__gt__ 와 같은 순서(eta=None 우선, 그 다음 eta 가 빠른 순)를 나타내는 정렬 키.
+    sorted() 가 파이썬 레벨의 __gt__ 를 매번 호출하는 대신 튜플 비교를 하도록 key 로 사용한다.
+    """
+    return batch.eta is not None, batch.eta or date.min
 
 
 # 여러 배치를 인자로 받는 allocate 함수 생성
 def allocate(order_line: OrderLine, batches: list[Batch]) -> str:
+    return _allocate_in_order(order_line, sorted(batches, key=eta_order))
+
+
+def _allocate_in_order(order_line: OrderLine, ordered: list[Batch]) -> str:
     try:
-        batch = next(b for b in sorted(batches) if b.can_allocate(order_line))
+        batch = next(b for b in ordered if b.can_allocate(order_line))
         batch.allocate(order_line)
     except StopIteration as e:
         raise OutOfStock(f"Out of stock for sku {order_line.sku}") from e
     return batch.reference
 
 
-def deallocate(order_line: OrderLine, batches: list[Batch]) -> None:
-    for b in batches:
-        b.deallocate(order_line)
+class Product:
+    """
+    같은 SKU 의 batch 들을 묶고, ETA 순서로 정렬된 batch 목록을 캐싱한다.
+    같은 SKU 에 대해 여러 번 할당할 때 매번 정렬하지 않으며,
+    batch 가 추가되면 정렬된 위치에 끼워 넣고, batch 의 eta 가 바뀌면 캐시를 버린다.
+    캐시는 Product 객체에 있으므로, 요청마다 DB 에서 새로 로딩하는 경우에는 정렬을 아끼지 못한다.
+    대신 ORM 이 batches 를 할당 순서로 로딩하므로(orm.start_mappers) 로딩한 순서를 그대로 쓰고 정렬하지 않는다.
+
+    version_number : 할당 상태가 바뀔 때마다 증가하는 버전 번호(낙관적 동시성 제어).
+    같은 버전을 읽은 두 트랜잭션 중 나중에 커밋하는 쪽은 충돌로 실패한다.
+    """
+
+    # ORM 으로 로딩할 때는 __init__ 이 호출되지 않으므로 클래스 속성으로 기본값을 둔다.
+    _ordered: list[Batch] | None = None
+    # batches 가 이미 할당 순서로 정렬되어 있는지. ORM 으로 로딩하면 True 가 된다.
+    _batches_ordered: bool = False
+
+    def __init__(self, sku: str, batches: list[Batch], version_number: int = 0):
+        self.sku = sku
+        self.batches = list(batches)
+        self.version_number = version_number
+        self._ordered = None
+
+    def add_batch(self, batch: Batch) -> None:
+        self.batches.append(batch)
+        self._batches_ordered = False
+        if self._ordered is not None:
+            bisect.insort(self._ordered, batch, key=eta_order)
+
+    def change_batch_eta(self, reference: str, eta: date | None) -> None:
+        batch = next(b for b in self.batches if b.reference == reference)
+        batch.eta = eta
+        self._batches_ordered = False
+        self._ordered = None
+
+    def allocate(self, order_line: OrderLine) -> str:
+        if self._ordered is None:
+            if self._batches_ordered:
+                self._ordered = list(self.batches)
+            else:
+                self._ordered = sorted(self.batches, key=eta_order)
+        batchref = _allocate_in_order(order_line, self._ordered)
+        self.version_number += 1
+        return batchref
+
+    def deallocate(
+        self, order_line: OrderLine, batches: list[Batch] | None = None
+    ) -> list[Batch]:
+        """
+        batches : 라인이 할당된 batch 를 이미 알고 있다면 전달한다. 그 batch 들에서만 해제하므로
+        이 product 의 batch 전체를 읽지 않아도 된다.
+        라인을 해제한 batch 들을 돌려준다. 해제한 것이 없으면 버전 번호도 올리지 않는다.
+        """
+        freed = deallocate(order_line, self.batches if batches is None else batches)
+        if freed:
+            self.version_number += 1
+        return freed
+
+
+def deallocate(order_line: OrderLine, batches: list[Batch]) -> list[Batch]:
+    return [b for b in batches if b.deallocate(order_line)]
 
 
 class OutOfStock(Exception):
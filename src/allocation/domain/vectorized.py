@@ -0,0 +1,131 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+from . import model
+
+"""
+NumPy 를 사용한 대량 할당 엔진. 주문 라인 전체를 예상 batch 들에 다시 할당해 보는 계획용(what-if) 실행에 사용한다.
+
+model.allocate 를 라인마다 순서대로 호출한 것과 같은 결과를 낸다.
+- 각 라인은 같은 SKU 의 batch 중 eta 순서(eta=None 우선, 같은 eta 는 입력 순서)로 처음 들어가는 batch 에 할당된다.
+- 들어갈 batch 가 없는 라인(OutOfStock)은 -1 이 되며, 남은 라인의 할당은 계속된다.
+- 같은 라인(orderid, sku, qty 가 모두 같은)이 중복해서 들어오지 않는다고 가정한다.
+
+batch 객체는 바꾸지 않고 할당 결과(batch 의 인덱스)만 돌려준다.
+"""
+
+# 한 번에 할당해 보는 라인 수의 최소/최대값. batch 가 가득 차는 일이 드물수록 큰 값이 빠르다.
+WINDOW = 32
+MAX_WINDOW = 8192
+
+
+def allocate_arrays(
+    line_skus: np.ndarray,
+    line_qtys: np.ndarray,
+    batch_skus: np.ndarray,
+    batch_available: np.ndarray,
+    batch_etas: np.ndarray,
+) -> np.ndarray:
+    """
+    line_* 는 할당 순서대로 나열한 라인, batch_* 는 batch 의 배열이다.
+    SKU 는 문자열이나 정수 코드 배열이며, 정수 코드가 정렬이 빠르다.
+    batch_etas 는 datetime64[D] 배열이며 eta 가 없는 batch 는 NaT 이다.
+    라인마다 할당된 batch 의 인덱스(batch_* 배열 기준)를 돌려주고, 할당할 수 없는 라인은 -1 이다.
+    """
+    line_qtys = np.asarray(line_qtys, dtype=np.int64)
+    batch_available = np.asarray(batch_available, dtype=np.int64)
+    batch_etas = np.asarray(batch_etas, dtype="datetime64[D]")
+    result = np.full(len(line_qtys), -1, dtype=np.int64)
+
+    # SKU, eta 가 있는지, eta, 입력 순서로 정렬한다 (lexsort 는 마지막 키가 우선).
+    batch_order = np.lexsort(
+        (
+            np.arange(len(batch_skus)),
+            batch_etas.view(np.int64),
+            ~np.isnat(batch_etas),
+            batch_skus,
+        )
+    )
+    sorted_batch_skus = np.asarray(batch_skus)[batch_order]
+    line_order = np.argsort(line_skus, kind="stable")
+    sorted_line_skus = np.asarray(line_skus)[line_order]
+
+    skus, starts = np.unique(sorted_line_skus, return_index=True)
+    ends = np.append(starts[1:], len(sorted_line_skus))
+    batch_starts = np.searchsorted(sorted_batch_skus, skus, side="left")
+    batch_ends = np.searchsorted(sorted_batch_skus, skus, side="right")
+
+    for start, end, batch_start, batch_end in zip(
+        starts, ends, batch_starts, batch_ends
+    ):
+        lines = line_order[start:end]
+        batches = batch_order[batch_start:batch_end]
+        positions = _allocate_sku(line_qtys[lines], batch_available[batches].copy())
+        allocated = positions >= 0
+        result[lines[allocated]] = batches[positions[allocated]]
+    return result
+
+
+def _allocate_sku(qtys: np.ndarray, available: np.ndarray) -> np.ndarray:
+    """
+    한 SKU 의 라인들을 eta 순서로 정렬된 batch 들에 할당한다. available 은 할당하면서 줄어든다.
+
+    WINDOW 개의 라인에 대해 현재 남은 수량 기준으로 처음 들어가는 batch 를 한 번에 구한다
+    (남은 수량의 누적 최댓값이 처음으로 라인 수량 이상이 되는 위치).
+    앞선 라인들이 같은 batch 를 채우면서 남은 수량이 모자라게 되는 첫 라인 전까지는 이 결과가 순서대로
+    할당한 것과 같다. 앞쪽 batch 의 남은 수량은 줄어들기만 하므로 새로 들어갈 수 있게 되지 않기 때문이다.
+    그 라인들을 할당하고, 모자라게 된 라인부터 다시 구한다.
+    """
+    positions = np.full(len(qtys), -1, dtype=np.int64)
+    if len(available) == 0:
+        return positions
+    i, size = 0, WINDOW
+    while i < len(qtys):
+        end = min(i + size, len(qtys))
+        window = qtys[i:end]
+        targets = np.searchsorted(np.maximum.accumulate(available), window)
+        in_stock = targets < len(available)
+
+        # 같은 batch 로 가는 라인들의 (자기 자신까지의) 누적 수량
+        order = np.argsort(targets, kind="stable")
+        sorted_targets, sorted_qtys = targets[order], window[order]
+        cumulative = np.cumsum(sorted_qtys)
+        segment = np.searchsorted(sorted_targets, sorted_targets)
+        used = np.empty_like(cumulative)
+        used[order] = cumulative - cumulative[segment] + sorted_qtys[segment]
+
+        capacity = available[np.minimum(targets, len(available) - 1)]
+        ok = ~in_stock | (used <= capacity)
+        run = len(window) if ok.all() else int(ok.argmin())
+
+        allocated = in_stock[:run]
+        positions[i:end][:run][allocated] = targets[:run][allocated]
+        np.subtract.at(available, targets[:run][allocated], window[:run][allocated])
+        i += run
+        # 직전에 이어서 할당된 라인 수에 맞춰 다음에 검사할 라인 수를 조절한다.
+        size = min(max(2 * run, WINDOW), MAX_WINDOW)
+    return positions
+
+
+def allocate(
+    lines: Sequence[model.OrderLine], batches: Sequence[model.Batch]
+) -> list[str | None]:
+    """
+    model 객체를 받아 라인마다 할당될 batch 의 reference 를 돌려준다 (할당할 수 없으면 None).
+    """
+    batch_available = np.fromiter(
+        (b.available_quantity for b in batches), dtype=np.int64, count=len(batches)
+    )
+    batch_etas = np.array(
+        [b.eta if b.eta is not None else "NaT" for b in batches],
+        dtype="datetime64[D]",
+    )
+    indexes = allocate_arrays(
+        np.array([line.sku for line in lines]),
+        np.fromiter((line.qty for line in lines), dtype=np.int64, count=len(lines)),
+        np.array([b.sku for b in batches]),
+        batch_available,
+        batch_etas,
+    )
+    return [batches[i].reference if i >= 0 else None for i in indexes]
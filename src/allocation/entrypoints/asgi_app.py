@@ -0,0 +1,127 @@
+import json
+from datetime import date, datetime
+
+from src.allocation.domain import model
+from src.allocation.adapters import orm
+from src.allocation.service_layer import async_services, services
+from src.allocation.service_layer.unit_of_work import AsyncSqlAlchemyUnitOfWork
+
+"""
+flask_app 과 같은 /allocate, /deallocate, /batch 를 제공하는 asyncio(ASGI) 엔트리포인트.
+프레임워크 없이 ASGI 규약만 구현하며, 요청 처리 중 DB 를 기다리는 동안 다른 요청을 처리할 수 있다.
+
+    uvicorn src.allocation.entrypoints.asgi_app:app
+"""
+
+orm.start_mappers()
+
+
+def parse_eta(eta: str | None) -> date | None:
+    if eta is not None:
+        return datetime.fromisoformat(eta).date()
+    return None
+
+
+async def allocate_endpoint(body: dict, headers: dict) -> tuple[int, dict | str]:
+    # flask_app 과 같이, 클라이언트가 키를 보내지 않으면 orderid 와 sku 가 멱등 키가 된다.
+    try:
+        batchref = await async_services.allocate(
+            body["orderid"],
+            body["sku"],
+            body["qty"],
+            AsyncSqlAlchemyUnitOfWork(),
+            headers.get("idempotency-key"),
+        )
+    except (model.OutOfStock, services.InvalidSku) as e:
+        return 400, {"message": str(e)}
+    except services.IdempotencyConflict as e:
+        return 409, {"message": str(e)}
+
+    return 201, {"batchref": batchref}
+
+
+async def deallocate_endpoint(body: dict, headers: dict) -> tuple[int, dict | str]:
+    await async_services.deallocate(
+        body["orderid"], body["sku"], body["qty"], AsyncSqlAlchemyUnitOfWork()
+    )
+    return 200, "OK"
+
+
+async def add_batch(body: dict, headers: dict) -> tuple[int, dict | str]:
+    try:
+        await async_services.add_batch(
+            body["ref"],
+            body["sku"],
+            body["qty"],
+            parse_eta(body["eta"]),
+            AsyncSqlAlchemyUnitOfWork(),
+        )
+    except services.DuplicateBatch as e:
+        return 409, {"message": str(e)}
+    return 201, "OK"
+
+
+ROUTES = {
+    ("POST", "/allocate"): allocate_endpoint,
+    ("POST", "/deallocate"): deallocate_endpoint,
+    ("POST", "/batch"): add_batch,
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    endpoint = ROUTES.get((scope["method"], scope["path"]))
+    if endpoint is None:
+        await respond(send, 404, {"message": "Not Found"})
+        return
+
+    body = json.loads(await read_body(receive))
+    status, payload = await endpoint(body, read_headers(scope))
+    await respond(send, status, payload)
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def read_headers(scope) -> dict[str, str]:
+    """
+    ASGI 는 헤더를 소문자 이름의 (bytes, bytes) 목록으로 전달한다.
+    """
+    return {
+        name.decode("latin-1"): value.decode("latin-1")
+        for name, value in scope["headers"]
+    }
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def respond(send, status: int, payload: dict | str) -> None:
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), b"text/plain; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload).encode(), b"application/json"
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type)],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
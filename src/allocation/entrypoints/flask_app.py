@@ -1,10 +1,21 @@
-from datetime import datetime
-from flask import Flask, jsonify, request
+import json
+import time
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime
 
+from flask import Flask, g, jsonify, request
+
+from src.allocation import config, views
 from src.allocation.domain import model
-from src.allocation.adapters import orm
+from src.allocation.adapters import metrics, orm
 from src.allocation.service_layer import services
-from src.allocation.service_layer.unit_of_work import SqlAlchemyUnitOfWork
+from src.allocation.service_layer.dispatcher import Overloaded, get_dispatcher
+from src.allocation.service_layer.group_commit import get_group_committer
+from src.allocation.service_layer.unit_of_work import (
+    SqlAlchemyUnitOfWork,
+    get_batch_cache,
+    pool_stats,
+)
 
 """
 플라스크 앱의 책임은 표준적인 웹 기능일 뿐이다. 요청 전 상태를 관리하고 POST 파라미터로부터 정보를 파싱하며
@@ -16,42 +27,184 @@ app = Flask(__name__)
 orm.start_mappers()
 
 
+@app.before_request
+def start_timer():
+    if metrics.REGISTRY.enabled:
+        g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    # 요청 파싱부터 응답 생성까지(라우트 함수 전체)의 시간을 엔드포인트별로 기록한다.
+    start = g.pop("request_start", None)
+    if start is not None and request.endpoint is not None:
+        metrics.REGISTRY.observe(
+            f"route.{request.endpoint}", time.perf_counter() - start
+        )
+    return response
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e: Overloaded):
+    # SKU 작업 스레드의 큐가 가득 찼다. 잠시 뒤에 다시 시도하도록 알린다.
+    return jsonify({"message": str(e)}), 503, {"Retry-After": "1"}
+
+
 @app.route("/allocate", methods=["POST"])
 def allocate_endpoint():
+    body = request.json
+    line = body["orderid"], body["sku"], body["qty"]
+    # 클라이언트가 키를 보내지 않으면 orderid 와 sku 가 멱등 키가 된다 (services.default_idempotency_key).
+    key = request.headers.get("Idempotency-Key")
+    # group commit 과 SKU 별 작업 스레드가 모두 설정되어 있으면 group commit 을 사용한다.
+    committer, dispatcher = get_group_committer(), get_dispatcher()
     try:
-        batchref = services.allocate(
-            request.json["orderid"],
-            request.json["sku"],
-            request.json["qty"],
-            SqlAlchemyUnitOfWork(),
-        )
+        if committer is not None:
+            batchref = committer.allocate(*line, key)
+        elif dispatcher is not None:
+            batchref = dispatcher.allocate(*line, key)
+        else:
+            batchref = services.allocate(*line, SqlAlchemyUnitOfWork(), key)
     except (model.OutOfStock, services.InvalidSku) as e:
         return jsonify({"message": str(e)}), 400
+    except services.IdempotencyConflict as e:
+        return jsonify({"message": str(e)}), 409
 
     return jsonify({"batchref": batchref}), 201
 
 
+@app.route("/allocate/bulk", methods=["POST"])
+def allocate_bulk_endpoint():
+    lines = [(x["orderid"], x["sku"], x["qty"]) for x in request.json["lines"]]
+    results = services.allocate_many(lines, SqlAlchemyUnitOfWork())
+
+    body = []
+    for (orderid, sku, _), result in zip(lines, results):
+        if isinstance(result, Exception):
+            body.append({"orderid": orderid, "sku": sku, "message": str(result)})
+        else:
+            body.append({"orderid": orderid, "sku": sku, "batchref": result})
+    return jsonify({"results": body}), 200
+
+
 @app.route("/deallocate", methods=["POST"])
 def deallocate_endpoint():
-    services.deallocate(
-        request.json["orderid"],
-        request.json["sku"],
-        request.json["qty"],
-        SqlAlchemyUnitOfWork(),
-    )
+    body = request.json
+    line = body["orderid"], body["sku"], body["qty"]
+    dispatcher = get_dispatcher()
+    if dispatcher is not None:
+        dispatcher.deallocate(*line)
+    else:
+        services.deallocate(*line, SqlAlchemyUnitOfWork())
     return "OK", 200
 
 
+@app.route("/allocations/<orderid>", methods=["GET"])
+def allocations_view_endpoint(orderid: str):
+    result = views.allocations(orderid, SqlAlchemyUnitOfWork())
+    if not result:
+        return "not found", 404
+    return jsonify(result), 200
+
+
+@app.route("/allocations/<orderid>", methods=["DELETE"])
+def cancel_order_endpoint(orderid: str):
+    count = services.deallocate_order(orderid, SqlAlchemyUnitOfWork())
+    return jsonify({"deallocated": count}), 200
+
+
+def stock_response(body):
+    """
+    재고 요약은 잠시 오래된 값이어도 되므로 max-age 동안 캐시하게 하고, 그 뒤에는 ETag 로 다시 확인하게 한다.
+    """
+    response = jsonify(body)
+    response.cache_control.public = True
+    response.cache_control.max_age = config.get_stock_max_age()
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route("/stock/<sku>", methods=["GET"])
+def stock_endpoint(sku: str):
+    result = views.stock([sku], SqlAlchemyUnitOfWork())
+    if not result:
+        return "not found", 404
+    return stock_response(result[0])
+
+
+@app.route("/stock", methods=["GET"])
+def stock_many_endpoint():
+    # GET /stock?sku=A&sku=B : 없는 SKU 는 결과에서 빠진다.
+    return stock_response(
+        views.stock(request.args.getlist("sku"), SqlAlchemyUnitOfWork())
+    )
+
+
+@app.route("/batches/<sku>", methods=["GET"])
+def batches_view_endpoint(sku: str):
+    result = views.batches(sku, SqlAlchemyUnitOfWork())
+    if not result:
+        return "not found", 404
+    return jsonify(result), 200
+
+
+def parse_eta(eta: str | None) -> date | None:
+    if eta is not None:
+        return datetime.fromisoformat(eta).date()
+    return None
+
+
+@app.errorhandler(services.DuplicateBatch)
+def duplicate_batch(e: services.DuplicateBatch):
+    return jsonify({"message": str(e)}), 409
+
+
 @app.route("/batch", methods=["POST"])
 def add_batch():
-    eta = request.json["eta"]
-    if eta is not None:
-        eta = datetime.fromisoformat(eta).date()
     services.add_batch(
         request.json["ref"],
         request.json["sku"],
         request.json["qty"],
-        eta,
+        parse_eta(request.json["eta"]),
         SqlAlchemyUnitOfWork(),
     )
     return "OK", 201
+
+
+def batch_rows(items: Iterable[dict]) -> Iterator[tuple]:
+    for item in items:
+        yield item["ref"], item["sku"], item["qty"], parse_eta(item.get("eta"))
+
+
+@app.route("/batches", methods=["POST"])
+def add_batches():
+    """
+    application/x-ndjson 요청은 본문 전체를 읽지 않고 한 줄(batch 하나)씩 스트리밍하며,
+    그 외에는 JSON 배열로 받는다.
+    """
+    if request.mimetype == "application/x-ndjson":
+        items = (json.loads(line) for line in request.stream if line.strip())
+    else:
+        items = request.json
+    count = services.add_batches(batch_rows(items), SqlAlchemyUnitOfWork())
+    return jsonify({"count": count}), 201
+
+
+@app.route("/stats/pool", methods=["GET"])
+def pool_stats_endpoint():
+    return jsonify(pool_stats()), 200
+
+
+@app.route("/stats/cache", methods=["GET"])
+def cache_stats_endpoint():
+    cache = get_batch_cache()
+    return jsonify(cache.stats() if cache else {"enabled": False}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return (
+        metrics.REGISTRY.render(),
+        200,
+        {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
@@ -0,0 +1,94 @@
+import asyncio
+import random
+from collections.abc import Awaitable, Callable
+from datetime import date
+from typing import TypeVar
+
+from ..domain import model
+from .services import (
+    BACKOFF_SECONDS,
+    MAX_ATTEMPTS,
+    DuplicateBatch,
+    InvalidSku,
+    default_idempotency_key,
+    replayed_batchref,
+)
+from .unit_of_work import AbstractAsyncUnitOfWork, ConcurrencyError
+
+"""
+services 모듈과 같은 유스 케이스를 asyncio 작업 단위로 실행한다.
+DB 를 기다리는 동안 이벤트 루프가 다른 요청을 처리하므로, 하나의 프로세스에서 많은 할당 요청을 동시에 진행할 수 있다.
+도메인 로직(model.Product)은 동기 버전과 그대로 공유한다.
+"""
+
+T = TypeVar("T")
+
+
+async def retry_on_conflict(fn: Callable[[], Awaitable[T]]) -> T:
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return await fn()
+        except ConcurrencyError:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            await asyncio.sleep(BACKOFF_SECONDS * 2 ** (attempt - 1) * random.random())
+
+
+async def allocate(
+    orderid: str,
+    sku: str,
+    qty: int,
+    uow: AbstractAsyncUnitOfWork,
+    idempotency_key: str | None = None,
+) -> str:
+    key = idempotency_key or default_idempotency_key(orderid, sku)
+
+    async def _allocate() -> str:
+        line = model.OrderLine(orderid, sku, qty)
+        async with uow:
+            recorded = await uow.idempotency_keys.get(key)
+            if recorded is not None:
+                return replayed_batchref(key, line, recorded)
+            product = await uow.products.get(sku=line.sku)
+            if product is None:
+                raise InvalidSku(f"Invalid sku {line.sku}")
+            batchref = product.allocate(line)
+            await uow.allocations_view.add(line, batchref)
+            uow.idempotency_keys.add(key, line, batchref)
+            uow.stock.refresh({line.sku})
+            await uow.commit()
+        return batchref
+
+    return await retry_on_conflict(_allocate)
+
+
+async def add_batch(
+    ref: str, sku: str, qty: int, eta: date | None, uow: AbstractAsyncUnitOfWork
+) -> None:
+    async with uow:
+        if await uow.batches.existing_references({ref}):
+            raise DuplicateBatch(f"Duplicate batch reference {ref}")
+        product = await uow.products.get(sku=sku)
+        if product is None:
+            product = model.Product(sku, batches=[])
+            uow.products.add(product)
+        product.add_batch(model.Batch(ref, sku, qty, eta))
+        uow.stock.refresh({sku})
+        await uow.commit()
+
+
+async def deallocate(
+    orderid: str, sku: str, qty: int, uow: AbstractAsyncUnitOfWork
+) -> None:
+    async def _deallocate() -> None:
+        line = model.OrderLine(orderid, sku, qty)
+        async with uow:
+            product = await uow.products.get(sku=line.sku)
+            # 수량이 다르면 해제한 것이 없으므로, 할당과 멱등 키를 그대로 둔다.
+            if product is not None and product.deallocate(line):
+                await uow.allocations_view.remove(line)
+                await uow.idempotency_keys.remove(orderid, sku)
+                uow.stock.refresh({line.sku})
+            await uow.commit()
+
+    await retry_on_conflict(_deallocate)
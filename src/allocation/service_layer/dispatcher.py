@@ -0,0 +1,117 @@
+from __future__ import annotations
+import functools
+import queue
+import threading
+import zlib
+from collections.abc import Callable
+from concurrent.futures import Future
+
+from .. import config
+from . import services
+from .unit_of_work import AbstractUnitOfWork, SqlAlchemyUnitOfWork
+
+"""
+SKU 별 단일 writer : 같은 SKU 의 할당/해제를 항상 같은 작업 스레드에서 순서대로 실행한다.
+
+경합은 SKU 단위로만 생기므로, SKU 를 해시해 고정된 수의 작업 스레드 중 하나에 보낸다.
+같은 SKU 의 변경은 한 스레드에서 차례로 실행되어 이 프로세스 안에서는 서로 충돌(ConcurrencyError)하지 않고,
+다른 스레드에 배정된 SKU 들은 동시에 처리된다. 다른 프로세스와의 충돌은 여전히 DB 의 버전 검사와 재시도로 처리한다.
+
+작업 스레드마다 크기가 제한된 큐를 두고, 큐가 가득 차서 put_timeout 안에 넣지 못하면 Overloaded 를 올린다
+(엔트리포인트는 503 으로 응답해 클라이언트가 나중에 다시 시도하게 한다).
+"""
+
+
+class Overloaded(Exception):
+    """
+    SKU 를 처리하는 작업 스레드의 큐가 가득 찬 경우
+    """
+
+
+class SkuDispatcher:
+    def __init__(
+        self,
+        uow_factory: Callable[[], AbstractUnitOfWork],
+        workers: int = 4,
+        queue_size: int = 256,
+        put_timeout: float = 0.1,
+    ):
+        self.uow_factory = uow_factory
+        self.put_timeout = put_timeout
+        self._queues: list[queue.Queue] = [
+            queue.Queue(maxsize=queue_size) for _ in range(workers)
+        ]
+        self._threads = [
+            threading.Thread(
+                target=self._run, args=(q,), name=f"sku-worker-{i}", daemon=True
+            )
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def worker_for(self, sku: str) -> int:
+        # hash() 는 프로세스마다 달라지므로, 배정이 항상 같도록 crc32 를 사용한다.
+        return zlib.crc32(sku.encode()) % len(self._queues)
+
+    def submit(self, sku: str, fn: Callable, *args) -> Future:
+        """
+        fn(*args, uow) 를 sku 의 작업 스레드에서 실행한다.
+        """
+        future: Future = Future()
+        try:
+            self._queues[self.worker_for(sku)].put(
+                (fn, args, future), timeout=self.put_timeout
+            )
+        except queue.Full as e:
+            raise Overloaded(f"too many pending requests for sku {sku}") from e
+        return future
+
+    def allocate(
+        self, orderid: str, sku: str, qty: int, idempotency_key: str | None = None
+    ) -> str:
+        allocate = functools.partial(services.allocate, idempotency_key=idempotency_key)
+        return self.submit(sku, allocate, orderid, sku, qty).result()
+
+    def deallocate(self, orderid: str, sku: str, qty: int) -> None:
+        self.submit(sku, services.deallocate, orderid, sku, qty).result()
+
+    def close(self) -> None:
+        """
+        이미 큐에 들어온 작업은 실행한 뒤 작업 스레드를 멈춘다.
+        """
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self, jobs: queue.Queue) -> None:
+        while (job := jobs.get()) is not None:
+            fn, args, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, self.uow_factory()))
+            except Exception as e:
+                future.set_exception(e)
+
+
+_dispatcher: SkuDispatcher | None = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> SkuDispatcher | None:
+    """
+    프로세스의 모든 요청이 공유하는 SkuDispatcher. 설정(SKU_WORKERS)으로 켜지 않았으면 None 이다.
+    """
+    global _dispatcher
+    if _dispatcher is None and config.get_sku_workers():
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = SkuDispatcher(
+                    SqlAlchemyUnitOfWork,
+                    config.get_sku_workers(),
+                    config.get_sku_queue_size(),
+                    config.get_sku_queue_timeout_ms() / 1000,
+                )
+    return _dispatcher
@@ -0,0 +1,164 @@
+from __future__ import annotations
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+
+from .. import config
+from ..adapters import metrics
+from . import services
+from .unit_of_work import AbstractUnitOfWork, SqlAlchemyUnitOfWork
+
+"""
+group commit : 동시에 들어온 할당 요청들을 모아 하나의 작업 단위(트랜잭션)에서 처리하고 한 번만 커밋한다.
+
+요청마다 커밋하면 처리량이 커밋(fsync) 지연 시간에 묶인다. 요청을 큐에 넣으면 전용 스레드가
+첫 요청 뒤로 window 동안(또는 max_batch 개가 모일 때까지) 더 받은 뒤 services.allocate_many 로 함께 처리한다.
+allocate_many 는 SKU 마다 product 를 한 번만 읽어 같은 SKU 의 요청들을 이어서 할당하고, 라인마다 결과나 실패 이유를 돌려준다.
+호출한 쪽은 자기 요청의 결과(batchref)나 예외(OutOfStock, InvalidSku)를 그대로 받는다.
+묶음 전체의 커밋이 실패하면(재시도 후에도 ConcurrencyError 등) SKU 별 작업 단위로 나누어 다시 처리하므로,
+실패한 SKU 의 요청만 그 예외를 받고 다른 SKU 의 요청은 할당된다.
+
+allocate_many 는 도메인 모델로 할당하므로, 묶어서 처리하는 요청에는 SQL_ALLOCATION 설정이 적용되지 않는다.
+
+기록하는 지표 (metrics 가 켜져 있을 때)
+- group_commit.queue : 요청이 큐에 들어와 처리되기 시작할 때까지 기다린 시간
+- group_commit.flush : 묶음 하나를 처리하고 커밋하는 데 걸린 시간 (SKU 별로 다시 처리한 시간 포함)
+- group_commit (크기) : 묶음 하나의 요청 수
+"""
+
+Line = tuple[str, str, int]
+Request = tuple[Line, str | None, float, Future]
+
+
+class GroupCommitter:
+    def __init__(
+        self,
+        uow_factory: Callable[[], AbstractUnitOfWork],
+        window: float = 0.002,
+        max_batch: int = 64,
+    ):
+        """
+        window : 첫 요청 뒤에 더 기다리는 시간(초)
+        """
+        self.uow_factory = uow_factory
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: queue.Queue[Request | None] = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="group-commit", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self, orderid: str, sku: str, qty: int, idempotency_key: str | None = None
+    ) -> Future:
+        future: Future = Future()
+        self._queue.put(
+            ((orderid, sku, qty), idempotency_key, time.perf_counter(), future)
+        )
+        return future
+
+    def allocate(
+        self, orderid: str, sku: str, qty: int, idempotency_key: str | None = None
+    ) -> str:
+        """
+        services.allocate 와 같지만, 다른 요청과 함께 커밋될 때까지 기다린다.
+        """
+        return self.submit(orderid, sku, qty, idempotency_key).result()
+
+    def close(self) -> None:
+        """
+        이미 큐에 들어온 요청은 처리한 뒤 스레드를 멈춘다.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: list[Request]) -> None:
+        started = time.perf_counter()
+        if metrics.REGISTRY.enabled:
+            metrics.REGISTRY.observe_size("group_commit", len(batch))
+            for _, _, queued_at, _ in batch:
+                metrics.REGISTRY.observe("group_commit.queue", started - queued_at)
+        with metrics.timer("group_commit.flush"):
+            results = self._allocate(batch)
+            by_sku: dict[str, list[Request]] = {}
+            for request in batch:
+                by_sku.setdefault(request[0][1], []).append(request)
+            if not isinstance(results, Exception) or len(by_sku) == 1:
+                self._resolve(batch, results)
+                return
+            # 묶음 전체의 커밋이 실패했다. SKU 별로 다시 처리해 실패를 그 SKU 의 요청으로 한정한다.
+            for requests in by_sku.values():
+                self._resolve(requests, self._allocate(requests))
+
+    def _allocate(self, requests: list[Request]) -> list[str | Exception] | Exception:
+        """
+        요청들을 하나의 작업 단위에서 처리한다. 커밋하지 못했으면 그 예외를 돌려준다.
+        """
+        try:
+            return services.allocate_many(
+                [line for line, _, _, _ in requests],
+                self.uow_factory(),
+                [key for _, key, _, _ in requests],
+            )
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _resolve(
+        requests: list[Request], results: list[str | Exception] | Exception
+    ) -> None:
+        """
+        results 가 예외 하나이면 모든 요청이 그 예외를 받는다.
+        """
+        if isinstance(results, Exception):
+            results = [results] * len(requests)
+        for (_, _, _, future), result in zip(requests, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_group_committer: GroupCommitter | None = None
+_group_committer_lock = threading.Lock()
+
+
+def get_group_committer() -> GroupCommitter | None:
+    """
+    프로세스의 모든 요청이 공유하는 GroupCommitter. 설정(GROUP_COMMIT_WINDOW_MS)으로 켜지 않았으면 None 이다.
+    """
+    global _group_committer
+    if _group_committer is None and config.get_group_commit_window_ms():
+        with _group_committer_lock:
+            if _group_committer is None:
+                _group_committer = GroupCommitter(
+                    SqlAlchemyUnitOfWork,
+                    config.get_group_commit_window_ms() / 1000,
+                    config.get_group_commit_max_batch(),
+                )
+    return _group_committer
@@ -0,0 +1,92 @@
+import os
+from collections import defaultdict
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from ..domain import compact, model
+
+"""
+SKU 별로 나눠 여러 프로세스에서 실행하는 대량 할당 (야간 재할당 등).
+서로 다른 SKU 의 할당은 서로 영향을 주지 않으므로, 라인과 batch 를 SKU 별 shard 로 나누고
+shard 묶음을 ProcessPoolExecutor 의 worker 에 보낸 뒤 결과를 원래 라인 순서로 합친다.
+
+worker 에는 Batch/OrderLine 객체 대신 튜플만 보내 직렬화 비용을 줄이고,
+worker 안에서는 compact 객체와 model.Product 로 model.allocate 와 같은 규칙으로 할당한다.
+"""
+
+# (reference, 남은 수량, eta)
+BatchTuple = tuple[str, int, date | None]
+# (sku, batch 튜플들, 라인의 (orderid, qty) 튜플들)
+Shard = tuple[str, list[BatchTuple], list[tuple[str, int]]]
+
+# worker 하나당 보내는 작업 묶음 수. 많을수록 SKU 별 부하 차이가 고르게 나뉘지만 전송 횟수가 늘어난다.
+CHUNKS_PER_WORKER = 4
+
+
+def allocate(
+    lines: Sequence[model.OrderLine],
+    batches: Sequence[model.Batch],
+    max_workers: int | None = None,
+) -> list[str | None]:
+    """
+    라인마다 할당될 batch 의 reference 를 돌려준다 (할당할 수 없으면 None).
+    batch 객체는 바꾸지 않는다.
+    """
+    batches_by_sku: dict[str, list[BatchTuple]] = defaultdict(list)
+    for b in batches:
+        batches_by_sku[b.sku].append((b.reference, b.available_quantity, b.eta))
+    lines_by_sku: dict[str, list[tuple[str, int]]] = defaultdict(list)
+    indexes_by_sku: dict[str, list[int]] = defaultdict(list)
+    for i, line in enumerate(lines):
+        lines_by_sku[line.sku].append((line.orderid, line.qty))
+        indexes_by_sku[line.sku].append(i)
+
+    shards = [
+        (sku, batches_by_sku.get(sku, []), sku_lines)
+        for sku, sku_lines in lines_by_sku.items()
+    ]
+    workers = max_workers or os.cpu_count() or 1
+    results: list[str | None] = [None] * len(lines)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = _split(shards, workers * CHUNKS_PER_WORKER)
+        for chunk_result in executor.map(allocate_shards, chunks):
+            for sku, refs in chunk_result:
+                for i, ref in zip(indexes_by_sku[sku], refs):
+                    results[i] = ref
+    return results
+
+
+def allocate_shards(shards: list[Shard]) -> list[tuple[str, list[str | None]]]:
+    """
+    worker 에서 실행된다. shard 마다 라인 순서대로 할당한 batch 의 reference 목록을 돌려준다.
+    """
+    return [
+        (sku, _allocate_shard(sku, batches, lines)) for sku, batches, lines in shards
+    ]
+
+
+def _allocate_shard(
+    sku: str, batches: list[BatchTuple], lines: list[tuple[str, int]]
+) -> list[str | None]:
+    product = model.Product(
+        sku, [compact.Batch(ref, sku, qty, eta) for ref, qty, eta in batches]
+    )
+    refs: list[str | None] = []
+    for orderid, qty in lines:
+        try:
+            refs.append(product.allocate(compact.OrderLine(orderid, sku, qty)))
+        except model.OutOfStock:
+            refs.append(None)
+    return refs
+
+
+def _split(shards: list[Shard], n: int) -> list[list[Shard]]:
+    # 라인 수가 많은 shard 부터 가장 가벼운 묶음에 넣어 묶음별 라인 수를 고르게 한다.
+    chunks: list[list[Shard]] = [[] for _ in range(min(n, len(shards)))]
+    sizes = [0] * len(chunks)
+    for shard in sorted(shards, key=lambda s: len(s[2]), reverse=True):
+        lightest = sizes.index(min(sizes))
+        chunks[lightest].append(shard)
+        sizes[lightest] += len(shard[2])
+    return chunks
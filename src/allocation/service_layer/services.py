@@ -1,7 +1,15 @@
+import random
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
 from datetime import date
+from itertools import islice
+from typing import TypeVar
 
+from .. import config
+from ..adapters import metrics, repository
 from ..domain import model
-from .unit_of_work import AbstractUnitOfWork
+from .unit_of_work import AbstractUnitOfWork, ConcurrencyError
 
 """
 오케스트레이션 : 저장소에서 데이터를 가져오고, 데이터베이스 상태에 따라 입력을 검증하며 오류를 처리하고, DB 에 커밋하는 작업을 포함
@@ -14,35 +22,255 @@ class InvalidSku(Exception):
     ...
 
 
-def is_valid_sku(sku: str, batches: list[model.Batch]) -> bool:
-    return sku in {b.sku for b in batches}
+class DuplicateBatch(Exception):
+    """
+    이미 있는 batch 의 reference 로 batch 를 추가하려는 요청
+    """
 
 
-def allocate(orderid: str, sku: str, qty: int, uow: AbstractUnitOfWork) -> str:
+class IdempotencyConflict(Exception):
     """
-    도메인으로부터 완전히 분리된 서비스 계층을 만들기 위해 도메인 객체(OrderLine) 가 아닌 원시 타입을 파라미터로 받음
+    같은 멱등 키로 이미 할당한 라인과 orderid, sku, qty 중 하나라도 다른 요청
     """
-    line = model.OrderLine(orderid, sku, qty)
-    with uow:
-        batches = uow.batches.list()
-        if not is_valid_sku(line.sku, batches):
-            raise InvalidSku(f"Invalid sku {line.sku}")
-        batchref = model.allocate(line, batches)
-        uow.commit()
+
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.01
+
+T = TypeVar("T")
+
+
+def retry_on_conflict(fn: Callable[[], T]) -> T:
+    """
+    같은 SKU 에 대한 동시 커밋으로 ConcurrencyError 가 발생하면 작업 단위 전체를 다시 실행한다.
+    재시도 간격은 지수적으로 늘리고(jitter 포함), MAX_ATTEMPTS 번 실패하면 예외를 그대로 올린다.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return fn()
+        except ConcurrencyError:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            time.sleep(BACKOFF_SECONDS * 2 ** (attempt - 1) * random.random())
+
+
+def default_idempotency_key(orderid: str, sku: str) -> str:
+    return f"{orderid}:{sku}"
+
+
+def replayed_batchref(
+    key: str, line: model.OrderLine, recorded: tuple[model.OrderLine, str]
+) -> str:
+    """
+    멱등 키로 기록된 (라인, batchref) 가 같은 라인의 것이면 batchref 를 돌려준다.
+    """
+    recorded_line, batchref = recorded
+    if recorded_line != line:
+        raise IdempotencyConflict(
+            f"Idempotency key {key} was used for {recorded_line}, not {line}"
+        )
     return batchref
 
 
+def allocate(
+    orderid: str,
+    sku: str,
+    qty: int,
+    uow: AbstractUnitOfWork,
+    idempotency_key: str | None = None,
+) -> str:
+    """
+    도메인으로부터 완전히 분리된 서비스 계층을 만들기 위해 도메인 객체(OrderLine) 가 아닌 원시 타입을 파라미터로 받음
+    설정(SQL_ALLOCATION)이 켜져 있고 저장소가 지원하면 batch 를 읽지 않고 저장소 안에서 할당한다.
+    같은 멱등 키(기본은 orderid 와 sku)로 이미 할당한 요청이면 batch 를 읽거나 쓰지 않고 그때의 batchref 를 돌려준다.
+    그 키로 할당한 라인과 orderid, sku, qty 가 다르면 IdempotencyConflict.
+    """
+    key = idempotency_key or default_idempotency_key(orderid, sku)
+
+    def _allocate() -> str:
+        line = model.OrderLine(orderid, sku, qty)
+        with uow:
+            # 동시에 온 같은 키의 요청은 둘 중 하나의 커밋이 ConcurrencyError 로 실패하고, 재시도할 때 여기서 끝난다.
+            recorded = uow.idempotency_keys.get(key)
+            if recorded is not None:
+                return replayed_batchref(key, line, recorded)
+            if config.get_sql_allocation_enabled() and isinstance(
+                uow.batches, repository.AbstractAllocatingRepository
+            ):
+                batchref = uow.batches.allocate(line)
+                if batchref is None:
+                    raise InvalidSku(f"Invalid sku {line.sku}")
+            else:
+                product = uow.products.get(sku=line.sku)
+                if product is None:
+                    raise InvalidSku(f"Invalid sku {line.sku}")
+                with metrics.timer("domain.allocate"):
+                    batchref = product.allocate(line)
+            uow.allocations_view.add(line, batchref)
+            uow.idempotency_keys.add(key, line, batchref)
+            uow.stock.refresh({line.sku})
+            uow.commit()
+        return batchref
+
+    return retry_on_conflict(_allocate)
+
+
+def allocate_many(
+    lines: list[tuple[str, str, int]],
+    uow: AbstractUnitOfWork,
+    idempotency_keys: list[str | None] | None = None,
+) -> list[str | Exception]:
+    """
+    여러 (orderid, sku, qty) 라인을 하나의 작업 단위(트랜잭션)에서 할당하고 한 번만 커밋한다.
+    모든 SKU 의 Product 를 한 번에(get_many) 로딩하며, 같은 SKU 의 라인들은 캐싱된 ETA 순서(model.Product)를 공유한다.
+    결과는 입력 순서대로 batchref 또는 해당 라인이 실패한 이유(InvalidSku, OutOfStock, IdempotencyConflict) 이다.
+    멱등 키는 allocate 와 같으며, 이미 할당한 키(같은 호출 안에서 앞선 라인 포함)의 라인은 할당하지 않는다.
+    """
+    keys = [
+        key or default_idempotency_key(orderid, sku)
+        for (orderid, sku, _), key in zip(
+            lines, idempotency_keys or [None] * len(lines)
+        )
+    ]
+
+    def _allocate_many() -> list[str | Exception]:
+        order_lines = [model.OrderLine(*line) for line in lines]
+        results: list[str | Exception] = []
+        allocated: list[tuple[model.OrderLine, str]] = []
+        with uow:
+            done = uow.idempotency_keys.get_many(set(keys))
+            products = uow.products.get_many(
+                {line.sku for line, key in zip(order_lines, keys) if key not in done}
+            )
+            for line, key in zip(order_lines, keys):
+                if key in done:
+                    try:
+                        results.append(replayed_batchref(key, line, done[key]))
+                    except IdempotencyConflict as e:
+                        results.append(e)
+                    continue
+                product = products.get(line.sku)
+                if product is None:
+                    results.append(InvalidSku(f"Invalid sku {line.sku}"))
+                    continue
+                try:
+                    with metrics.timer("domain.allocate"):
+                        batchref = product.allocate(line)
+                except model.OutOfStock as e:
+                    results.append(e)
+                    continue
+                done[key] = line, batchref
+                uow.idempotency_keys.add(key, line, batchref)
+                allocated.append((line, batchref))
+                results.append(batchref)
+            uow.allocations_view.add_many(allocated)
+            uow.stock.refresh({line.sku for line, _ in allocated})
+            uow.commit()
+        return results
+
+    return retry_on_conflict(_allocate_many)
+
+
 def add_batch(
     ref: str, sku: str, qty: int, eta: date | None, uow: AbstractUnitOfWork
 ) -> None:
     with uow:
-        uow.batches.add(model.Batch(ref, sku, qty, eta))
+        if uow.batches.existing_references({ref}):
+            raise DuplicateBatch(f"Duplicate batch reference {ref}")
+        product = uow.products.get(sku=sku)
+        if product is None:
+            product = model.Product(sku, batches=[])
+            uow.products.add(product)
+        product.add_batch(model.Batch(ref, sku, qty, eta))
+        uow.stock.refresh({sku})
         uow.commit()
 
 
-def deallocate(orderid: str, sku: str, qty: int, uow: AbstractUnitOfWork) -> None:
-    line = model.OrderLine(orderid, sku, qty)
+def add_batches(
+    rows: Iterable[tuple[str, str, int, date | None]],
+    uow: AbstractUnitOfWork,
+    chunk_size: int = 1000,
+) -> int:
+    """
+    (ref, sku, qty, eta) 행들을 하나의 트랜잭션에서 대량으로 추가하고, 추가된 batch 수를 돌려준다.
+    입력은 chunk_size 단위로 읽어가며 INSERT 하므로, 전체 입력을 메모리에 올리지 않고 스트리밍할 수 있다.
+    이미 있거나 입력 안에서 겹치는 reference 가 있으면 DuplicateBatch 로 실패하고 아무것도 추가하지 않는다.
+    """
+    count = 0
     with uow:
-        batches = uow.batches.list()
-        model.deallocate(line, batches)
+        for chunk in _chunked(rows, chunk_size):
+            counts = Counter(row[0] for row in chunk)
+            repeated = {ref for ref, n in counts.items() if n > 1}
+            duplicates = repeated | uow.batches.existing_references(set(counts))
+            if duplicates:
+                raise DuplicateBatch(
+                    f"Duplicate batch reference {', '.join(sorted(duplicates))}"
+                )
+            uow.batches.add_many([model.Batch(*row) for row in chunk])
+            uow.stock.refresh({row[1] for row in chunk})
+            count += len(chunk)
         uow.commit()
+    return count
+
+
+def _chunked(rows: Iterable, size: int) -> Iterator[list]:
+    it = iter(rows)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def deallocate(orderid: str, sku: str, qty: int, uow: AbstractUnitOfWork) -> None:
+    """
+    SKU 의 batch 전체 대신 라인이 할당된 batch 만 allocations 테이블로 찾아 해제한다.
+    product 는 버전 번호를 올리기 위해서만 읽는다 (batch 는 읽지 않는다).
+    product(버전 번호)를 batch 보다 먼저 읽어야 한다. 그 사이에 같은 SKU 의 다른 할당이 커밋되면
+    버전 충돌로 재시도하고, 반대 순서라면 오래된 batch 의 할당 수량을 그대로 덮어쓰게 된다.
+    """
+
+    def _deallocate() -> None:
+        line = model.OrderLine(orderid, sku, qty)
+        with uow:
+            product = uow.products.get(sku=sku, with_batches=False)
+            batches = uow.batches.for_order(orderid, sku) if product else []
+            # 수량이 다르면 해제한 것이 없으므로, 할당과 멱등 키를 그대로 둔다.
+            if batches and product.deallocate(line, batches):
+                uow.allocations_view.remove(line)
+                uow.idempotency_keys.remove(orderid, sku)
+                uow.stock.refresh({sku})
+            uow.commit()
+
+    retry_on_conflict(_deallocate)
+
+
+def deallocate_order(orderid: str, uow: AbstractUnitOfWork) -> int:
+    """
+    주문을 취소한다. 주문의 모든 라인을 한 번의 커밋으로 해제하고, 해제한 라인 수를 돌려준다.
+    deallocate 와 같은 이유로, 주문의 SKU 별 product 를 batch 보다 먼저 읽는다.
+    """
+
+    def _deallocate_order() -> int:
+        with uow:
+            products = {
+                sku: uow.products.get(sku=sku, with_batches=False)
+                for sku in sorted(uow.batches.skus_for_order(orderid))
+            }
+            by_sku: dict[str, list[model.Batch]] = {}
+            for batch in uow.batches.for_order(orderid):
+                # SKU 를 찾은 뒤에 할당된 라인의 SKU 는 product 를 읽지 않았으므로 이번에는 해제하지 않는다.
+                if products.get(batch.sku) is not None:
+                    by_sku.setdefault(batch.sku, []).append(batch)
+            count = 0
+            for sku, sku_batches in by_sku.items():
+                product = products[sku]
+                for batch in sku_batches:
+                    for line in batch.lines_for_order(orderid):
+                        product.deallocate(line, [batch])
+                        uow.allocations_view.remove(line)
+                        count += 1
+            if by_sku:
+                uow.idempotency_keys.remove(orderid)
+            uow.stock.refresh(set(by_sku))
+            uow.commit()
+        return count
+
+    return retry_on_conflict(_deallocate_order)
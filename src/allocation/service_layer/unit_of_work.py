@@ -1,16 +1,40 @@
 from __future__ import annotations
+import threading
+import time
 from abc import ABC, abstractmethod
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.orm.session import Session
 
 from ..adapters import repository
+from ..adapters import memory, metrics
+from ..adapters.cache import (
+    BatchCache,
+    CachingIdempotencyKeyRepository,
+    CachingRepository,
+    IdempotencyCache,
+)
+from ..adapters.profiling import QueryProfile
 from .. import config
 
 
+class ConcurrencyError(Exception):
+    """
+    같은 SKU 를 다른 트랜잭션이 먼저 변경했거나, 같은 멱등 키의 요청이 먼저 커밋되어 커밋할 수 없는 경우
+    """
+
+
 class AbstractUnitOfWork(ABC):
     batches: repository.AbstractRepository
+    products: repository.AbstractProductRepository
+    allocations_view: repository.AbstractAllocationsViewRepository
+    stock: repository.AbstractStockRepository
+    idempotency_keys: repository.AbstractIdempotencyKeyRepository
 
     def __enter__(self) -> AbstractUnitOfWork:
         return self
@@ -27,24 +51,349 @@ class AbstractUnitOfWork(ABC):
         raise NotImplementedError
 
 
-DEFAULT_SESSION_FACTORY = sessionmaker(bind=create_engine(config.get_postgres_uri()))
+class PoolStats:
+    """
+    커넥션 풀 모니터링 지표 : 커넥션을 꺼내기 위해 기다린 시간과 checkout/checkin 횟수
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_checkout(self, *args) -> None:
+        with self._lock:
+            self.checkouts += 1
+
+    def record_checkin(self, *args) -> None:
+        with self._lock:
+            self.checkins += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    풀에서 커넥션을 얻을 때까지 걸린 시간(풀이 가득 찼다면 대기 시간 포함)을 기록하는 QueuePool
+    """
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record_wait(time.perf_counter() - start)
+
+    def recreate(self) -> InstrumentedQueuePool:
+        # engine.dispose() 로 풀이 새로 만들어져도 지표는 이어서 기록한다.
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def create_engine_from_config(uri: str | None = None) -> Engine:
+    uri = uri or config.get_postgres_uri()
+    connect_args = {}
+    timeout_ms = config.get_statement_timeout_ms()
+    if timeout_ms and uri.startswith("postgresql"):
+        connect_args["options"] = f"-c statement_timeout={timeout_ms}"
+
+    engine = create_engine(
+        uri,
+        poolclass=InstrumentedQueuePool,
+        connect_args=connect_args,
+        **config.get_engine_options(),
+    )
+    stats = engine.pool.stats = PoolStats()
+    event.listen(engine, "checkout", stats.record_checkout)
+    event.listen(engine, "checkin", stats.record_checkin)
+    return engine
+
+
+# 모듈 import 시점이 아니라 처음 사용할 때 엔진을 만든다.
+_session_factory: sessionmaker | None = None
+_session_factory_lock = threading.Lock()
+
+
+def get_session_factory() -> sessionmaker:
+    global _session_factory
+    if _session_factory is None:
+        with _session_factory_lock:
+            if _session_factory is None:
+                _session_factory = sessionmaker(bind=create_engine_from_config())
+    return _session_factory
+
+
+def pool_stats(session_factory: sessionmaker | None = None) -> dict:
+    pool = (session_factory or get_session_factory()).kw["bind"].pool
+    stats: PoolStats = pool.stats
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": stats.checkouts,
+        "checkins": stats.checkins,
+        "wait_count": stats.wait_count,
+        "wait_seconds_total": stats.wait_seconds_total,
+        "wait_seconds_max": stats.wait_seconds_max,
+    }
+
+
+_batch_cache: BatchCache | None = None
+
+
+def get_batch_cache() -> BatchCache | None:
+    """
+    프로세스의 모든 작업 단위가 공유하는 batch 캐시. 설정으로 켜지 않았으면 None 이다.
+    """
+    global _batch_cache
+    if _batch_cache is None and config.get_batch_cache_size():
+        with _session_factory_lock:
+            if _batch_cache is None:
+                _batch_cache = BatchCache(config.get_batch_cache_size())
+    return _batch_cache
+
+
+_idempotency_cache: IdempotencyCache | None = None
+
+
+def get_idempotency_cache() -> IdempotencyCache | None:
+    """
+    프로세스의 모든 작업 단위가 공유하는 멱등 키 캐시. 설정으로 켜지 않았으면 None 이다.
+    """
+    global _idempotency_cache
+    if _idempotency_cache is None and config.get_idempotency_cache_size():
+        with _session_factory_lock:
+            if _idempotency_cache is None:
+                _idempotency_cache = IdempotencyCache(
+                    config.get_idempotency_cache_size()
+                )
+    return _idempotency_cache
 
 
 class SqlAlchemyUnitOfWork(AbstractUnitOfWork):
-    def __init__(self, session_factory=DEFAULT_SESSION_FACTORY):
-        self.session_factory = session_factory
+    def __init__(
+        self,
+        session_factory: sessionmaker | None = None,
+        profile: bool | None = None,
+        idempotency_cache: IdempotencyCache | None = None,
+        cache: BatchCache | None = None,
+    ):
+        """
+        profile : True 이면 작업 단위(with 블록)마다 실행된 SQL 문을 self.profile 에 기록한다.
+        None 이면 설정(DB_QUERY_PROFILE)을 따른다.
+        """
+        self.session_factory = session_factory or get_session_factory()
+        self.idempotency_cache = idempotency_cache or get_idempotency_cache()
+        self.cache = cache or get_batch_cache()
+        self.profiling = (
+            config.get_query_profile_enabled() if profile is None else profile
+        )
+        self.profile: QueryProfile | None = None
 
     def __enter__(self):
-        self.session: Session = self.session_factory()
-        self.batches = repository.SqlAlchemyRepository(self.session)
-        return super().__enter__()
+        with metrics.timer("uow.enter"):
+            self.session: Session = self.session_factory()
+            if self.profiling:
+                self.profile = QueryProfile()
+                self.profile.watch(self.session)
+            self.batches = repository.SqlAlchemyRepository(self.session)
+            if self.cache is not None:
+                self.batches = self._cached_batches = CachingRepository(
+                    self.batches, self.cache
+                )
+                self._changed_skus: set[str] = set()
+                event.listen(self.session, "before_flush", self._record_changed_skus)
+            self.products = repository.SqlAlchemyProductRepository(self.session)
+            self.allocations_view = repository.SqlAlchemyAllocationsViewRepository(
+                self.session
+            )
+            self.stock = repository.SqlAlchemyStockRepository(self.session)
+            self.idempotency_keys = repository.SqlAlchemyIdempotencyKeyRepository(
+                self.session
+            )
+            if self.idempotency_cache is not None:
+                self.idempotency_keys = CachingIdempotencyKeyRepository(
+                    self.idempotency_keys, self.idempotency_cache
+                )
+            if metrics.REGISTRY.enabled:
+                self.batches = metrics.InstrumentedRepository(self.batches, "batches")
+                self.products = metrics.InstrumentedRepository(
+                    self.products, "products"
+                )
+            return super().__enter__()
 
     def __exit__(self, *args):
         super().__exit__(*args)
         self.session.close()
+        if self.profile is not None:
+            self.profile.report()
+
+    def commit(self):
+        try:
+            with metrics.timer("uow.commit"):
+                self.stock.apply()
+                self.idempotency_keys.apply()
+                self.session.commit()
+        except (StaleDataError, repository.DuplicateIdempotencyKey) as e:
+            raise ConcurrencyError(str(e)) from e
+        if self.idempotency_cache is not None:
+            self.idempotency_keys.publish(committed=True)
+        if self.cache is not None:
+            changed = self._changed_skus | self._cached_batches.written_skus
+            self._cached_batches.publish(changed)
+            self.cache.invalidate(changed)
+            self._changed_skus = set()
+
+    def rollback(self):
+        with metrics.timer("uow.rollback"):
+            self.session.rollback()
+        if self.idempotency_cache is not None:
+            self.idempotency_keys.publish(committed=False)
+        if self.cache is not None:
+            self._cached_batches.publish(self._changed_skus)
+            self._changed_skus = set()
+
+    def _record_changed_skus(self, session, flush_context, instances):
+        # flush 이후에는 session.new/dirty 가 비워지므로, flush 직전에 변경되는 SKU 를 모아 둔다.
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            sku = getattr(obj, "sku", None)
+            if sku is not None:
+                self._changed_skus.add(sku)
+
+
+class InMemoryUnitOfWork(AbstractUnitOfWork):
+    """
+    DB 없이 memory.InMemoryStore 에 커밋하는 작업 단위. 같은 store 를 여러 스레드의 작업 단위가 공유할 수 있다.
+    커밋하면 이 작업 단위에서 읽은 객체가 그대로 store 의 상태가 되므로, 커밋 후에는 그 객체들을 수정하지 않는다.
+    """
+
+    def __init__(self, store: memory.InMemoryStore):
+        self.store = store
+
+    def __enter__(self):
+        self._begin()
+        return super().__enter__()
 
     def commit(self):
-        self.session.commit()
+        try:
+            self._transaction.commit()
+        except memory.StaleSnapshot as e:
+            raise ConcurrencyError(str(e)) from e
+        finally:
+            self._begin()
 
     def rollback(self):
-        self.session.rollback()
+        self._begin()
+
+    def _begin(self) -> None:
+        self._transaction = memory.Transaction(self.store)
+        self.batches = memory.InMemoryRepository(self._transaction)
+        self.products = memory.InMemoryProductRepository(self._transaction)
+        self.allocations_view = memory.InMemoryAllocationsViewRepository(
+            self._transaction
+        )
+        self.stock = memory.InMemoryStockRepository()
+        self.idempotency_keys = memory.InMemoryIdempotencyKeyRepository(
+            self._transaction
+        )
+
+
+class AbstractAsyncUnitOfWork(ABC):
+    """
+    AbstractUnitOfWork 의 asyncio 버전 : async with 로 사용하고 commit/rollback 을 await 한다.
+    """
+
+    batches: repository.AbstractAsyncRepository
+    products: repository.AbstractAsyncProductRepository
+    allocations_view: repository.AbstractAsyncAllocationsViewRepository
+    stock: repository.AbstractAsyncStockRepository
+    idempotency_keys: repository.AbstractAsyncIdempotencyKeyRepository
+
+    async def __aenter__(self) -> AbstractAsyncUnitOfWork:
+        return self
+
+    async def __aexit__(self, *args):
+        await self.rollback()
+
+    @abstractmethod
+    async def commit(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rollback(self):
+        raise NotImplementedError
+
+
+def create_async_engine_from_config(uri: str | None = None) -> AsyncEngine:
+    connect_args = {}
+    timeout_ms = config.get_statement_timeout_ms()
+    if timeout_ms:
+        connect_args["server_settings"] = {"statement_timeout": str(timeout_ms)}
+    return create_async_engine(
+        uri or config.get_async_postgres_uri(),
+        connect_args=connect_args,
+        **config.get_engine_options(),
+    )
+
+
+_async_session_factory: sessionmaker | None = None
+
+
+def get_async_session_factory() -> sessionmaker:
+    # 이벤트 루프 안에서는 스레드 경쟁이 없으므로 lock 이 필요 없다.
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = sessionmaker(
+            bind=create_async_engine_from_config(),
+            class_=AsyncSession,
+            expire_on_commit=False,
+        )
+    return _async_session_factory
+
+
+class AsyncSqlAlchemyUnitOfWork(AbstractAsyncUnitOfWork):
+    """
+    session_factory 는 class_=AsyncSession, expire_on_commit=False 로 만들어야 한다.
+    (커밋 후 만료된 속성을 다시 읽으려면 암묵적인 I/O 가 필요한데, asyncio 에서는 허용되지 않는다.)
+    """
+
+    def __init__(self, session_factory: sessionmaker | None = None):
+        self.session_factory = session_factory or get_async_session_factory()
+
+    async def __aenter__(self):
+        self.session: AsyncSession = self.session_factory()
+        self.batches = repository.AsyncSqlAlchemyRepository(self.session)
+        self.products = repository.AsyncSqlAlchemyProductRepository(self.session)
+        self.allocations_view = repository.AsyncSqlAlchemyAllocationsViewRepository(
+            self.session
+        )
+        self.stock = repository.AsyncSqlAlchemyStockRepository(self.session)
+        self.idempotency_keys = repository.AsyncSqlAlchemyIdempotencyKeyRepository(
+            self.session
+        )
+        return await super().__aenter__()
+
+    async def __aexit__(self, *args):
+        await super().__aexit__(*args)
+        await self.session.close()
+
+    async def commit(self):
+        try:
+            await self.stock.apply()
+            await self.idempotency_keys.apply()
+            await self.session.commit()
+        except (StaleDataError, repository.DuplicateIdempotencyKey) as e:
+            raise ConcurrencyError(str(e)) from e
+
+    async def rollback(self):
+        await self.session.rollback()
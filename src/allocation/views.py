@@ -0,0 +1,92 @@
+from datetime import date
+
+from sqlalchemy import Date, bindparam, text
+
+from src.allocation.domain import model
+from src.allocation.service_layer import unit_of_work
+
+"""
+조회 전용 모델(read model)에 대한 질의. 도메인 객체와 매퍼를 거치지 않고, 비정규화된 allocations_view 테이블을
+orderid 인덱스를 사용하는 SQL 한 번으로 읽는다. 할당(쓰기) 경로의 테이블과 잠금을 건드리지 않는다.
+재고 요약(stock)도 같은 방식으로, 쓰기 작업 단위가 함께 갱신한 SKU 별 합계 행을 기본 키로 읽는다.
+SKU 의 batch 목록(batches)만은 저장소를 거쳐 읽으므로, batch 캐시(BATCH_CACHE_SIZE)를 켜면 캐시에서 응답한다.
+"""
+
+
+def allocations(
+    orderid: str,
+    uow: unit_of_work.SqlAlchemyUnitOfWork | unit_of_work.InMemoryUnitOfWork,
+) -> list[dict]:
+    if isinstance(uow, unit_of_work.InMemoryUnitOfWork):
+        return uow.store.allocations(orderid)
+    with uow:
+        rows = uow.session.execute(
+            text(
+                "SELECT sku, qty, batchref FROM allocations_view"
+                " WHERE orderid = :orderid ORDER BY id"
+            ),
+            dict(orderid=orderid),
+        )
+        return [
+            dict(sku=sku, qty=qty, batchref=batchref) for sku, qty, batchref in rows
+        ]
+
+
+_STOCK = (
+    text("SELECT sku, purchased, allocated, earliest_eta FROM stock WHERE sku IN :skus")
+    .bindparams(bindparam("skus", expanding=True))
+    .columns(earliest_eta=Date)
+)
+
+
+def stock(
+    skus: list[str],
+    uow: unit_of_work.SqlAlchemyUnitOfWork | unit_of_work.InMemoryUnitOfWork,
+) -> list[dict]:
+    """
+    SKU 별 입고/할당/가용 수량과 가장 빠른 ETA. batch 가 없는 SKU 는 결과에서 빠지며, 요청한 순서를 따른다.
+    """
+    if isinstance(uow, unit_of_work.InMemoryUnitOfWork):
+        totals = {sku: uow.store.stock(sku) for sku in skus}
+        rows = [(sku, *t) for sku, t in totals.items() if t is not None]
+    else:
+        with uow:
+            rows = list(uow.session.execute(_STOCK, dict(skus=skus)))
+    by_sku = {row[0]: row for row in rows}
+    return [_stock_dict(*by_sku[sku]) for sku in dict.fromkeys(skus) if sku in by_sku]
+
+
+def batches(
+    sku: str,
+    uow: unit_of_work.SqlAlchemyUnitOfWork | unit_of_work.InMemoryUnitOfWork,
+) -> list[dict]:
+    """
+    SKU 의 batch 별 입고/할당/가용 수량과 ETA. 할당에 쓰이는 순서(ETA 가 없는 batch 먼저)를 따르고,
+    ETA 가 같으면 reference 순이다.
+    """
+    with uow:
+        found = sorted(
+            uow.batches.for_sku(sku), key=lambda b: (model.eta_order(b), b.reference)
+        )
+        return [
+            dict(
+                reference=b.reference,
+                purchased=b._purchased_quantity,
+                allocated=b.allocated_quantity,
+                available=b.available_quantity,
+                eta=b.eta.isoformat() if b.eta else None,
+            )
+            for b in found
+        ]
+
+
+def _stock_dict(
+    sku: str, purchased: int, allocated: int, earliest_eta: date | None
+) -> dict:
+    return dict(
+        sku=sku,
+        purchased=purchased,
+        allocated=allocated,
+        available=purchased - allocated,
+        earliest_eta=earliest_eta.isoformat() if earliest_eta else None,
+    )
@@ -7,6 +7,7 @@ import requests
 from requests.exceptions import ConnectionError
 from sqlalchemy.exc import OperationalError
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, clear_mappers
 
 from src.allocation.adapters.orm import metadata, start_mappers
@@ -32,6 +33,31 @@ def session(session_factory):
     return session_factory()
 
 
+@pytest.fixture
+def file_sqlite_session_factory(tmp_path):
+    """
+    in-memory DB 는 하나의 커넥션을 공유하므로, 동시에 열린 트랜잭션이 필요한 테스트는 파일 DB 를 사용한다.
+    """
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'allocation.db'}", connect_args={"timeout": 30}
+    )
+    metadata.create_all(engine)
+    start_mappers()
+    yield sessionmaker(bind=engine)
+    clear_mappers()
+    engine.dispose()
+
+
+@pytest.fixture
+def async_session_factory(tmp_path):
+    path = tmp_path / "allocation.db"
+    metadata.create_all(create_engine(f"sqlite:///{path}"))
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    start_mappers()
+    yield sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    clear_mappers()
+
+
 def wait_for_postgres_to_come_up(engine):
     deadline = time.time() + 10
     while time.time() < deadline:
@@ -1,3 +1,4 @@
+import json
 import uuid
 import pytest
 import requests
@@ -71,6 +72,203 @@ def test_deallocate():
     assert r.status_code == 200
 
 
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_bulk_allocate_returns_result_per_line():
+    sku, unknown_sku = random_sku(), random_sku("unknown")
+    batch = random_batchref()
+    post_to_add_batch(batch, sku, 10, None)
+    orderid = random_orderid()
+    data = {
+        "lines": [
+            {"orderid": orderid, "sku": sku, "qty": 8},
+            {"orderid": orderid, "sku": unknown_sku, "qty": 1},
+            {"orderid": orderid, "sku": sku, "qty": 8},
+        ]
+    }
+    url = config.get_api_url()
+    r = requests.post(f"{url}/allocate/bulk", json=data)
+
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert results[0]["batchref"] == batch
+    assert results[1]["message"] == f"Invalid sku {unknown_sku}"
+    assert results[2]["message"] == f"Out of stock for sku {sku}"
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_bulk_add_batches_from_ndjson():
+    sku = random_sku()
+    early, late = random_batchref(1), random_batchref(2)
+    body = "\n".join(
+        json.dumps({"ref": ref, "sku": sku, "qty": 10, "eta": eta})
+        for ref, eta in ((late, "2022-06-02"), (early, "2022-06-01"))
+    )
+    url = config.get_api_url()
+    r = requests.post(
+        f"{url}/batches",
+        data=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert r.status_code == 201
+    assert r.json()["count"] == 2
+
+    data = {"orderid": random_orderid(), "sku": sku, "qty": 3}
+    r = requests.post(f"{url}/allocate", json=data)
+    assert r.json()["batchref"] == early
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_cancel_order_deallocates_every_line():
+    sku1, sku2 = random_sku(1), random_sku(2)
+    post_to_add_batch(random_batchref(1), sku1, 10, None)
+    post_to_add_batch(random_batchref(2), sku2, 10, None)
+    orderid = random_orderid()
+    url = config.get_api_url()
+    for sku in (sku1, sku2):
+        r = requests.post(
+            f"{url}/allocate", json={"orderid": orderid, "sku": sku, "qty": 10}
+        )
+        assert r.status_code == 201
+
+    r = requests.delete(f"{url}/allocations/{orderid}")
+    assert r.status_code == 200
+    assert r.json()["deallocated"] == 2
+
+    r = requests.post(
+        f"{url}/allocate", json={"orderid": random_orderid(), "sku": sku1, "qty": 10}
+    )
+    assert r.status_code == 201
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_allocations_view_returns_where_the_order_went():
+    sku, batch = random_sku(), random_batchref()
+    post_to_add_batch(batch, sku, 100, None)
+    orderid = random_orderid()
+    url = config.get_api_url()
+
+    r = requests.get(f"{url}/allocations/{orderid}")
+    assert r.status_code == 404
+
+    requests.post(f"{url}/allocate", json={"orderid": orderid, "sku": sku, "qty": 3})
+    r = requests.get(f"{url}/allocations/{orderid}")
+    assert r.status_code == 200
+    assert r.json() == [{"sku": sku, "qty": 3, "batchref": batch}]
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_stock_summary_is_cacheable():
+    sku, other = random_sku(), random_sku("other")
+    post_to_add_batch(random_batchref(1), sku, 100, "2011-01-02")
+    post_to_add_batch(random_batchref(2), sku, 50, None)
+    url = config.get_api_url()
+    requests.post(
+        f"{url}/allocate", json={"orderid": random_orderid(), "sku": sku, "qty": 30}
+    )
+
+    r = requests.get(f"{url}/stock/{sku}")
+    assert r.status_code == 200
+    assert r.json() == {
+        "sku": sku,
+        "purchased": 150,
+        "allocated": 30,
+        "available": 120,
+        "earliest_eta": "2011-01-02",
+    }
+    assert "max-age" in r.headers["Cache-Control"]
+    r = requests.get(f"{url}/stock/{sku}", headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
+
+    assert requests.get(f"{url}/stock/{other}").status_code == 404
+    r = requests.get(f"{url}/stock", params={"sku": [sku, other]})
+    assert [s["sku"] for s in r.json()] == [sku]
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_batches_of_a_sku_are_listed_in_allocation_order():
+    sku, earlybatch, nowbatch = random_sku(), random_batchref(1), random_batchref(2)
+    post_to_add_batch(earlybatch, sku, 100, "2011-01-02")
+    post_to_add_batch(nowbatch, sku, 50, None)
+    url = config.get_api_url()
+    requests.post(
+        f"{url}/allocate", json={"orderid": random_orderid(), "sku": sku, "qty": 30}
+    )
+
+    r = requests.get(f"{url}/batches/{sku}")
+
+    assert r.status_code == 200
+    assert [(b["reference"], b["available"]) for b in r.json()] == [
+        (nowbatch, 20),
+        (earlybatch, 100),
+    ]
+    assert requests.get(f"{url}/batches/{random_sku()}").status_code == 404
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_retried_allocation_returns_the_original_batch():
+    sku, earlybatch, laterbatch = random_sku(), random_batchref(1), random_batchref(2)
+    post_to_add_batch(earlybatch, sku, 10, "2011-01-01")
+    post_to_add_batch(laterbatch, sku, 10, "2011-01-02")
+    url = config.get_api_url()
+    data = {"orderid": random_orderid(), "sku": sku, "qty": 6}
+    headers = {"Idempotency-Key": random_hex()}
+
+    first = requests.post(f"{url}/allocate", json=data, headers=headers)
+    retry = requests.post(f"{url}/allocate", json=data, headers=headers)
+
+    assert first.json()["batchref"] == retry.json()["batchref"] == earlybatch
+    r = requests.get(f"{url}/stock/{sku}")
+    assert r.json()["allocated"] == 6
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_409_when_a_key_is_replayed_with_a_different_qty():
+    sku, batch = random_sku(), random_batchref()
+    post_to_add_batch(batch, sku, 10, None)
+    url = config.get_api_url()
+    data = {"orderid": random_orderid(), "sku": sku, "qty": 6}
+    requests.post(f"{url}/allocate", json=data)
+
+    r = requests.post(f"{url}/allocate", json={**data, "qty": 3})
+
+    assert r.status_code == 409
+    r = requests.get(f"{url}/stock/{sku}")
+    assert r.json()["allocated"] == 6
+
+
+@pytest.mark.usefixtures("postgres_db")
+@pytest.mark.usefixtures("restart_api")
+def test_409_when_a_batch_reference_already_exists():
+    sku, batch = random_sku(), random_batchref()
+    post_to_add_batch(batch, sku, 10, None)
+    url = config.get_api_url()
+
+    r = requests.post(
+        f"{url}/batch", json={"ref": batch, "sku": sku, "qty": 5, "eta": None}
+    )
+    assert r.status_code == 409
+    assert r.json()["message"] == f"Duplicate batch reference {batch}"
+
+    r = requests.post(
+        f"{url}/batches",
+        json=[
+            {"ref": random_batchref(), "sku": sku, "qty": 5},
+            {"ref": batch, "sku": sku, "qty": 5},
+        ],
+    )
+    assert r.status_code == 409
+    assert batch in r.json()["message"]
+    assert requests.get(f"{url}/stock/{sku}").json()["purchased"] == 10
+
+
 def post_to_add_batch(ref, sku, qty, eta):
     """
     batch 를 추가하는 api 를 통해서 기존 conftest.py 의 add_stock 을 대체할 수 있다.
@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import json
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import clear_mappers, sessionmaker
+
+from src.allocation.adapters.orm import metadata
+from src.allocation.service_layer import unit_of_work
+
+"""
+ASGI 앱을 HTTP 서버 없이 app(scope, receive, send) 로 직접 호출하는 E2E 형식의 테스트. DB 는 aiosqlite 파일이다.
+asgi_app 은 import 할 때 매퍼를 등록하므로, 테스트마다 모듈을 다시 읽어 등록하고 끝나면 clear_mappers 로 지운다.
+"""
+
+MODULE = "src.allocation.entrypoints.asgi_app"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    path = tmp_path / "allocation.db"
+    metadata.create_all(create_engine(f"sqlite:///{path}"))
+    monkeypatch.setattr(
+        unit_of_work,
+        "_async_session_factory",
+        sessionmaker(
+            bind=create_async_engine(f"sqlite+aiosqlite:///{path}"),
+            class_=AsyncSession,
+            expire_on_commit=False,
+        ),
+    )
+    if MODULE in sys.modules:
+        module = importlib.reload(sys.modules[MODULE])
+    else:
+        module = importlib.import_module(MODULE)
+    yield module.app
+    clear_mappers()
+
+
+def request(
+    app, method: str, path: str, body: dict | None = None, headers: dict | None = None
+) -> tuple[int, dict | str]:
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [
+            (name.lower().encode(), value.encode())
+            for name, value in (headers or {}).items()
+        ],
+    }
+    messages = [{"type": "http.request", "body": json.dumps(body or {}).encode()}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, response = sent
+    content_type = dict(start["headers"])[b"content-type"]
+    if content_type == b"application/json":
+        return start["status"], json.loads(response["body"])
+    return start["status"], response["body"].decode()
+
+
+def post_to_add_batch(app, ref, sku, qty, eta):
+    assert request(
+        app, "POST", "/batch", {"ref": ref, "sku": sku, "qty": qty, "eta": eta}
+    ) == (201, "OK")
+
+
+def test_happy_path_allocates_to_the_earlier_batch_and_deallocates(app):
+    post_to_add_batch(app, "laterbatch", "RETRO-CLOCK", 100, "2011-01-02")
+    post_to_add_batch(app, "earlybatch", "RETRO-CLOCK", 100, "2011-01-01")
+    line = {"orderid": "o1", "sku": "RETRO-CLOCK", "qty": 3}
+
+    assert request(app, "POST", "/allocate", line) == (201, {"batchref": "earlybatch"})
+    assert request(app, "POST", "/deallocate", line) == (200, "OK")
+    assert request(app, "POST", "/allocate", {**line, "qty": 100}) == (
+        201,
+        {"batchref": "earlybatch"},
+    )
+
+
+def test_unhappy_path_returns_400_and_error_message(app):
+    status, body = request(
+        app, "POST", "/allocate", {"orderid": "o1", "sku": "NOPE", "qty": 3}
+    )
+
+    assert status == 400
+    assert body["message"] == "Invalid sku NOPE"
+    assert request(app, "GET", "/allocate")[0] == 404
+
+
+def test_replayed_idempotency_key_returns_the_original_batch_or_409(app):
+    post_to_add_batch(app, "batch1", "RETRO-CLOCK", 10, None)
+    post_to_add_batch(app, "batch2", "RETRO-CLOCK", 10, None)
+    line = {"orderid": "o1", "sku": "RETRO-CLOCK", "qty": 6}
+    headers = {"Idempotency-Key": "request-1"}
+
+    first = request(app, "POST", "/allocate", line, headers)
+    retry = request(app, "POST", "/allocate", line, headers)
+    status, body = request(app, "POST", "/allocate", {**line, "qty": 3}, headers)
+
+    assert first == retry == (201, {"batchref": "batch1"})
+    assert status == 409
+    assert "request-1" in body["message"]
+    # 다시 보낸 요청은 할당하지 않았으므로, 다음 라인도 같은 batch 에 들어간다.
+    assert request(
+        app, "POST", "/allocate", {"orderid": "o2", "sku": "RETRO-CLOCK", "qty": 4}
+    ) == (201, {"batchref": "batch1"})
+
+
+def test_409_when_a_batch_reference_already_exists(app):
+    post_to_add_batch(app, "batch1", "RETRO-CLOCK", 10, None)
+
+    status, body = request(
+        app,
+        "POST",
+        "/batch",
+        {"ref": "batch1", "sku": "OTHER-CLOCK", "qty": 5, "eta": None},
+    )
+
+    assert status == 409
+    assert body["message"] == "Duplicate batch reference batch1"
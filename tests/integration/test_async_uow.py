@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from src.allocation.domain import model
+from src.allocation.service_layer import async_services, services, unit_of_work
+
+
+def test_async_uow_can_retrieve_a_batch_and_allocate_to_it(async_session_factory):
+    async def scenario():
+        uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(async_session_factory)
+        await async_services.add_batch("batch1", "HIPSTER-WORKBENCH", 100, None, uow)
+
+        batchref = await async_services.allocate("o1", "HIPSTER-WORKBENCH", 10, uow)
+
+        async with uow:
+            batch = await uow.batches.get(reference="batch1")
+            return batchref, batch.available_quantity
+
+    batchref, available_quantity = asyncio.run(scenario())
+    assert batchref == "batch1"
+    assert available_quantity == 90
+
+
+def test_async_deallocate_restores_available_quantity(async_session_factory):
+    async def scenario():
+        uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(async_session_factory)
+        await async_services.add_batch("batch1", "BLUE-PLINTH", 100, None, uow)
+        await async_services.allocate("o1", "BLUE-PLINTH", 10, uow)
+        await async_services.deallocate("o1", "BLUE-PLINTH", 10, uow)
+        async with uow:
+            product = await uow.products.get(sku="BLUE-PLINTH")
+            [stock] = await uow.session.execute(
+                "SELECT allocated FROM stock WHERE sku = 'BLUE-PLINTH'"
+            )
+            return (
+                product.batches[0].available_quantity,
+                product.version_number,
+                stock.allocated,
+            )
+
+    available_quantity, version_number, allocated = asyncio.run(scenario())
+    assert available_quantity == 100
+    assert version_number == 2
+    assert allocated == 0
+
+
+def test_async_replay_returns_the_batchref_or_rejects_a_different_qty(
+    async_session_factory,
+):
+    async def scenario():
+        uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(async_session_factory)
+        await async_services.add_batch("batch1", "BLUE-PLINTH", 100, None, uow)
+        await async_services.allocate("o1", "BLUE-PLINTH", 10, uow)
+        replayed = await async_services.allocate("o1", "BLUE-PLINTH", 10, uow)
+        with pytest.raises(services.IdempotencyConflict):
+            await async_services.allocate("o1", "BLUE-PLINTH", 5, uow)
+        async with uow:
+            batch = await uow.batches.get(reference="batch1")
+            return replayed, batch.available_quantity
+
+    assert asyncio.run(scenario()) == ("batch1", 90)
+
+
+def test_async_allocate_errors_for_invalid_sku(async_session_factory):
+    uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(async_session_factory)
+
+    with pytest.raises(services.InvalidSku, match="Invalid sku NONEXISTSKU"):
+        asyncio.run(async_services.allocate("o1", "NONEXISTSKU", 10, uow))
+
+
+def test_async_rolls_back_uncommitted_work_by_default(async_session_factory):
+    async def scenario():
+        uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(async_session_factory)
+        async with uow:
+            uow.batches.add(model.Batch("batch1", "MEDIUM-PLINTH", 100))
+        async with uow:
+            return await uow.batches.list()
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_async_add_batch_rejects_an_existing_reference(async_session_factory):
+    async def scenario():
+        uow = unit_of_work.AsyncSqlAlchemyUnitOfWork(async_session_factory)
+        await async_services.add_batch("batch1", "BLUE-PLINTH", 100, None, uow)
+        with pytest.raises(services.DuplicateBatch, match="reference batch1$"):
+            await async_services.add_batch("batch1", "RED-PLINTH", 10, None, uow)
+        async with uow:
+            return [b.reference for b in await uow.batches.list()]
+
+    assert asyncio.run(scenario()) == ["batch1"]
@@ -0,0 +1,137 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import IntegrityError
+
+from src.allocation.adapters import migrations
+
+
+@pytest.fixture
+def legacy_db():
+    """
+    인덱스가 없던 시절의 스키마로 만들어진 데이터베이스
+    """
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(
+            "CREATE TABLE order_lines (id INTEGER PRIMARY KEY,"
+            " sku VARCHAR(255), qty INTEGER NOT NULL, orderid VARCHAR(255))"
+        )
+        conn.execute(
+            "CREATE TABLE batches (id INTEGER PRIMARY KEY, reference VARCHAR(255),"
+            " sku VARCHAR(255), _purchased_quantity INTEGER NOT NULL, eta DATE)"
+        )
+        conn.execute(
+            "CREATE TABLE allocations (id INTEGER PRIMARY KEY,"
+            " orderline_id INTEGER REFERENCES order_lines (id),"
+            " batch_id INTEGER REFERENCES batches (id))"
+        )
+        conn.execute(
+            "INSERT INTO batches (reference, sku, _purchased_quantity, eta)"
+            " VALUES ('batch1', 'SHINY-LAMP', 100, NULL)"
+        )
+        conn.execute(
+            "INSERT INTO order_lines (orderid, sku, qty) VALUES"
+            " ('order1', 'SHINY-LAMP', 10), ('order2', 'SHINY-LAMP', 5)"
+        )
+        conn.execute(
+            "INSERT INTO allocations (orderline_id, batch_id) VALUES (1, 1), (2, 1)"
+        )
+    return engine
+
+
+def index_names(engine, table: str) -> set[str]:
+    return {ix["name"] for ix in inspect(engine).get_indexes(table)}
+
+
+def test_upgrade_adds_missing_indexes_to_existing_tables(legacy_db):
+    migrations.upgrade(legacy_db)
+
+    assert index_names(legacy_db, "batches") == {
+        "ix_batches_reference",
+        "ix_batches_sku",
+    }
+    assert index_names(legacy_db, "order_lines") == {"ix_order_lines_orderid_sku"}
+    assert index_names(legacy_db, "allocations") == {
+        "ix_allocations_batch_id_orderline_id",
+        "ix_allocations_orderline_id",
+    }
+
+
+def test_upgrade_is_idempotent_and_keeps_data(legacy_db):
+    migrations.upgrade(legacy_db)
+    migrations.upgrade(legacy_db)
+
+    rows = list(legacy_db.execute("SELECT reference FROM batches"))
+    assert rows == [("batch1",)]
+
+
+def test_batch_reference_is_unique_after_upgrade(legacy_db):
+    migrations.upgrade(legacy_db)
+
+    with pytest.raises(IntegrityError):
+        legacy_db.execute(
+            "INSERT INTO batches (reference, sku, _purchased_quantity, eta)"
+            " VALUES ('batch1', 'SHINY-LAMP', 10, NULL)"
+        )
+
+
+def test_upgrade_backfills_allocated_quantity(legacy_db):
+    migrations.upgrade(legacy_db)
+
+    rows = list(legacy_db.execute("SELECT reference, _allocated_quantity FROM batches"))
+    assert rows == [("batch1", 15)]
+
+
+def test_upgrade_creates_product_versions_for_existing_skus(legacy_db):
+    migrations.upgrade(legacy_db)
+    migrations.upgrade(legacy_db)
+
+    rows = list(legacy_db.execute("SELECT sku, version_number FROM products"))
+    assert rows == [("SHINY-LAMP", 0)]
+
+
+def test_upgrade_fills_allocations_view_once(legacy_db):
+    migrations.upgrade(legacy_db)
+    migrations.upgrade(legacy_db)
+
+    rows = list(
+        legacy_db.execute(
+            "SELECT orderid, sku, qty, batchref FROM allocations_view ORDER BY id"
+        )
+    )
+    assert rows == [
+        ("order1", "SHINY-LAMP", 10, "batch1"),
+        ("order2", "SHINY-LAMP", 5, "batch1"),
+    ]
+
+
+def test_upgrade_fills_stock_from_existing_batches(legacy_db):
+    migrations.upgrade(legacy_db)
+    migrations.upgrade(legacy_db)
+
+    rows = list(
+        legacy_db.execute("SELECT sku, purchased, allocated, earliest_eta FROM stock")
+    )
+    assert rows == [("SHINY-LAMP", 100, 15, None)]
+
+
+def test_upgrade_adds_qty_to_existing_idempotency_keys(legacy_db):
+    migrations.upgrade(legacy_db)
+    with legacy_db.begin() as conn:
+        conn.execute("DROP TABLE idempotency_keys")
+        conn.execute(
+            "CREATE TABLE idempotency_keys (key VARCHAR(255) PRIMARY KEY,"
+            " orderid VARCHAR(255) NOT NULL, sku VARCHAR(255) NOT NULL,"
+            " batchref VARCHAR(255) NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO idempotency_keys (key, orderid, sku, batchref) VALUES"
+            " ('order1:SHINY-LAMP', 'order1', 'SHINY-LAMP', 'batch1'),"
+            " ('gone', 'order9', 'SHINY-LAMP', 'batch1')"
+        )
+
+    migrations.upgrade(legacy_db)
+    migrations.upgrade(legacy_db)
+
+    rows = list(legacy_db.execute("SELECT key, qty FROM idempotency_keys ORDER BY key"))
+    assert rows == [("gone", 0), ("order1:SHINY-LAMP", 10)]
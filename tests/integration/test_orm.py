@@ -25,3 +25,22 @@ def test_orderline_mapper_can_save_lines(session):
 
     rows = list(session.execute("SELECT orderid, sku, qty FROM 'order_lines'"))
     assert rows == [("order1", "DECORATIVE-WIDGET", 12)]
+
+
+def test_products_are_loaded_with_batches_in_allocation_order(session):
+    session.execute(
+        """
+        INSERT INTO batches (reference, sku, _purchased_quantity, eta) VALUES
+        ('later', 'RED-CHAIR', 10, '2011-01-02'),
+        ('in-stock', 'RED-CHAIR', 10, NULL),
+        ('sooner', 'RED-CHAIR', 10, '2011-01-01')
+        """
+    )
+    session.execute(
+        "INSERT INTO products (sku, version_number) VALUES ('RED-CHAIR', 0)"
+    )
+
+    product = session.get(model.Product, "RED-CHAIR")
+
+    assert [b.reference for b in product.batches] == ["in-stock", "sooner", "later"]
+    assert product._batches_ordered
@@ -67,5 +67,71 @@ def test_repository_can_retrieve_a_batch_with_allocations(session):
     }
 
 
+def test_for_order_returns_only_batches_holding_the_order(session):
+    orderline_id = insert_order_line(session)
+    batch1_id = insert_batch(session, "batch1")
+    insert_batch(session, "batch2")
+    insert_allocation(session, batch1_id, orderline_id)
+
+    repo = repository.SqlAlchemyRepository(session)
+
+    assert [b.reference for b in repo.for_order("order1")] == ["batch1"]
+    assert [b.reference for b in repo.for_order("order1", "GENERIC-SOFA")] == ["batch1"]
+    assert repo.for_order("order1", "OTHER-SKU") == []
+    assert repo.for_order("order2") == []
+
+
 def test_adapters_are_subclass_of_port():
     assert isinstance(repository.SqlAlchemyRepository, repository.AbstractRepository)
+
+
+def test_for_sku_returns_only_batches_of_that_sku(session):
+    session.execute(
+        "INSERT INTO batches (reference, sku, _purchased_quantity, eta) VALUES"
+        " ('batch1', 'GENERIC-SOFA', 100, NULL),"
+        " ('batch2', 'GENERIC-SOFA', 100, NULL),"
+        " ('batch3', 'GENERIC-TABLE', 100, NULL)"
+    )
+
+    repo = repository.SqlAlchemyRepository(session)
+    retrieved = repo.for_sku("GENERIC-SOFA")
+
+    assert {b.reference for b in retrieved} == {"batch1", "batch2"}
+    assert repo.for_sku("NONEXISTENT-SKU") == []
+
+
+def test_repository_can_bulk_add_batches(session):
+    repo = repository.SqlAlchemyRepository(session)
+    repo.add_many(
+        [
+            model.Batch("batch1", "RUSTY-SOAPDISH", 100, eta=None),
+            model.Batch("batch2", "RUSTY-SOAPDISH", 50, eta=None),
+        ]
+    )
+    session.commit()
+
+    rows = session.execute("SELECT reference, sku, _purchased_quantity FROM 'batches'")
+    assert list(rows) == [
+        ("batch1", "RUSTY-SOAPDISH", 100),
+        ("batch2", "RUSTY-SOAPDISH", 50),
+    ]
+    rows = session.execute("SELECT sku, version_number FROM 'products'")
+    assert list(rows) == [("RUSTY-SOAPDISH", 0)]
+
+
+def test_product_repository_loads_batches_of_the_sku(session):
+    session.execute(
+        "INSERT INTO products (sku, version_number) VALUES ('GENERIC-SOFA', 3)"
+    )
+    insert_batch(session, "batch1")
+    session.execute(
+        "INSERT INTO batches (reference, sku, _purchased_quantity, eta)"
+        " VALUES ('batch2', 'OTHER-SOFA', 100, NULL)"
+    )
+
+    repo = repository.SqlAlchemyProductRepository(session)
+    product = repo.get("GENERIC-SOFA")
+
+    assert product.version_number == 3
+    assert [b.reference for b in product.batches] == ["batch1"]
+    assert repo.get("NONEXISTENT-SKU") is None
@@ -0,0 +1,177 @@
+import random
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from src.allocation.adapters import repository
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+
+ETAS = [None, date(2026, 1, 1), date(2026, 1, 1), date(2026, 1, 2), date(2026, 1, 9)]
+
+
+def random_case(rng: random.Random) -> tuple[list[model.Batch], list[model.OrderLine]]:
+    """
+    같은 ETA 의 batch, 이미 할당된 라인의 재할당, 다른 SKU, 수량 부족이 자주 나오도록 만든 입력
+    """
+    skus = ["LAMP", "RUG"]
+    batches = [
+        model.Batch(f"b{i}", rng.choice(skus), rng.randint(0, 20), rng.choice(ETAS))
+        for i in range(rng.randint(1, 8))
+    ]
+    lines = []
+    for i in range(rng.randint(1, 30)):
+        if lines and rng.random() < 0.2:
+            lines.append(rng.choice(lines))
+        else:
+            lines.append(
+                model.OrderLine(f"o{i % 7}", rng.choice(skus), rng.randint(1, 8))
+            )
+    return batches, lines
+
+
+def allocate_in_domain(batches, line) -> str | None:
+    try:
+        return model.allocate(line, [b for b in batches if b.sku == line.sku])
+    except model.OutOfStock:
+        return None
+
+
+def allocate_in_sql(repo, line) -> str | None:
+    try:
+        return repo.allocate(line)
+    except model.OutOfStock:
+        return None
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_sql_allocation_matches_the_domain_model(session, seed):
+    rng = random.Random(seed)
+    batches, lines = random_case(rng)
+    repo = repository.SqlAlchemyRepository(session)
+    repo.add_many(
+        [model.Batch(b.reference, b.sku, b._purchased_quantity, b.eta) for b in batches]
+    )
+
+    for line in lines:
+        assert allocate_in_sql(repo, line) == allocate_in_domain(batches, line), line
+
+    session.expire_all()
+    stored = {b.reference: b for b in repo.list()}
+    for batch in batches:
+        assert stored[batch.reference]._allocated_orders == batch._allocated_orders
+        assert stored[batch.reference].allocated_quantity == batch.allocated_quantity
+
+
+def test_both_paths_break_eta_ties_by_id(session_factory):
+    session = session_factory()
+    session.execute("INSERT INTO products (sku, version_number) VALUES ('LAMP', 0)")
+    for id_, ref, eta in [
+        (4, "later", "2026-01-02"),
+        (3, "tie-high-id", "2026-01-01"),
+        (1, "tie-low-id", "2026-01-01"),
+    ]:
+        session.execute(
+            "INSERT INTO batches (id, reference, sku, _purchased_quantity, eta)"
+            " VALUES (:id, :ref, 'LAMP', 10, :eta)",
+            dict(id=id_, ref=ref, eta=eta),
+        )
+    session.commit()
+
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+    with uow:
+        product = uow.products.get(sku="LAMP")
+        assert [b.reference for b in product.batches] == [
+            "tie-low-id",
+            "tie-high-id",
+            "later",
+        ]
+        assert product.allocate(model.OrderLine("o1", "LAMP", 1)) == "tie-low-id"
+    [batches_query] = [
+        s for s, _ in uow.profile.statements if s.startswith("SELECT batches.")
+    ]
+    assert "ORDER BY" in batches_query
+
+    repo = repository.SqlAlchemyRepository(session)
+    assert repo.allocate(model.OrderLine("o1", "LAMP", 1)) == "tie-low-id"
+
+
+def test_sql_allocation_bumps_the_product_version(session):
+    repo = repository.SqlAlchemyRepository(session)
+    repo.add_many([model.Batch("b1", "LAMP", 10, None)])
+
+    assert repo.allocate(model.OrderLine("o1", "LAMP", 4)) == "b1"
+    with pytest.raises(model.OutOfStock):
+        repo.allocate(model.OrderLine("o2", "LAMP", 7))
+    assert repo.allocate(model.OrderLine("o1", "MISSING", 1)) is None
+
+    [[version]] = session.execute(
+        "SELECT version_number FROM products WHERE sku = 'LAMP'"
+    )
+    # 실패한 할당도 버전을 올리지만, 서비스 계층은 실패한 작업 단위를 롤백한다.
+    assert version == 2
+
+
+@pytest.fixture
+def sql_allocation(monkeypatch):
+    monkeypatch.setenv("SQL_ALLOCATION", "true")
+
+
+def test_services_allocate_in_sql_and_deallocate_in_the_domain(
+    session_factory, sql_allocation
+):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("b1", "LAMP", 10, date.today() + timedelta(days=1), uow)
+    services.add_batch("b2", "LAMP", 10, None, uow)
+
+    assert services.allocate("o1", "LAMP", 8, uow) == "b2"
+    assert services.allocate("o2", "LAMP", 8, uow) == "b1"
+    with pytest.raises(model.OutOfStock):
+        services.allocate("o3", "LAMP", 8, uow)
+    with pytest.raises(services.InvalidSku):
+        services.allocate("o3", "MISSING", 1, uow)
+
+    services.deallocate("o1", "LAMP", 8, uow)
+    assert services.allocate("o3", "LAMP", 8, uow) == "b2"
+    with uow:
+        batches = uow.products.get("LAMP").batches
+        assert [b.available_quantity for b in batches] == [2, 2]
+        rows = uow.session.execute(
+            "SELECT orderid, batchref FROM allocations_view ORDER BY orderid"
+        ).all()
+    assert rows == [("o2", "b1"), ("o3", "b2")]
+
+
+def test_concurrent_sql_allocations_never_over_allocate(
+    file_sqlite_session_factory, sql_allocation
+):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory)
+    services.add_batch("b1", "CONTENDED-LAMP", 50, None, uow)
+    outcomes = []
+
+    def allocate_many_times(thread: int):
+        for i in range(10):
+            uow = unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory)
+            try:
+                services.allocate(f"order-{thread}-{i}", "CONTENDED-LAMP", 1, uow)
+                outcomes.append("allocated")
+            except model.OutOfStock:
+                outcomes.append("out of stock")
+
+    threads = [
+        threading.Thread(target=allocate_many_times, args=(t,)) for t in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    session = file_sqlite_session_factory()
+    [[allocated_quantity, version]] = session.execute(
+        "SELECT b._allocated_quantity, p.version_number"
+        " FROM batches AS b JOIN products AS p ON p.sku = b.sku"
+    )
+    [[allocation_rows]] = session.execute("SELECT COUNT(*) FROM allocations")
+    assert outcomes.count("allocated") == allocated_quantity == allocation_rows == 50
+    assert version == 50
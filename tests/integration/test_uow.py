@@ -1,7 +1,13 @@
+import threading
+from datetime import date
+
 import pytest
+from sqlalchemy.orm import sessionmaker
 
+from src.allocation.adapters import metrics, orm
+from src.allocation.adapters.cache import BatchCache, IdempotencyCache
 from src.allocation.domain import model
-from src.allocation.service_layer import unit_of_work
+from src.allocation.service_layer import services, unit_of_work
 
 
 def insert_batch(session, ref, sku, qty, eta):
@@ -64,3 +70,444 @@ def test_rolls_back_on_error(session_factory):
     new_session = session_factory()
     rows = list(new_session.execute("SELECT * FROM 'batches'"))
     assert rows == []
+
+
+def test_allocated_quantity_is_persisted_with_allocations(session_factory):
+    session = session_factory()
+    insert_batch(session, "batch1", "SHABBY-OTTOMAN", 100, None)
+    session.commit()
+
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    with uow:
+        batch = uow.batches.get(reference="batch1")
+        batch.allocate(model.OrderLine("o1", "SHABBY-OTTOMAN", 10))
+        batch.allocate(model.OrderLine("o2", "SHABBY-OTTOMAN", 5))
+        uow.commit()
+
+    [[allocated]] = session.execute(
+        "SELECT _allocated_quantity FROM batches WHERE reference='batch1'"
+    )
+    assert allocated == 15
+
+    with uow:
+        batch = uow.batches.get(reference="batch1")
+        assert batch.available_quantity == 85
+        batch.deallocate(model.OrderLine("o1", "SHABBY-OTTOMAN", 10))
+        uow.commit()
+
+    with uow:
+        assert uow.batches.get(reference="batch1").allocated_quantity == 5
+
+
+def test_pool_stats_count_checkouts_of_configured_engine(tmp_path, session_factory):
+    engine = unit_of_work.create_engine_from_config(f"sqlite:///{tmp_path / 'db'}")
+    orm.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    for _ in range(3):
+        with unit_of_work.SqlAlchemyUnitOfWork(factory) as uow:
+            uow.batches.list()
+
+    stats = unit_of_work.pool_stats(factory)
+    assert stats["checkouts"] >= 3
+    assert stats["checkins"] == stats["checkouts"]
+    assert stats["checked_out"] == 0
+    assert stats["wait_count"] >= 1
+
+    engine.dispose()
+    with unit_of_work.SqlAlchemyUnitOfWork(factory) as uow:
+        uow.batches.list()
+    assert unit_of_work.pool_stats(factory)["checkouts"] > stats["checkouts"]
+
+
+def insert_product(session, sku, version_number=0):
+    session.execute(
+        "INSERT INTO products (sku, version_number) VALUES (:sku, :version)",
+        dict(sku=sku, version=version_number),
+    )
+
+
+def test_deallocate_loads_only_the_batch_holding_the_line(session_factory):
+    session = session_factory()
+    insert_product(session, "DUSTY-LAMP")
+    insert_batch(session, "batch1", "DUSTY-LAMP", 100, None)
+    insert_batch(session, "batch2", "DUSTY-LAMP", 100, None)
+    session.commit()
+    services.allocate(
+        "o1", "DUSTY-LAMP", 10, unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    )
+
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    with uow:
+        batches = uow.batches.for_order("o1", "DUSTY-LAMP")
+        assert [b.reference for b in batches] == ["batch1"]
+        product = uow.products.get("DUSTY-LAMP", with_batches=False)
+        product.deallocate(model.OrderLine("o1", "DUSTY-LAMP", 10), batches)
+        loaded = {
+            obj.reference
+            for obj in uow.session.identity_map.values()
+            if isinstance(obj, model.Batch)
+        }
+        assert loaded == {"batch1"}
+        uow.commit()
+
+    rows = session.execute(
+        "SELECT reference, _allocated_quantity FROM batches ORDER BY reference"
+    )
+    assert list(rows) == [("batch1", 0), ("batch2", 0)]
+    [[version]] = session.execute("SELECT version_number FROM products")
+    assert version == 2
+    assert list(session.execute("SELECT * FROM allocations")) == []
+
+
+def test_concurrent_updates_to_version_are_not_allowed(file_sqlite_session_factory):
+    session = file_sqlite_session_factory()
+    insert_product(session, "SLEEK-CUPBOARD", 1)
+    insert_batch(session, "batch1", "SLEEK-CUPBOARD", 100, None)
+    session.commit()
+
+    uow1 = unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory)
+    uow2 = unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory)
+    with uow1, uow2:
+        product1 = uow1.products.get(sku="SLEEK-CUPBOARD")
+        product2 = uow2.products.get(sku="SLEEK-CUPBOARD")
+        product1.allocate(model.OrderLine("o1", "SLEEK-CUPBOARD", 10))
+        product2.allocate(model.OrderLine("o2", "SLEEK-CUPBOARD", 10))
+        uow1.commit()
+        with pytest.raises(unit_of_work.ConcurrencyError):
+            uow2.commit()
+
+    [[version]] = session.execute(
+        "SELECT version_number FROM products WHERE sku='SLEEK-CUPBOARD'"
+    )
+    assert version == 2
+    assert get_allocated_batch_ref(session, "o1", "SLEEK-CUPBOARD") == "batch1"
+
+
+@pytest.mark.parametrize("sql_allocation", ["false", "true"])
+@pytest.mark.parametrize(
+    "deallocate",
+    [
+        lambda uow: services.deallocate("o1", "SLEEK-CUPBOARD", 10, uow),
+        lambda uow: services.deallocate_order("o1", uow),
+    ],
+    ids=["line", "order"],
+)
+def test_allocation_committed_while_deallocating_is_not_lost(
+    file_sqlite_session_factory, monkeypatch, sql_allocation, deallocate
+):
+    """
+    할당 해제가 batch 를 읽은 직후에 같은 batch 로의 다른 할당이 커밋되어도,
+    해제는 오래된 batch 의 할당 수량을 덮어쓰지 않고 재시도한다.
+    """
+    monkeypatch.setenv("SQL_ALLOCATION", sql_allocation)
+    session = file_sqlite_session_factory()
+    insert_product(session, "SLEEK-CUPBOARD")
+    insert_batch(session, "batch1", "SLEEK-CUPBOARD", 100, None)
+    session.commit()
+    services.allocate(
+        "o1",
+        "SLEEK-CUPBOARD",
+        10,
+        unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory),
+    )
+    interleaved = []
+
+    class InterleavingUnitOfWork(unit_of_work.SqlAlchemyUnitOfWork):
+        def __enter__(self):
+            uow = super().__enter__()
+            for_order = self.batches.for_order
+
+            def for_order_then_allocate(*args):
+                batches = for_order(*args)
+                if not interleaved:
+                    interleaved.append(True)
+                    services.allocate(
+                        "o2",
+                        "SLEEK-CUPBOARD",
+                        5,
+                        unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory),
+                    )
+                return batches
+
+            self.batches.for_order = for_order_then_allocate
+            return uow
+
+    deallocate(InterleavingUnitOfWork(file_sqlite_session_factory))
+
+    [[allocated_quantity]] = session.execute(
+        "SELECT _allocated_quantity FROM batches WHERE reference = 'batch1'"
+    )
+    [[allocated_lines]] = session.execute(
+        "SELECT SUM(ol.qty) FROM allocations AS a"
+        " JOIN order_lines AS ol ON ol.id = a.orderline_id"
+    )
+    [[stock_allocated]] = session.execute(
+        "SELECT allocated FROM stock WHERE sku = 'SLEEK-CUPBOARD'"
+    )
+    assert allocated_quantity == allocated_lines == stock_allocated == 5
+
+
+def test_concurrent_allocations_never_over_allocate(file_sqlite_session_factory):
+    """
+    여러 스레드가 같은 SKU 에 동시에 할당해도, 충돌한 커밋은 재시도되어
+    purchased 수량을 넘어서 할당되지 않고 allocated_quantity 도 할당 내역과 일치해야 한다.
+    다른 SKU 에 대한 할당은 서로 충돌하지 않는다.
+    """
+    session = file_sqlite_session_factory()
+    for sku in ("CONTENDED-LAMP", "QUIET-LAMP"):
+        insert_product(session, sku)
+        insert_batch(session, f"batch-{sku}", sku, 50, None)
+    session.commit()
+
+    outcomes = []
+
+    def allocate_many_times(thread: int):
+        sku = "QUIET-LAMP" if thread == 0 else "CONTENDED-LAMP"
+        for i in range(10):
+            uow = unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory)
+            try:
+                services.allocate(f"order-{thread}-{i}", sku, 1, uow)
+                outcomes.append((sku, "allocated"))
+            except model.OutOfStock:
+                outcomes.append((sku, "out of stock"))
+            except unit_of_work.ConcurrencyError:
+                outcomes.append((sku, "conflict"))
+
+    threads = [
+        threading.Thread(target=allocate_many_times, args=(t,)) for t in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outcomes.count(("QUIET-LAMP", "allocated")) == 10
+    allocated = outcomes.count(("CONTENDED-LAMP", "allocated"))
+    assert allocated <= 50
+    [[purchased, allocated_quantity, version]] = session.execute(
+        "SELECT b._purchased_quantity, b._allocated_quantity, p.version_number"
+        " FROM batches AS b JOIN products AS p ON p.sku = b.sku"
+        " WHERE b.sku = 'CONTENDED-LAMP'"
+    )
+    [[allocation_rows]] = session.execute(
+        "SELECT COUNT(*) FROM allocations AS a JOIN batches AS b ON b.id = a.batch_id"
+        " WHERE b.sku = 'CONTENDED-LAMP'"
+    )
+    assert allocated_quantity == allocation_rows == allocated
+    assert version == allocated
+
+
+def test_cached_batches_are_invalidated_when_allocation_commits(session_factory):
+    session = session_factory()
+    insert_product(session, "PLUSH-RUG")
+    insert_batch(session, "batch1", "PLUSH-RUG", 100, None)
+    session.commit()
+    cache = BatchCache()
+
+    def available_quantity():
+        with unit_of_work.SqlAlchemyUnitOfWork(session_factory, cache=cache) as uow:
+            [batch] = uow.batches.for_sku("PLUSH-RUG")
+            return batch.available_quantity
+
+    assert available_quantity() == 100
+    assert available_quantity() == 100
+    assert cache.stats()["hits"] == 1
+
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, cache=cache)
+    services.allocate("o1", "PLUSH-RUG", 10, uow)
+
+    assert available_quantity() == 90
+    assert cache.stats()["hits"] == 1
+
+
+def test_replayed_allocation_only_reads_the_idempotency_key(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+    services.add_batch("batch1", "PLUSH-RUG", 100, None, uow)
+    services.allocate("o1", "PLUSH-RUG", 10, uow)
+
+    assert services.allocate("o1", "PLUSH-RUG", 10, uow) == "batch1"
+
+    [(statement, _)] = uow.profile.statements
+    assert "FROM idempotency_keys" in statement
+    session = session_factory()
+    [[allocated]] = session.execute(
+        "SELECT _allocated_quantity FROM batches WHERE reference = 'batch1'"
+    )
+    assert allocated == 10
+
+
+def test_deallocating_a_different_qty_does_not_forget_the_idempotency_key(
+    session_factory,
+):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("batch1", "PLUSH-RUG", 10, None, uow)
+    services.add_batch("batch2", "PLUSH-RUG", 10, date(2011, 1, 1), uow)
+    services.allocate("o1", "PLUSH-RUG", 6, uow)
+
+    services.deallocate("o1", "PLUSH-RUG", 5, uow)
+
+    assert services.allocate("o1", "PLUSH-RUG", 6, uow) == "batch1"
+    session = session_factory()
+    rows = session.execute(
+        "SELECT reference, _allocated_quantity FROM batches ORDER BY reference"
+    )
+    assert list(rows) == [("batch1", 6), ("batch2", 0)]
+    [[keys]] = session.execute("SELECT COUNT(*) FROM idempotency_keys")
+    assert keys == 1
+
+
+def test_cached_idempotency_keys_skip_the_database(session_factory):
+    cache = IdempotencyCache()
+    uow = unit_of_work.SqlAlchemyUnitOfWork(
+        session_factory, profile=True, idempotency_cache=cache
+    )
+    services.add_batch("batch1", "PLUSH-RUG", 100, None, uow)
+    services.allocate("o1", "PLUSH-RUG", 10, uow)
+
+    assert services.allocate("o1", "PLUSH-RUG", 10, uow) == "batch1"
+    assert uow.profile.count == 0
+
+    services.deallocate("o1", "PLUSH-RUG", 10, uow)
+    assert cache.get("o1:PLUSH-RUG") is None
+    services.allocate("o1", "PLUSH-RUG", 20, uow)
+    session = session_factory()
+    [[allocated]] = session.execute(
+        "SELECT _allocated_quantity FROM batches WHERE reference = 'batch1'"
+    )
+    assert allocated == 20
+
+
+@pytest.mark.parametrize("cache", [None, IdempotencyCache()])
+def test_replaying_a_key_with_a_different_qty_is_rejected(session_factory, cache):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, idempotency_cache=cache)
+    services.add_batch("batch1", "PLUSH-RUG", 100, None, uow)
+    services.allocate("o1", "PLUSH-RUG", 10, uow)
+
+    for _ in range(2):
+        with pytest.raises(services.IdempotencyConflict):
+            services.allocate("o1", "PLUSH-RUG", 20, uow)
+
+    session = session_factory()
+    [[allocated]] = session.execute(
+        "SELECT _allocated_quantity FROM batches WHERE reference = 'batch1'"
+    )
+    assert allocated == 10
+
+
+def test_concurrent_retries_of_one_request_allocate_once(file_sqlite_session_factory):
+    session = file_sqlite_session_factory()
+    insert_product(session, "CONTENDED-LAMP")
+    insert_batch(session, "batch1", "CONTENDED-LAMP", 100, None)
+    insert_batch(session, "batch2", "CONTENDED-LAMP", 100, None)
+    session.commit()
+    results = []
+
+    def retry():
+        uow = unit_of_work.SqlAlchemyUnitOfWork(file_sqlite_session_factory)
+        results.append(services.allocate("o1", "CONTENDED-LAMP", 60, uow))
+
+    threads = [threading.Thread(target=retry) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["batch1"] * 4
+    [[allocated]] = session.execute(
+        "SELECT SUM(_allocated_quantity) FROM batches WHERE sku = 'CONTENDED-LAMP'"
+    )
+    assert allocated == 60
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.REGISTRY.reset()
+    metrics.REGISTRY.enabled = True
+    yield metrics.REGISTRY
+    metrics.REGISTRY.enabled = False
+    metrics.REGISTRY.reset()
+
+
+def test_uow_records_latency_of_each_layer(session_factory, enabled_metrics):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("batch1", "QUIET-DESK", 100, None, uow)
+    services.allocate("o1", "QUIET-DESK", 10, uow)
+
+    for span in (
+        "uow.enter",
+        "uow.commit",
+        "uow.rollback",
+        "repository.products.get",
+        "domain.allocate",
+    ):
+        assert enabled_metrics.histogram(span).count >= 1, span
+    assert enabled_metrics.histogram("domain.allocate").count == 1
+
+
+def test_allocate_issues_a_bounded_number_of_queries(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+    for i in range(10):
+        services.add_batch(f"batch{i}", "TALL-LAMP", 100, None, uow)
+
+    services.allocate("o1", "TALL-LAMP", 10, uow)
+
+    selects = [s for s, _ in uow.profile.statements if s.startswith("SELECT")]
+    # 멱등 키 조회 1 개와, stock 갱신 전 products 행 잠금, stock 합계 갱신(upsert)과 멱등 키 기록 2 개를
+    # 포함한다.
+    assert len(selects) <= 5
+    assert uow.profile.count <= 12
+    assert uow.profile.n_plus_one() == {}
+
+
+def test_deallocate_issues_a_bounded_number_of_queries(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+    for i in range(10):
+        services.add_batch(f"batch{i}", "TALL-LAMP", 100, None, uow)
+    services.allocate("o1", "TALL-LAMP", 10, uow)
+
+    services.deallocate("o1", "TALL-LAMP", 10, uow)
+
+    assert uow.profile.count <= 10
+    assert uow.profile.n_plus_one() == {}
+
+
+def test_add_batches_rejects_a_reference_added_by_an_earlier_chunk(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("batch1", "HIPSTER-WORKBENCH", 10, None, uow)
+    rows = [(f"batch{i}", "HIPSTER-WORKBENCH", 10, None) for i in (2, 3, 4, 2)]
+
+    with pytest.raises(services.DuplicateBatch, match="reference batch2$"):
+        services.add_batches(rows, uow, chunk_size=3)
+    with pytest.raises(services.DuplicateBatch, match="reference batch1$"):
+        services.add_batch("batch1", "OTHER-WORKBENCH", 10, None, uow)
+
+    session = session_factory()
+    assert list(session.execute("SELECT reference FROM batches")) == [("batch1",)]
+
+
+def test_allocate_many_loads_all_skus_in_one_query_each(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    skus = [f"LAMP-{i}" for i in range(5)]
+    services.add_batches([(f"batch-{sku}", sku, 100, None) for sku in skus], uow)
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+
+    results = services.allocate_many([("o1", sku, 1) for sku in [*skus, "NOPE"]], uow)
+
+    assert results[:5] == [f"batch-{sku}" for sku in skus]
+    selects = [s for s, _ in uow.profile.statements if s.startswith("SELECT")]
+    # 멱등 키, products, batches, allocations 를 한 번씩 읽고, stock 갱신 전에 products 행을 잠근다.
+    assert len(selects) == 5
+    assert uow.profile.n_plus_one() == {}
+
+
+def test_listing_batches_does_not_load_allocations_per_batch(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+    for i in range(10):
+        services.add_batch(f"batch{i}", "TALL-LAMP", 100, None, uow)
+
+    with uow:
+        assert sum(b.allocated_quantity for b in uow.batches.list()) == 0
+
+    assert uow.profile.count == 2
+    assert uow.profile.n_plus_one() == {}
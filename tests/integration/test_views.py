@@ -0,0 +1,175 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.allocation import views
+from src.allocation.adapters import repository
+from src.allocation.adapters.cache import BatchCache
+from src.allocation.service_layer import services, unit_of_work
+
+
+def test_allocations_view(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("sku1batch", "sku1", 50, None, uow)
+    services.add_batch("sku2batch", "sku2", 50, None, uow)
+    services.allocate("order1", "sku1", 20, uow)
+    services.allocate("order1", "sku2", 20, uow)
+    services.allocate("otherorder", "sku1", 30, uow)
+
+    assert views.allocations("order1", uow) == [
+        {"sku": "sku1", "qty": 20, "batchref": "sku1batch"},
+        {"sku": "sku2", "qty": 20, "batchref": "sku2batch"},
+    ]
+
+
+def test_deallocation_is_reflected_in_the_view(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("b1", "sku1", 50, None, uow)
+    services.allocate_many([("o1", "sku1", 10), ("o2", "sku1", 10)], uow)
+
+    services.deallocate("o1", "sku1", 10, uow)
+    assert views.allocations("o1", uow) == []
+
+    services.deallocate_order("o2", uow)
+    assert views.allocations("o2", uow) == []
+
+
+def test_view_query_uses_the_orderid_index(session):
+    plan = " ".join(
+        str(row[-1])
+        for row in session.execute(
+            "EXPLAIN QUERY PLAN SELECT sku, qty, batchref FROM allocations_view"
+            " WHERE orderid = 'o1' ORDER BY id"
+        )
+    )
+
+    assert "ix_allocations_view_orderid" in plan
+
+
+def test_stock_is_kept_up_to_date_by_the_services(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("b1", "sku1", 50, None, uow)
+    services.add_batch("b2", "sku1", 30, date(2011, 1, 2), uow)
+    services.add_batch("b3", "sku1", 20, date(2011, 1, 1), uow)
+    services.allocate("o1", "sku1", 10, uow)
+    services.allocate("o1", "sku1", 10, uow)
+    services.allocate_many([("o2", "sku1", 5), ("o3", "sku1", 100)], uow)
+
+    assert views.stock(["sku1"], uow) == [
+        {
+            "sku": "sku1",
+            "purchased": 100,
+            "allocated": 15,
+            "available": 85,
+            "earliest_eta": "2011-01-01",
+        }
+    ]
+
+    services.deallocate("o1", "sku1", 10, uow)
+    services.deallocate_order("o2", uow)
+    assert views.stock(["sku1"], uow)[0]["allocated"] == 0
+
+
+def test_stock_for_several_skus_skips_unknown_ones(session_factory):
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batches(
+        [("b1", "sku1", 10, None), ("b2", "sku2", 20, date(2011, 1, 1))], uow
+    )
+
+    result = views.stock(["sku2", "missing", "sku1"], uow)
+
+    assert [(r["sku"], r["available"], r["earliest_eta"]) for r in result] == [
+        ("sku2", 20, "2011-01-01"),
+        ("sku1", 10, None),
+    ]
+
+
+def test_stock_matches_the_batches_with_sql_allocation(session_factory, monkeypatch):
+    monkeypatch.setenv("SQL_ALLOCATION", "true")
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    services.add_batch("b1", "sku1", 50, None, uow)
+
+    services.allocate("o1", "sku1", 20, uow)
+
+    assert views.stock(["sku1"], uow)[0]["available"] == 30
+
+
+def test_batches_view_is_served_from_the_cache_until_a_write_commits(
+    session_factory, monkeypatch
+):
+    cache = BatchCache()
+
+    def new_uow():
+        return unit_of_work.SqlAlchemyUnitOfWork(session_factory, cache=cache)
+
+    def available():
+        return {
+            b["reference"]: b["available"] for b in views.batches("sku1", new_uow())
+        }
+
+    services.add_batch("b1", "sku1", 50, date(2026, 1, 2), new_uow())
+    services.add_batch("b2", "sku1", 50, None, new_uow())
+
+    assert views.batches("sku1", new_uow()) == [
+        dict(reference="b2", purchased=50, allocated=0, available=50, eta=None),
+        dict(reference="b1", purchased=50, allocated=0, available=50, eta="2026-01-02"),
+    ]
+    assert available() == {"b1": 50, "b2": 50}
+    assert cache.stats()["hits"] == 1
+
+    services.allocate("o1", "sku1", 20, new_uow())
+    assert available() == {"b1": 50, "b2": 30}
+
+    services.add_batches([("b3", "sku1", 10, None)], new_uow())
+    assert available() == {"b1": 50, "b2": 30, "b3": 10}
+
+    monkeypatch.setenv("SQL_ALLOCATION", "true")
+    services.allocate("o2", "sku1", 5, new_uow())
+    assert available() == {"b1": 50, "b2": 25, "b3": 10}
+
+    services.deallocate("o1", "sku1", 20, new_uow())
+    assert available() == {"b1": 50, "b2": 45, "b3": 10}
+    assert available() == {"b1": 50, "b2": 45, "b3": 10}
+    assert cache.stats()["hits"] == 2
+
+
+@pytest.mark.parametrize(
+    "add",
+    [
+        lambda uow: services.add_batch("b2", "sku1", 10, None, uow),
+        lambda uow: services.add_batches([("b2", "sku1", 10, None)], uow),
+    ],
+    ids=["add_batch", "add_batches"],
+)
+def test_adding_a_batch_locks_the_product_before_refreshing_stock(session_factory, add):
+    services.add_batch(
+        "b1", "sku1", 50, None, unit_of_work.SqlAlchemyUnitOfWork(session_factory)
+    )
+    uow = unit_of_work.SqlAlchemyUnitOfWork(session_factory, profile=True)
+
+    add(uow)
+
+    statements = [s for s, _ in uow.profile.statements]
+    lock = next(i for i, s in enumerate(statements) if "ORDER BY products.sku" in s)
+    refresh = next(i for i, s in enumerate(statements) if "INSERT INTO stock" in s)
+    assert lock < refresh
+    assert views.stock(["sku1"], uow)[0]["available"] == 60
+
+
+def test_products_are_locked_for_update_on_postgres():
+    lock = repository._lock_products({"sku2", "sku1"})
+
+    assert str(lock.compile(dialect=postgresql.dialect())).endswith("FOR UPDATE")
+
+
+def test_stock_query_uses_the_primary_key(session):
+    plan = " ".join(
+        str(row[-1])
+        for row in session.execute(
+            "EXPLAIN QUERY PLAN SELECT sku, purchased, allocated, earliest_eta"
+            " FROM stock WHERE sku IN ('a', 'b')"
+        )
+    )
+
+    assert "USING INDEX sqlite_autoindex_stock_1" in plan
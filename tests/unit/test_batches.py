@@ -94,6 +94,17 @@ class TestBatch:
     @staticmethod
     def test_can_only_deallocate_allocated_line():
         batch, order_line = make_temp_batch_and_order_line("ELEGANT-LAMP", 3, 3)
-        batch.deallocate(order_line)
 
+        assert batch.deallocate(order_line) is False
         assert batch.available_quantity == 3
+
+    @staticmethod
+    def test_deallocating_restores_allocated_quantity():
+        batch, order_line = make_temp_batch_and_order_line("ELEGANT-LAMP", 20, 2)
+        batch.allocate(order_line)
+        assert batch.allocated_quantity == 2
+
+        assert batch.deallocate(order_line) is True
+
+        assert batch.allocated_quantity == 0
+        assert batch.available_quantity == 20
@@ -0,0 +1,97 @@
+from src.allocation.adapters.cache import BatchCache, IdempotencyCache, snapshot
+from src.allocation.domain.model import Batch, OrderLine
+
+
+def make_batch(reference: str, sku: str = "LUMPY-CUSHION") -> Batch:
+    batch = Batch(reference, sku, 100)
+    batch.allocate(OrderLine("order1", sku, 10))
+    return batch
+
+
+def test_returns_copies_of_cached_batches():
+    cache = BatchCache()
+    cache.put([snapshot(make_batch("b1"))], cache.generation)
+
+    cached = cache.get("b1")
+    cached.allocate(OrderLine("order2", "LUMPY-CUSHION", 10))
+
+    assert cached.available_quantity == 80
+    assert cache.get("b1").available_quantity == 90
+    assert cache.stats()["hits"] == 2
+
+
+def test_caches_batches_by_sku():
+    cache = BatchCache()
+    assert cache.get_sku("LUMPY-CUSHION") is None
+
+    cache.put(
+        [snapshot(make_batch("b1")), snapshot(make_batch("b2"))],
+        cache.generation,
+        sku="LUMPY-CUSHION",
+    )
+
+    assert {b.reference for b in cache.get_sku("LUMPY-CUSHION")} == {"b1", "b2"}
+    assert cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_batches():
+    cache = BatchCache(maxsize=2)
+    for ref in ("b1", "b2"):
+        cache.put([snapshot(make_batch(ref))], cache.generation)
+    cache.get("b1")
+
+    cache.put([snapshot(make_batch("b3"))], cache.generation)
+
+    assert cache.get("b2") is None
+    assert cache.get("b1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_removes_sku_and_rejects_values_read_before_it():
+    cache = BatchCache()
+    cache.put([snapshot(make_batch("b1"))], cache.generation, sku="LUMPY-CUSHION")
+    read_started_at = cache.generation
+
+    cache.invalidate({"LUMPY-CUSHION"})
+    cache.put([snapshot(make_batch("b1"))], read_started_at, sku="LUMPY-CUSHION")
+
+    assert cache.get("b1") is None
+    assert cache.get_sku("LUMPY-CUSHION") is None
+
+
+def test_idempotency_cache_evicts_least_recently_used_keys():
+    cache = IdempotencyCache(maxsize=2)
+    cache.put([("k1", "o1", "LAMP", 1, "b1"), ("k2", "o2", "LAMP", 1, "b1")], 0)
+    cache.get("k1")
+
+    cache.put([("k3", "o3", "LAMP", 1, "b2")], cache.generation)
+
+    assert cache.get("k2") is None
+    assert (cache.get("k1"), cache.get("k3")) == (
+        (OrderLine("o1", "LAMP", 1), "b1"),
+        (OrderLine("o3", "LAMP", 1), "b2"),
+    )
+    assert cache.stats()["evictions"] == 1
+
+
+def test_idempotency_cache_invalidates_keys_of_deallocated_lines():
+    cache = IdempotencyCache()
+    cache.put(
+        [
+            ("k1", "o1", "LAMP", 1, "b1"),
+            ("k2", "o1", "TABLE", 2, "b2"),
+            ("k3", "o2", "LAMP", 3, "b1"),
+        ],
+        cache.generation,
+    )
+    read_started_at = cache.generation
+
+    cache.invalidate({("o1", "LAMP")})
+    assert cache.get("k1") is None
+    assert cache.get("k2") == (OrderLine("o1", "TABLE", 2), "b2")
+    cache.invalidate({("o1", None)})
+    assert cache.get("k2") is None
+
+    cache.put([("k1", "o1", "LAMP", 1, "b1")], read_started_at)
+    assert cache.get("k1") is None
+    assert cache.get("k3") == (OrderLine("o2", "LAMP", 3), "b1")
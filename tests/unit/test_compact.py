@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+import pytest
+
+from src.allocation.domain import compact, model
+
+today = date.today()
+tomorrow = today + timedelta(days=1)
+
+
+def test_compact_objects_have_no_instance_dict():
+    line = compact.OrderLine("order1", "SMALL-TABLE", 2)
+    batch = compact.Batch("batch1", "SMALL-TABLE", 20)
+
+    assert not hasattr(line, "__dict__")
+    assert not hasattr(batch, "__dict__")
+
+
+def test_compact_batches_share_the_domain_batch_behaviour():
+    for name in ("allocate", "deallocate", "can_allocate", "__eq__", "__gt__"):
+        assert getattr(compact.Batch, name) is getattr(model.Batch, name)
+    assert compact.Batch("b1", "LAMP", 1) == compact.Batch("b1", "LAMP", 2)
+    assert compact.Batch("b1", "LAMP", 1) != model.Batch("b1", "LAMP", 1)
+
+
+def test_compact_order_lines_are_value_objects():
+    assert compact.OrderLine("order1", "LAMP", 1) == compact.OrderLine(
+        "order1", "LAMP", 1
+    )
+    assert (
+        len(
+            {compact.OrderLine("order1", "LAMP", 1)}
+            | {compact.OrderLine("order1", "LAMP", 1)}
+        )
+        == 1
+    )
+
+
+def test_compact_batches_work_with_domain_allocate_and_product():
+    in_stock = compact.Batch("in-stock", "CLOCK", 10, eta=None)
+    shipment = compact.Batch("shipment", "CLOCK", 100, eta=tomorrow)
+    product = model.Product("CLOCK", [shipment, in_stock])
+
+    assert product.allocate(compact.OrderLine("o1", "CLOCK", 10)) == "in-stock"
+    assert (
+        model.allocate(compact.OrderLine("o2", "CLOCK", 10), [shipment, in_stock])
+        == "shipment"
+    )
+    assert shipment.available_quantity == 90
+
+    product.deallocate(compact.OrderLine("o1", "CLOCK", 10))
+    assert in_stock.available_quantity == 10
+
+    with pytest.raises(model.OutOfStock):
+        model.allocate(compact.OrderLine("o3", "CLOCK", 1000), [shipment, in_stock])
+
+
+def test_from_batch_copies_allocations():
+    batch = model.Batch("batch1", "CHAIR", 20, eta=today)
+    batch.allocate(model.OrderLine("order1", "CHAIR", 5))
+
+    copied = compact.from_batch(batch)
+
+    assert copied.reference == "batch1" and copied.eta == today
+    assert copied.available_quantity == 15
+    copied.deallocate(compact.OrderLine("order1", "CHAIR", 5))
+    assert copied.available_quantity == 20
+    assert batch.available_quantity == 15
@@ -0,0 +1,125 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.allocation.adapters import memory
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+from src.allocation.service_layer.dispatcher import Overloaded, SkuDispatcher
+
+
+class CountingStore(memory.InMemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.conflicts = 0
+
+    def commit(self, *args):
+        try:
+            super().commit(*args)
+        except memory.StaleSnapshot:
+            self.conflicts += 1
+            raise
+
+
+@pytest.fixture
+def store():
+    return CountingStore()
+
+
+@pytest.fixture
+def dispatcher(store):
+    dispatcher = SkuDispatcher(
+        lambda: unit_of_work.InMemoryUnitOfWork(store), workers=4
+    )
+    yield dispatcher
+    dispatcher.close()
+
+
+def skus_on_different_workers(dispatcher: SkuDispatcher) -> tuple[str, str]:
+    first = "SKU-0"
+    other = next(
+        f"SKU-{i}"
+        for i in range(1, 100)
+        if dispatcher.worker_for(f"SKU-{i}") != dispatcher.worker_for(first)
+    )
+    return first, other
+
+
+def test_writes_to_one_sku_never_conflict(store, dispatcher):
+    services.add_batch(
+        "b1", "CONTENDED-LAMP", 100, None, unit_of_work.InMemoryUnitOfWork(store)
+    )
+
+    def allocate(i: int) -> str:
+        return dispatcher.allocate(f"order-{i}", "CONTENDED-LAMP", 1)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(allocate, range(80)))
+
+    assert results == ["b1"] * 80
+    assert store.conflicts == 0
+    assert store.product("CONTENDED-LAMP").version_number == 80
+
+
+def test_each_sku_always_runs_on_the_same_worker(dispatcher):
+    def thread_name(uow):
+        return threading.current_thread().name
+
+    names = {
+        sku: {dispatcher.submit(sku, thread_name).result() for _ in range(5)}
+        for sku in ("A", "B", "C", "D", "E")
+    }
+
+    for sku, threads in names.items():
+        assert threads == {f"sku-worker-{dispatcher.worker_for(sku)}"}
+
+
+def test_different_skus_run_in_parallel(dispatcher):
+    blocked_sku, other_sku = skus_on_different_workers(dispatcher)
+    release = threading.Event()
+    blocked = dispatcher.submit(blocked_sku, lambda uow: release.wait(5))
+
+    assert dispatcher.submit(other_sku, lambda uow: "done").result(timeout=5) == "done"
+    assert not blocked.done()
+    release.set()
+    assert blocked.result(timeout=5) is True
+
+
+def test_domain_errors_are_raised_to_the_caller(store, dispatcher):
+    services.add_batch("b1", "LAMP", 10, None, unit_of_work.InMemoryUnitOfWork(store))
+
+    with pytest.raises(model.OutOfStock):
+        dispatcher.allocate("o1", "LAMP", 11)
+    with pytest.raises(services.InvalidSku):
+        dispatcher.allocate("o1", "MISSING", 1)
+    assert dispatcher.allocate("o1", "LAMP", 10) == "b1"
+    dispatcher.deallocate("o1", "LAMP", 10)
+    assert store.product("LAMP").batches[0].available_quantity == 10
+
+
+def test_rejects_requests_when_the_sku_queue_is_full(store):
+    dispatcher = SkuDispatcher(
+        lambda: unit_of_work.InMemoryUnitOfWork(store),
+        workers=1,
+        queue_size=1,
+        put_timeout=0.01,
+    )
+    release = threading.Event()
+    started = threading.Event()
+
+    def block(uow):
+        started.set()
+        release.wait(5)
+
+    running = dispatcher.submit("LAMP", block)
+    started.wait(5)
+    queued = dispatcher.submit("LAMP", lambda uow: "queued")
+
+    with pytest.raises(Overloaded):
+        dispatcher.submit("LAMP", lambda uow: "rejected")
+
+    release.set()
+    assert queued.result(timeout=5) == "queued"
+    running.result(timeout=5)
+    dispatcher.close()
@@ -0,0 +1,140 @@
+import pytest
+
+from src.allocation.adapters import metrics
+from src.allocation.domain import model
+from src.allocation.service_layer import services
+from src.allocation.service_layer.group_commit import GroupCommitter
+from tests.unit.test_services import FakeUnitOfWork
+
+
+class CountingUnitOfWork(FakeUnitOfWork):
+    def __init__(self):
+        super().__init__()
+        self.commits = 0
+
+    def commit(self):
+        super().commit()
+        self.commits += 1
+
+
+@pytest.fixture
+def uow():
+    uow = CountingUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    uow.commits = 0
+    return uow
+
+
+def test_each_caller_gets_its_own_result_from_one_commit(uow):
+    committer = GroupCommitter(lambda: uow, window=10, max_batch=4)
+
+    futures = [
+        committer.submit("o1", "LAMP", 6),
+        committer.submit("o2", "LAMP", 6),
+        committer.submit("o3", "MISSING", 1),
+        committer.submit("o4", "LAMP", 4),
+    ]
+
+    assert futures[0].result(timeout=5) == "b1"
+    with pytest.raises(model.OutOfStock):
+        futures[1].result(timeout=5)
+    with pytest.raises(services.InvalidSku):
+        futures[2].result(timeout=5)
+    assert futures[3].result(timeout=5) == "b1"
+    assert uow.commits == 1
+    assert uow.allocations_view.rows == [
+        ("o1", "LAMP", 6, "b1"),
+        ("o4", "LAMP", 4, "b1"),
+    ]
+    committer.close()
+
+
+def test_a_full_batch_is_committed_without_waiting_for_the_window(uow):
+    committer = GroupCommitter(lambda: uow, window=60, max_batch=3)
+
+    futures = [committer.submit(f"o{i}", "LAMP", 1) for i in range(6)]
+
+    assert [f.result(timeout=5) for f in futures] == ["b1"] * 6
+    assert uow.commits == 2
+    committer.close()
+
+
+def test_queued_requests_are_committed_when_closing(uow):
+    committer = GroupCommitter(lambda: uow, window=60, max_batch=10)
+    futures = [committer.submit(f"o{i}", "LAMP", 1) for i in range(3)]
+
+    committer.close()
+
+    assert [f.result(timeout=0) for f in futures] == ["b1"] * 3
+
+
+def test_a_failed_commit_fails_every_request_in_the_batch(uow):
+    class Broken(Exception):
+        pass
+
+    def fail():
+        raise Broken()
+
+    uow.commit = fail
+    committer = GroupCommitter(lambda: uow, window=10, max_batch=2)
+
+    futures = [committer.submit("o1", "LAMP", 1), committer.submit("o2", "LAMP", 1)]
+
+    for future in futures:
+        with pytest.raises(Broken):
+            future.result(timeout=5)
+    committer.close()
+
+
+def test_a_failed_commit_is_retried_per_sku_and_only_fails_that_sku(uow):
+    class Broken(Exception):
+        pass
+
+    services.add_batch("b2", "TABLE", 10, None, uow)
+    commit = uow.commit
+    committed_lines = []
+
+    def fail_for_lamp():
+        pending = list(uow.idempotency_keys.pending.values())
+        if any(line.sku == "LAMP" for line, _ in pending):
+            uow.rollback()
+            raise Broken()
+        committed_lines.extend(pending)
+        commit()
+
+    uow.commit = fail_for_lamp
+    committer = GroupCommitter(lambda: uow, window=10, max_batch=3)
+
+    futures = [
+        committer.submit("o1", "LAMP", 1),
+        committer.submit("o2", "TABLE", 1),
+        committer.submit("o3", "LAMP", 1),
+    ]
+
+    for future in (futures[0], futures[2]):
+        with pytest.raises(Broken):
+            future.result(timeout=5)
+    assert futures[1].result(timeout=5) == "b2"
+    assert committed_lines == [(model.OrderLine("o2", "TABLE", 1), "b2")]
+    committer.close()
+
+
+def test_records_batch_sizes_and_queueing_delay(uow):
+    metrics.REGISTRY.reset()
+    metrics.REGISTRY.enabled = True
+    try:
+        committer = GroupCommitter(lambda: uow, window=10, max_batch=2)
+        for future in [committer.submit(f"o{i}", "LAMP", 1) for i in range(4)]:
+            future.result(timeout=5)
+        committer.close()
+
+        sizes = metrics.REGISTRY.size_histogram("group_commit")
+        assert (sizes.count, sizes.sum) == (2, 4)
+        assert metrics.REGISTRY.histogram("group_commit.queue").count == 4
+        assert metrics.REGISTRY.histogram("group_commit.flush").count == 2
+        assert 'allocation_batch_size_count{span="group_commit"} 2' in (
+            metrics.REGISTRY.render()
+        )
+    finally:
+        metrics.REGISTRY.enabled = False
+        metrics.REGISTRY.reset()
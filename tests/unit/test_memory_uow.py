@@ -0,0 +1,195 @@
+import threading
+
+import pytest
+
+from src.allocation import views
+from src.allocation.adapters import memory
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+
+
+@pytest.fixture
+def store():
+    return memory.InMemoryStore()
+
+
+def test_allocate_and_deallocate_through_the_memory_backend(store):
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+    services.add_batch("b2", "RED-CHAIR", 100, None, uow)
+
+    assert services.allocate("o1", "ROUND-TABLE", 10, uow) == "b1"
+    assert services.allocate("o1", "RED-CHAIR", 5, uow) == "b2"
+    assert views.allocations("o1", uow) == [
+        {"sku": "ROUND-TABLE", "qty": 10, "batchref": "b1"},
+        {"sku": "RED-CHAIR", "qty": 5, "batchref": "b2"},
+    ]
+
+    services.deallocate("o1", "ROUND-TABLE", 10, uow)
+    assert store.product("ROUND-TABLE").batches[0].available_quantity == 100
+    assert services.deallocate_order("o1", uow) == 1
+    assert store.product("RED-CHAIR").batches[0].available_quantity == 100
+    assert views.allocations("o1", uow) == []
+
+
+def test_idempotency_keys_survive_a_restart_from_the_log(tmp_path):
+    wal = str(tmp_path / "allocation.wal")
+    store = memory.InMemoryStore(wal)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 10, None, uow)
+    services.allocate("o1", "ROUND-TABLE", 6, uow, idempotency_key="request-1")
+    store.close()
+
+    recovered = memory.InMemoryStore(wal)
+    uow = unit_of_work.InMemoryUnitOfWork(recovered)
+    assert services.allocate("o1", "ROUND-TABLE", 6, uow, "request-1") == "b1"
+    services.deallocate("o1", "ROUND-TABLE", 6, uow)
+    assert recovered.idempotency_key("request-1") is None
+
+
+def test_only_the_most_recent_idempotency_keys_are_kept(tmp_path):
+    wal = str(tmp_path / "allocation.wal")
+    store = memory.InMemoryStore(wal, max_keys=2)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 10, None, uow)
+    for i in range(3):
+        services.allocate(f"o{i}", "ROUND-TABLE", 1, uow, idempotency_key=f"k{i}")
+    store.close()
+
+    recovered = memory.InMemoryStore(wal, max_keys=2)
+
+    for s in (store, recovered):
+        assert s.idempotency_key("k0") is None
+        assert s.idempotency_key("k2") == (
+            model.OrderLine("o2", "ROUND-TABLE", 1),
+            "b1",
+        )
+        assert set(s._keys_by_orderid) == {"o1", "o2"}
+
+
+def test_stock_is_computed_from_the_committed_products(store):
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+    services.allocate("o1", "ROUND-TABLE", 10, uow)
+
+    assert views.stock(["ROUND-TABLE", "MISSING"], uow) == [
+        {
+            "sku": "ROUND-TABLE",
+            "purchased": 100,
+            "allocated": 10,
+            "available": 90,
+            "earliest_eta": None,
+        }
+    ]
+
+
+def test_uncommitted_changes_are_not_visible_and_are_discarded(store):
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+
+    with uow:
+        product = uow.products.get("ROUND-TABLE")
+        product.allocate(model.OrderLine("o1", "ROUND-TABLE", 10))
+        assert store.product("ROUND-TABLE").batches[0].available_quantity == 100
+
+    with uow:
+        assert uow.batches.get("b1").available_quantity == 100
+        assert uow.batches.for_order("o1") == []
+
+
+def test_commit_fails_if_another_unit_of_work_changed_the_sku(store):
+    services.add_batch(
+        "b1", "ROUND-TABLE", 100, None, unit_of_work.InMemoryUnitOfWork(store)
+    )
+    first = unit_of_work.InMemoryUnitOfWork(store)
+    second = unit_of_work.InMemoryUnitOfWork(store)
+
+    with first, second:
+        first.products.get("ROUND-TABLE").allocate(
+            model.OrderLine("o1", "ROUND-TABLE", 10)
+        )
+        second.products.get("ROUND-TABLE").allocate(
+            model.OrderLine("o2", "ROUND-TABLE", 10)
+        )
+        first.commit()
+        with pytest.raises(unit_of_work.ConcurrencyError):
+            second.commit()
+
+    assert store.product("ROUND-TABLE").batches[0].available_quantity == 90
+
+
+def test_state_is_recovered_from_the_write_ahead_log(tmp_path):
+    path = str(tmp_path / "allocation.wal")
+    store = memory.InMemoryStore(path)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+    services.add_batch("b2", "ROUND-TABLE", 100, None, uow)
+    services.allocate("o1", "ROUND-TABLE", 10, uow)
+    services.allocate("o2", "ROUND-TABLE", 20, uow)
+    services.deallocate("o1", "ROUND-TABLE", 10, uow)
+    store.close()
+
+    recovered = memory.InMemoryStore(path)
+    uow = unit_of_work.InMemoryUnitOfWork(recovered)
+
+    product = recovered.product("ROUND-TABLE")
+    assert product.version_number == 3
+    assert [b.available_quantity for b in product.batches] == [80, 100]
+    assert views.allocations("o2", uow) == [
+        {"sku": "ROUND-TABLE", "qty": 20, "batchref": "b1"}
+    ]
+    with uow:
+        assert [b.reference for b in uow.batches.for_order("o2")] == ["b1"]
+        assert uow.batches.for_order("o1") == []
+    assert services.allocate("o3", "ROUND-TABLE", 80, uow) == "b1"
+
+
+def test_torn_last_record_is_ignored_and_truncated(tmp_path):
+    path = tmp_path / "allocation.wal"
+    store = memory.InMemoryStore(str(path))
+    services.add_batch(
+        "b1", "ROUND-TABLE", 100, None, unit_of_work.InMemoryUnitOfWork(store)
+    )
+    store.close()
+    size = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b'[{"op":"product","sku":"HALF')
+
+    recovered = memory.InMemoryStore(str(path))
+
+    assert recovered.skus() == ["ROUND-TABLE"]
+    assert path.stat().st_size == size
+
+
+def test_concurrent_allocations_never_over_allocate(store):
+    services.add_batch(
+        "b1", "CONTENDED-LAMP", 50, None, unit_of_work.InMemoryUnitOfWork(store)
+    )
+    outcomes = []
+
+    def allocate_many_times(thread: int):
+        for i in range(20):
+            try:
+                services.allocate(
+                    f"order-{thread}-{i}",
+                    "CONTENDED-LAMP",
+                    1,
+                    unit_of_work.InMemoryUnitOfWork(store),
+                )
+                outcomes.append("allocated")
+            except model.OutOfStock:
+                outcomes.append("out of stock")
+            except unit_of_work.ConcurrencyError:
+                outcomes.append("conflict")
+
+    threads = [
+        threading.Thread(target=allocate_many_times, args=(t,)) for t in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    batch = store.product("CONTENDED-LAMP").batches[0]
+    assert outcomes.count("allocated") == len(batch._allocated_orders) == 50
+    assert batch.allocated_quantity == 50
@@ -0,0 +1,55 @@
+import pytest
+
+from src.allocation.adapters import metrics
+
+
+def test_histogram_counts_values_into_buckets_and_estimates_quantiles():
+    histogram = metrics.Histogram(buckets=(0.1, 0.2, 0.4))
+    for seconds in (0.05, 0.15, 0.15, 0.3):
+        histogram.observe(seconds)
+
+    assert histogram.counts == [1, 2, 1, 0]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(0.65)
+    assert histogram.quantile(0.5) == pytest.approx(0.15)
+    assert histogram.quantile(0.99) == pytest.approx(0.392)
+
+
+def test_disabled_registry_records_nothing():
+    registry = metrics.Registry(enabled=False)
+
+    with registry.timer("uow.commit"):
+        pass
+
+    assert registry.histogram("uow.commit") is None
+
+
+def test_render_uses_prometheus_text_format():
+    registry = metrics.Registry(enabled=True)
+    registry.observe("uow.commit", 0.003)
+
+    text = registry.render()
+
+    assert "# TYPE allocation_latency_seconds histogram" in text
+    assert 'allocation_latency_seconds_bucket{span="uow.commit",le="0.0025"} 0' in text
+    assert 'allocation_latency_seconds_bucket{span="uow.commit",le="0.005"} 1' in text
+    assert 'allocation_latency_seconds_bucket{span="uow.commit",le="+Inf"} 1' in text
+    assert 'allocation_latency_seconds_count{span="uow.commit"} 1' in text
+    assert (
+        'allocation_latency_seconds_quantile{span="uow.commit",quantile="0.99"}' in text
+    )
+
+
+def test_instrumented_repository_times_method_calls():
+    class Repo:
+        sku = "LAMP"
+
+        def get(self, sku):
+            return sku.lower()
+
+    registry = metrics.Registry(enabled=True)
+    repo = metrics.InstrumentedRepository(Repo(), "products", registry)
+
+    assert repo.get("LAMP") == "lamp"
+    assert repo.sku == "LAMP"
+    assert registry.histogram("repository.products.get").count == 1
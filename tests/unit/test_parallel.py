@@ -0,0 +1,58 @@
+import random
+from datetime import date, timedelta
+
+from src.allocation.domain import model
+from src.allocation.service_layer import parallel
+
+today = date.today()
+
+
+def test_parallel_allocation_matches_allocating_one_by_one():
+    rng = random.Random(3)
+    skus = [f"sku-{i}" for i in range(10)]
+    batches = [
+        model.Batch(
+            f"batch-{i}",
+            rng.choice(skus),
+            rng.randint(0, 100),
+            eta=None
+            if rng.random() < 0.2
+            else today + timedelta(days=rng.randrange(5)),
+        )
+        for i in range(50)
+    ]
+    lines = [
+        model.OrderLine(
+            f"order-{i}", rng.choice(skus + ["unknown-sku"]), rng.randint(1, 10)
+        )
+        for i in range(1000)
+    ]
+    products = {
+        sku: model.Product(
+            sku,
+            [
+                model.Batch(b.reference, b.sku, b._purchased_quantity, b.eta)
+                for b in batches
+                if b.sku == sku
+            ],
+        )
+        for sku in skus + ["unknown-sku"]
+    }
+    expected = []
+    for line in lines:
+        try:
+            expected.append(products[line.sku].allocate(line))
+        except model.OutOfStock:
+            expected.append(None)
+
+    assert parallel.allocate(lines, batches, max_workers=2) == expected
+
+
+def test_split_balances_lines_across_chunks():
+    shards = [
+        (f"sku-{i}", [], [("o", 1)] * size) for i, size in enumerate([8, 5, 4, 3, 2, 2])
+    ]
+
+    chunks = parallel._split(shards, 2)
+
+    assert sorted(sum(len(shard[2]) for shard in chunk) for chunk in chunks) == [11, 13]
@@ -0,0 +1,99 @@
+from datetime import date, timedelta
+import pytest
+
+from src.allocation.domain import model
+from src.allocation.domain.model import Product, OrderLine, Batch, OutOfStock
+
+today = date.today()
+tomorrow = today + timedelta(days=1)
+later = tomorrow + timedelta(days=10)
+
+
+def test_prefers_warehouse_stock_then_earlier_batches():
+    latest = Batch("slow-batch", "MINIMALIST-SPOON", 100, eta=later)
+    medium = Batch("normal-batch", "MINIMALIST-SPOON", 100, eta=tomorrow)
+    in_stock = Batch("in-stock-batch", "MINIMALIST-SPOON", 10, eta=None)
+    product = Product("MINIMALIST-SPOON", [latest, medium, in_stock])
+
+    assert (
+        product.allocate(OrderLine("order1", "MINIMALIST-SPOON", 10))
+        == in_stock.reference
+    )
+    assert (
+        product.allocate(OrderLine("order2", "MINIMALIST-SPOON", 10))
+        == medium.reference
+    )
+
+
+def test_added_batch_takes_its_place_in_the_cached_ordering():
+    product = Product("RETRO-CLOCK", [Batch("later", "RETRO-CLOCK", 100, eta=later)])
+    product.allocate(OrderLine("order1", "RETRO-CLOCK", 10))
+
+    product.add_batch(Batch("tomorrow", "RETRO-CLOCK", 100, eta=tomorrow))
+
+    assert product.allocate(OrderLine("order2", "RETRO-CLOCK", 10)) == "tomorrow"
+
+
+def test_changing_batch_eta_reorders_batches():
+    product = Product(
+        "HIGHBROW-POSTER",
+        [
+            Batch("batch1", "HIGHBROW-POSTER", 100, eta=tomorrow),
+            Batch("batch2", "HIGHBROW-POSTER", 100, eta=later),
+        ],
+    )
+    product.allocate(OrderLine("order1", "HIGHBROW-POSTER", 10))
+
+    product.change_batch_eta("batch2", today)
+
+    assert product.allocate(OrderLine("order2", "HIGHBROW-POSTER", 10)) == "batch2"
+
+
+def test_batches_already_in_allocation_order_are_not_sorted_again(monkeypatch):
+    product = Product(
+        "RETRO-CLOCK",
+        [
+            Batch("in-stock", "RETRO-CLOCK", 100),
+            Batch("tomorrow", "RETRO-CLOCK", 100, eta=tomorrow),
+        ],
+    )
+    product._batches_ordered = True
+
+    def fail(*args, **kwargs):
+        raise AssertionError("sorted again")
+
+    monkeypatch.setattr(model, "sorted", fail, raising=False)
+    assert product.allocate(OrderLine("order1", "RETRO-CLOCK", 10)) == "in-stock"
+
+    product = Product("RETRO-CLOCK", [Batch("later", "RETRO-CLOCK", 100, eta=later)])
+    product._batches_ordered = True
+    product.add_batch(Batch("tomorrow", "RETRO-CLOCK", 100, eta=tomorrow))
+    monkeypatch.undo()
+    assert product.allocate(OrderLine("order1", "RETRO-CLOCK", 10)) == "tomorrow"
+
+
+def test_raises_out_of_stock_exception_if_cannot_allocate():
+    product = Product("SMALL-FORK", [Batch("batch1", "SMALL-FORK", 10, eta=today)])
+    product.allocate(OrderLine("order1", "SMALL-FORK", 10))
+
+    with pytest.raises(OutOfStock, match="SMALL-FORK"):
+        product.allocate(OrderLine("order2", "SMALL-FORK", 1))
+
+
+def test_allocation_and_deallocation_increment_version_number():
+    line = OrderLine("order1", "SCANDI-PEN", 10)
+    product = Product("SCANDI-PEN", [Batch("batch1", "SCANDI-PEN", 10, eta=None)])
+    product.version_number = 7
+
+    product.allocate(line)
+    assert product.version_number == 8
+
+    with pytest.raises(OutOfStock):
+        product.allocate(OrderLine("order2", "SCANDI-PEN", 1))
+    assert product.version_number == 8
+
+    product.deallocate(OrderLine(line.orderid, line.sku, line.qty + 1))
+    assert product.version_number == 8
+
+    assert product.deallocate(line) == product.batches
+    assert product.version_number == 9
@@ -0,0 +1,18 @@
+from src.allocation.adapters import profiling
+
+
+def test_statements_differing_only_in_in_list_size_are_the_same_shape():
+    assert profiling.normalize(
+        "SELECT * FROM t\n WHERE id IN (?, ?, ?)"
+    ) == profiling.normalize("SELECT * FROM t WHERE id IN (?)")
+
+
+def test_repeated_selects_are_reported_as_n_plus_one():
+    profile = profiling.QueryProfile()
+    profile.statements = [("SELECT * FROM lines WHERE batch_id = ?", 0.001)] * 3 + [
+        ("INSERT INTO lines VALUES (?)", 0.001)
+    ] * 5
+
+    assert profile.count == 8
+    assert profile.n_plus_one() == {"SELECT * FROM lines WHERE batch_id = ?": 3}
+    assert profile.n_plus_one(threshold=4) == {}
@@ -11,14 +11,19 @@ from src.allocation.service_layer import services, unit_of_work
 
 class FakeUnitOfWork(unit_of_work.AbstractUnitOfWork):
     def __init__(self):
-        self.batches = FakeRepository([])
+        self.products = FakeProductRepository([])
+        self.batches = FakeRepository(self.products)
+        self.allocations_view = FakeAllocationsViewRepository()
+        self.stock = FakeStockRepository()
+        self.idempotency_keys = FakeIdempotencyKeyRepository()
         self.committed = False
 
     def commit(self):
+        self.idempotency_keys.keys.update(self.idempotency_keys.pending)
         self.committed = True
 
     def rollback(self):
-        ...
+        self.idempotency_keys.pending = {}
 
 
 # class FakeSession:
@@ -35,17 +40,108 @@ class FakeRepository:
     가짜 객체를 만들기 어렵다면 추상화를 너무 복잡하게 설계했기 때문이다.
     """
 
-    def __init__(self, batches: list[model.Batch]):
-        self._batches = set(batches)
+    def __init__(self, products: "FakeProductRepository"):
+        # batch 는 SKU 별 product 에 속하므로, product 저장소를 그대로 조회하는 view 로 구현한다.
+        self._products = products
 
     def add(self, batch: model.Batch):
-        self._batches.add(batch)
+        product = self._products.get(batch.sku)
+        if product is None:
+            product = model.Product(batch.sku, batches=[])
+            self._products.add(product)
+        product.add_batch(batch)
+
+    def add_many(self, batches: list[model.Batch]):
+        for batch in batches:
+            self.add(batch)
 
     def get(self, reference: str) -> model.Batch | None:
-        return next(b for b in self._batches if b.reference == reference)
+        return next(b for b in self.list() if b.reference == reference)
+
+    def for_sku(self, sku: str) -> list[model.Batch]:
+        product = self._products.get(sku)
+        return list(product.batches) if product else []
+
+    def for_order(self, orderid: str, sku: str | None = None) -> list[model.Batch]:
+        return [
+            b
+            for b in self.list()
+            if (sku is None or b.sku == sku) and b.lines_for_order(orderid)
+        ]
+
+    def skus_for_order(self, orderid: str) -> set[str]:
+        return {b.sku for b in self.for_order(orderid)}
+
+    def existing_references(self, references: set[str]) -> set[str]:
+        return {b.reference for b in self.list()} & references
 
     def list(self) -> list[model.Batch]:
-        return list(self._batches)
+        return [b for p in self._products.list() for b in p.batches]
+
+
+class FakeProductRepository:
+    def __init__(self, products: list[model.Product]):
+        self._products = {p.sku: p for p in products}
+
+    def add(self, product: model.Product):
+        self._products[product.sku] = product
+
+    def get(self, sku: str, with_batches: bool = True) -> model.Product | None:
+        return self._products.get(sku)
+
+    def get_many(self, skus: set[str]) -> dict[str, model.Product]:
+        return {sku: self._products[sku] for sku in skus if sku in self._products}
+
+    def list(self) -> list[model.Product]:
+        return list(self._products.values())
+
+
+class FakeAllocationsViewRepository:
+    def __init__(self):
+        self.rows: list[tuple[str, str, int, str]] = []
+
+    def add(self, line: model.OrderLine, batchref: str):
+        self.rows.append((line.orderid, line.sku, line.qty, batchref))
+
+    def add_many(self, allocations: list[tuple[model.OrderLine, str]]):
+        for line, batchref in allocations:
+            self.add(line, batchref)
+
+    def remove(self, line: model.OrderLine):
+        self.rows = [
+            r for r in self.rows if r[:3] != (line.orderid, line.sku, line.qty)
+        ]
+
+
+class FakeStockRepository:
+    def __init__(self):
+        self.refreshed: set[str] = set()
+
+    def refresh(self, skus: set[str]):
+        self.refreshed |= skus
+
+
+class FakeIdempotencyKeyRepository:
+    def __init__(self):
+        self.keys: dict[str, tuple[model.OrderLine, str]] = {}
+        # 커밋할 때 keys 에 반영된다.
+        self.pending: dict[str, tuple[model.OrderLine, str]] = {}
+
+    def get(self, key: str) -> tuple[model.OrderLine, str] | None:
+        return self.get_many({key}).get(key)
+
+    def get_many(self, keys: set[str]) -> dict[str, tuple[model.OrderLine, str]]:
+        return {k: self.keys[k] for k in keys if k in self.keys}
+
+    def add(self, key: str, line: model.OrderLine, batchref: str):
+        self.pending[key] = (line, batchref)
+
+    def remove(self, orderid: str, sku: str | None = None):
+        self.keys = {
+            k: v
+            for k, v in self.keys.items()
+            if not (v[0].orderid == orderid and (sku is None or v[0].sku == sku))
+        }
 
 
 def test_returns_allocation():
@@ -108,6 +204,36 @@ def test_trying_to_deallocate_unallocated_batch():
     assert batch.available_quantity == 100
 
 
+def test_allocate_and_deallocate_keep_the_allocations_view_up_to_date():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "BLUE-PLINTH", 100, None, uow)
+    services.allocate("o1", "BLUE-PLINTH", 10, uow)
+    services.allocate_many([("o2", "BLUE-PLINTH", 5), ("o3", "NOPE", 1)], uow)
+    assert uow.allocations_view.rows == [
+        ("o1", "BLUE-PLINTH", 10, "b1"),
+        ("o2", "BLUE-PLINTH", 5, "b1"),
+    ]
+
+    services.deallocate("o1", "BLUE-PLINTH", 10, uow)
+    assert uow.allocations_view.rows == [("o2", "BLUE-PLINTH", 5, "b1")]
+
+
+def test_deallocate_order_releases_every_line_of_the_order():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "BLUE-PLINTH", 100, None, uow)
+    services.add_batch("b2", "RED-CHAIR", 100, None, uow)
+    services.allocate("o1", "BLUE-PLINTH", 10, uow)
+    services.allocate("o1", "RED-CHAIR", 5, uow)
+    services.allocate("o2", "RED-CHAIR", 7, uow)
+
+    assert services.deallocate_order("o1", uow) == 2
+    assert uow.allocations_view.rows == [("o2", "RED-CHAIR", 7, "b2")]
+    assert uow.batches.get(reference="b1").available_quantity == 100
+    assert uow.batches.get(reference="b2").available_quantity == 93
+    assert uow.committed is True
+    assert services.deallocate_order("o1", uow) == 0
+
+
 today = datetime.today()
 tomorrow = datetime.today() + timedelta(days=1)
 later = datetime.today() + timedelta(days=5)
@@ -153,3 +279,178 @@ def test_allocate_returns_allocation():
     services.add_batch("batch1", "COMPLICATED-LAMP", 100, None, uow)
     result = services.allocate("o1", "COMPLICATED-LAMP", 10, uow)
     assert result == "batch1"
+
+
+def test_allocate_many_returns_result_per_line_and_commits_once():
+    uow = FakeUnitOfWork()
+    services.add_batch("batch1", "BIG-SOFA", 10, None, uow)
+    services.add_batch("batch2", "BIG-SOFA", 10, tomorrow, uow)
+    uow.committed = False
+
+    results = services.allocate_many(
+        [
+            ("o1", "BIG-SOFA", 8),
+            ("o2", "BIG-SOFA", 8),
+            ("o3", "NONEXISTSKU", 1),
+            ("o4", "BIG-SOFA", 8),
+        ],
+        uow,
+    )
+
+    assert results[:2] == ["batch1", "batch2"]
+    assert isinstance(results[2], services.InvalidSku)
+    assert isinstance(results[3], model.OutOfStock)
+    assert uow.committed is True
+
+
+def test_add_batches_adds_every_row_in_chunks():
+    uow = FakeUnitOfWork()
+    rows = ((f"b{i}", "CHEAP-STOOL", 10, None) for i in range(25))
+
+    count = services.add_batches(rows, uow, chunk_size=10)
+
+    assert count == 25
+    assert len(uow.batches.for_sku("CHEAP-STOOL")) == 25
+    assert uow.committed
+
+
+def test_adding_a_batch_with_an_existing_reference_fails():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "CHEAP-STOOL", 10, None, uow)
+    uow.committed = False
+
+    with pytest.raises(services.DuplicateBatch, match="Duplicate batch reference b1"):
+        services.add_batch("b1", "OTHER-STOOL", 10, None, uow)
+    assert not uow.committed
+
+
+def test_add_batches_names_existing_and_repeated_references():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "CHEAP-STOOL", 10, None, uow)
+    rows = [(ref, "CHEAP-STOOL", 10, None) for ref in ("b1", "b2", "b3", "b2")]
+
+    with pytest.raises(services.DuplicateBatch, match="reference b1, b2$"):
+        services.add_batches(rows, uow)
+
+
+def test_allocate_retries_when_commit_conflicts():
+    class ConflictingOnceUnitOfWork(FakeUnitOfWork):
+        conflicts = 0
+
+        def commit(self):
+            if self.conflicts:
+                self.conflicts -= 1
+                raise unit_of_work.ConcurrencyError()
+            super().commit()
+
+    uow = ConflictingOnceUnitOfWork()
+    services.add_batch("b1", "WOBBLY-CHAIR", 100, None, uow)
+    uow.conflicts = 1
+
+    assert services.allocate("o1", "WOBBLY-CHAIR", 10, uow) == "b1"
+    assert uow.committed
+
+
+def test_allocate_gives_up_after_max_attempts():
+    class AlwaysConflictingUnitOfWork(FakeUnitOfWork):
+        def commit(self):
+            raise unit_of_work.ConcurrencyError()
+
+    uow = AlwaysConflictingUnitOfWork()
+    uow.batches.add(model.Batch("b1", "WOBBLY-CHAIR", 100))
+
+    with pytest.raises(unit_of_work.ConcurrencyError):
+        services.allocate("o1", "WOBBLY-CHAIR", 10, uow)
+
+
+def test_replayed_allocation_returns_the_original_batchref_without_loading_batches():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    assert services.allocate("o1", "LAMP", 6, uow) == "b1"
+
+    def fail(*args, **kwargs):
+        raise AssertionError("batches were loaded")
+
+    uow.products.get = fail
+    assert services.allocate("o1", "LAMP", 6, uow) == "b1"
+    assert uow.allocations_view.rows == [("o1", "LAMP", 6, "b1")]
+
+
+def test_explicit_idempotency_key_replaces_orderid_and_sku():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+
+    services.allocate("o1", "LAMP", 1, uow, idempotency_key="request-1")
+    services.allocate("o1", "LAMP", 1, uow, idempotency_key="request-1")
+    services.allocate("o2", "LAMP", 1, uow, idempotency_key="request-2")
+
+    assert uow.batches.get("b1").available_quantity == 8
+
+
+def test_replaying_a_key_with_a_different_line_is_rejected():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    services.allocate("o1", "LAMP", 6, uow)
+    services.allocate("o2", "LAMP", 1, uow, idempotency_key="request-1")
+
+    with pytest.raises(services.IdempotencyConflict, match="o1:LAMP"):
+        services.allocate("o1", "LAMP", 4, uow)
+    with pytest.raises(services.IdempotencyConflict, match="request-1"):
+        services.allocate("o3", "LAMP", 1, uow, idempotency_key="request-1")
+    results = services.allocate_many([("o1", "LAMP", 6), ("o1", "LAMP", 5)], uow)
+
+    assert results[0] == "b1"
+    assert isinstance(results[1], services.IdempotencyConflict)
+    assert uow.batches.get("b1").available_quantity == 3
+
+
+def test_deallocating_forgets_the_idempotency_key():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    services.allocate("o1", "LAMP", 6, uow)
+
+    services.deallocate("o1", "LAMP", 6, uow)
+    with pytest.raises(model.OutOfStock):
+        services.allocate("o1", "LAMP", 11, uow)
+    assert services.allocate("o1", "LAMP", 6, uow) == "b1"
+    assert uow.batches.get("b1").available_quantity == 4
+
+
+def test_deallocating_one_order_keeps_the_keys_of_other_orders_for_the_sku():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    services.allocate("o1", "LAMP", 3, uow)
+    services.allocate("o2", "LAMP", 3, uow)
+
+    services.deallocate("o1", "LAMP", 3, uow)
+
+    assert services.allocate("o2", "LAMP", 3, uow) == "b1"
+    assert uow.batches.get("b1").available_quantity == 7
+    assert uow.allocations_view.rows == [("o2", "LAMP", 3, "b1")]
+
+
+def test_deallocating_with_a_different_qty_keeps_the_allocation_and_its_key():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    services.add_batch("b2", "LAMP", 10, tomorrow, uow)
+    services.allocate("o1", "LAMP", 6, uow)
+
+    services.deallocate("o1", "LAMP", 5, uow)
+
+    assert uow.allocations_view.rows == [("o1", "LAMP", 6, "b1")]
+    assert services.allocate("o1", "LAMP", 6, uow) == "b1"
+    assert uow.batches.get("b1").available_quantity == 4
+    assert uow.batches.get("b2").available_quantity == 10
+
+
+def test_allocate_many_skips_lines_whose_key_was_already_allocated():
+    uow = FakeUnitOfWork()
+    services.add_batch("b1", "LAMP", 10, None, uow)
+    services.allocate("o1", "LAMP", 3, uow)
+
+    results = services.allocate_many(
+        [("o1", "LAMP", 3), ("o2", "LAMP", 3), ("o2", "LAMP", 3)], uow
+    )
+
+    assert results == ["b1", "b1", "b1"]
+    assert uow.batches.get("b1").available_quantity == 4
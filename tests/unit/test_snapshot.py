@@ -0,0 +1,170 @@
+from datetime import date
+
+import pytest
+
+from src.allocation import views
+from src.allocation.adapters import memory, snapshot
+from src.allocation.domain import model
+from src.allocation.service_layer import services, unit_of_work
+
+
+def state(store: memory.InMemoryStore) -> dict:
+    return {
+        sku: (
+            store.product(sku).version_number,
+            [
+                (b.reference, b.eta, b.available_quantity, b._allocated_orders)
+                for b in store.product(sku).batches
+            ],
+        )
+        for sku in sorted(store.skus())
+    }
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "allocation.wal"), str(tmp_path / "allocation.snapshot")
+
+
+def test_snapshot_restores_batches_allocations_and_indexes(paths):
+    wal, snap = paths
+    store = memory.InMemoryStore(wal)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, date(2026, 1, 1), uow)
+    services.add_batch("b2", "ROUND-TABLE", 100, None, uow)
+    services.add_batch("b3", "RED-CHAIR", 50, None, uow)
+    services.allocate("o1", "ROUND-TABLE", 10, uow)
+    services.allocate("o1", "RED-CHAIR", 5, uow)
+    services.allocate("o2", "ROUND-TABLE", 20, uow)
+    store.checkpoint(snap)
+    expected = state(store)
+    store.close()
+
+    restored = memory.InMemoryStore(wal, snapshot_path=snap)
+    uow = unit_of_work.InMemoryUnitOfWork(restored)
+
+    assert state(restored) == expected
+    assert restored.sku_of("b3") == "RED-CHAIR"
+    assert restored.skus_for_order("o1") == {"ROUND-TABLE", "RED-CHAIR"}
+    assert views.allocations("o1", uow) == [
+        {"sku": "ROUND-TABLE", "qty": 10, "batchref": "b2"},
+        {"sku": "RED-CHAIR", "qty": 5, "batchref": "b3"},
+    ]
+    assert services.allocate("o3", "ROUND-TABLE", 70, uow) == "b2"
+
+
+def test_changes_after_the_snapshot_are_replayed_from_the_log(paths):
+    wal, snap = paths
+    store = memory.InMemoryStore(wal)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+    services.allocate("o1", "ROUND-TABLE", 10, uow)
+    store.checkpoint(snap)
+    services.deallocate_order("o1", uow)
+    services.add_batch("b2", "RED-CHAIR", 50, None, uow)
+    services.allocate("o2", "RED-CHAIR", 5, uow)
+    expected = state(store)
+    store.close()
+
+    restored = memory.InMemoryStore(wal, snapshot_path=snap)
+    uow = unit_of_work.InMemoryUnitOfWork(restored)
+
+    assert state(restored) == expected
+    assert restored.skus_for_order("o1") == set()
+    assert views.allocations("o1", uow) == []
+    assert restored.sku_of("b2") == "RED-CHAIR"
+    with uow:
+        assert uow.batches.for_order("o1") == []
+        assert [b.reference for b in uow.batches.for_order("o2")] == ["b2"]
+
+
+def test_a_snapshot_of_a_restored_store_includes_both_sources(paths):
+    wal, snap = paths
+    store = memory.InMemoryStore(wal)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+    services.allocate("o1", "ROUND-TABLE", 10, uow)
+    store.checkpoint(snap)
+    store.close()
+
+    restored = memory.InMemoryStore(wal, snapshot_path=snap)
+    services.allocate(
+        "o2", "ROUND-TABLE", 20, unit_of_work.InMemoryUnitOfWork(restored)
+    )
+    restored.checkpoint(snap)
+    expected = state(restored)
+    restored.close()
+
+    reader = snapshot.SnapshotReader(snap)
+    assert reader.skus() == ["ROUND-TABLE"]
+    assert reader.orderids() == ["o1", "o2"]
+    reader.close()
+    again = memory.InMemoryStore(wal, snapshot_path=snap)
+    assert state(again) == expected
+    assert again.allocations("o1") == [
+        {"sku": "ROUND-TABLE", "qty": 10, "batchref": "b1"}
+    ]
+
+
+def test_idempotency_keys_are_restored_from_the_snapshot(paths):
+    wal, snap = paths
+    store = memory.InMemoryStore(wal, max_keys=3)
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    services.add_batch("b1", "ROUND-TABLE", 100, None, uow)
+    for i in range(3):
+        services.allocate(f"o{i}", "ROUND-TABLE", 10, uow, idempotency_key=f"k{i}")
+    store.checkpoint(snap)
+    store.close()
+
+    restored = memory.InMemoryStore(wal, snapshot_path=snap, max_keys=3)
+    uow = unit_of_work.InMemoryUnitOfWork(restored)
+
+    assert restored.idempotency_key("k1") == (
+        model.OrderLine("o1", "ROUND-TABLE", 10),
+        "b1",
+    )
+    assert services.allocate("o1", "ROUND-TABLE", 10, uow, "k1") == "b1"
+    assert restored.product("ROUND-TABLE").batches[0].available_quantity == 70
+    # 스냅샷의 키도 기록된 순서대로 오래된 것부터 잊는다.
+    services.allocate("o3", "ROUND-TABLE", 10, uow, idempotency_key="k3")
+    assert restored.idempotency_key("k0") is None
+    assert list(restored._keys) == ["k1", "k2", "k3"]
+
+
+def test_products_are_read_from_the_snapshot_only_when_used(paths):
+    _, snap = paths
+    store = memory.InMemoryStore()
+    uow = unit_of_work.InMemoryUnitOfWork(store)
+    for i in range(10):
+        services.add_batch(f"b{i}", f"SKU-{i}", 10, None, uow)
+    store.checkpoint(snap)
+
+    restored = memory.InMemoryStore(snapshot_path=snap)
+
+    assert restored._products == {}
+    assert restored.product("SKU-3").batches[0].reference == "b3"
+    assert list(restored._products) == ["SKU-3"]
+    assert restored.product("SKU-3") is restored.product("SKU-3")
+    assert restored.product("MISSING") is None
+
+
+def test_rejects_a_file_that_is_not_a_snapshot(paths):
+    wal, _ = paths
+    with open(wal, "wb") as f:
+        f.write(b"\0" * snapshot.HEADER.size)
+
+    with pytest.raises(ValueError):
+        snapshot.SnapshotReader(wal)
+
+
+def test_rejects_a_log_older_than_the_snapshot(paths, tmp_path):
+    wal, snap = paths
+    store = memory.InMemoryStore(wal)
+    services.add_batch(
+        "b1", "ROUND-TABLE", 100, None, unit_of_work.InMemoryUnitOfWork(store)
+    )
+    store.checkpoint(snap)
+    store.close()
+
+    with pytest.raises(ValueError):
+        memory.InMemoryStore(str(tmp_path / "other.wal"), snapshot_path=snap)
@@ -0,0 +1,108 @@
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+import pytest
+
+from src.allocation.domain import model, vectorized
+
+today = date.today()
+
+
+def allocate_one_by_one(lines, batches):
+    by_sku = defaultdict(list)
+    for batch in batches:
+        by_sku[batch.sku].append(batch)
+    refs = []
+    for line in lines:
+        try:
+            refs.append(model.allocate(line, by_sku[line.sku]))
+        except model.OutOfStock:
+            refs.append(None)
+    return refs
+
+
+def copy(batches):
+    return [
+        model.Batch(b.reference, b.sku, b._purchased_quantity, b.eta) for b in batches
+    ]
+
+
+def random_case(seed, n_lines, n_batches, n_skus, max_qty, batch_qty):
+    rng = random.Random(seed)
+    skus = [f"sku-{i}" for i in range(n_skus)]
+    batches = [
+        model.Batch(
+            f"batch-{i}",
+            rng.choice(skus),
+            rng.randint(0, batch_qty),
+            eta=None
+            if rng.random() < 0.2
+            else today + timedelta(days=rng.randrange(5)),
+        )
+        for i in range(n_batches)
+    ]
+    lines = [
+        model.OrderLine(
+            f"order-{i}", rng.choice(skus + ["unknown-sku"]), rng.randint(1, max_qty)
+        )
+        for i in range(n_lines)
+    ]
+    return lines, batches
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_domain_model_on_random_backlogs(seed):
+    lines, batches = random_case(seed, 500, 40, 5, max_qty=20, batch_qty=200)
+
+    expected = allocate_one_by_one(lines, copy(batches))
+
+    assert vectorized.allocate(lines, batches) == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_domain_model_when_runs_exceed_the_window(seed):
+    lines, batches = random_case(
+        seed, 3 * vectorized.WINDOW, 6, 1, max_qty=3, batch_qty=2000
+    )
+
+    expected = allocate_one_by_one(lines, copy(batches))
+
+    assert vectorized.allocate(lines, batches) == expected
+
+
+def test_smaller_lines_fill_earlier_batches_after_a_larger_line_skips_them():
+    batches = [
+        model.Batch("in-stock", "LAMP", 5),
+        model.Batch("shipment", "LAMP", 100, eta=today),
+    ]
+    lines = [
+        model.OrderLine("o1", "LAMP", 4),
+        model.OrderLine("o2", "LAMP", 3),
+        model.OrderLine("o3", "LAMP", 1),
+        model.OrderLine("o4", "LAMP", 200),
+    ]
+
+    assert vectorized.allocate(lines, batches) == [
+        "in-stock",
+        "shipment",
+        "in-stock",
+        None,
+    ]
+
+
+def test_batches_with_the_same_eta_keep_their_input_order():
+    batches = [
+        model.Batch("first", "CHAIR", 10, eta=today),
+        model.Batch("second", "CHAIR", 10, eta=today),
+    ]
+    lines = [model.OrderLine(f"o{i}", "CHAIR", 4) for i in range(4)]
+
+    assert vectorized.allocate(lines, batches) == ["first", "first", "second", "second"]
+
+
+def test_does_not_change_the_batches():
+    batch = model.Batch("batch1", "TABLE", 10)
+
+    vectorized.allocate([model.OrderLine("o1", "TABLE", 5)], [batch])
+
+    assert batch.available_quantity == 10